@@ -0,0 +1,270 @@
+"""
+Deterministic replay of a trading day through Strategy
+
+	Ticks, recorded by TickRecorder or generated, are fed into the TWS
+	simulator on a virtual clock as fast as the strategy reacts. Orders fill
+	in the simulator's matching engine (LMT, MKT, TRAIL, brackets and combos)
+	and option quotes age with the virtual clock. Parameter sets run in a
+	process pool, each one reports P&L and latencies.
+
+	python backtest.py --atm-sl 0.1 0.15 0.2 --hedge-offset 10 20 --workers 4
+	python backtest.py --journal ticks --day 20241119 --contracts contracts.json
+"""
+
+# Importing built-in libraries
+import argparse
+import asyncio
+import contextlib
+import datetime as dt
+import io
+import itertools
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+import pytz					# pip install pytz
+from ib_insync import *		# pip install ib_insync
+
+# Importing project modules
+import credentials
+from ib_wrapper import IBTWSAPI
+from main import Strategy
+from tick_journal import TICK_DTYPE, read_day
+from tws_simulator import SimulatedIB, SimulatedMarket
+
+# conId of underlying rows in synthetic tick arrays
+UNDERLYING = 0
+
+
+class VirtualClock:
+
+	def __init__(self, now:dt.datetime):
+		self.now = now
+
+	def __call__(self) -> dt.datetime:
+		return self.now
+
+	def set(self, timestamp:float) -> None:
+		self.now = dt.datetime.fromtimestamp(timestamp, pytz.utc)
+
+
+def synthetic_ticks(day:str, start:float=5860.0, vol:float=0.15, step:float=1.0, seed:int=0) -> np.ndarray:
+	"""
+	Returns a GBM path of the underlying over the regular session, one tick every step seconds\n
+	"""
+	zone = pytz.timezone("America/New_York")
+	open_ = zone.localize(dt.datetime(int(day[:4]), int(day[4:6]), int(day[6:8]), 9, 30)).timestamp()
+	n = int(6.5 * 3600 / step)
+	rng = np.random.default_rng(seed)
+	sigma = vol * math.sqrt(step / (252 * 6.5 * 3600))
+	path = start * np.exp(np.cumsum(sigma * rng.standard_normal(n) - 0.5 * sigma * sigma))
+
+	ticks = np.zeros(n, dtype=TICK_DTYPE)
+	ticks["time"] = open_ + step * np.arange(n)
+	ticks["conId"] = UNDERLYING
+	ticks["bid"] = ticks["ask"] = ticks["last"] = np.round(path, 2)
+	return ticks
+
+
+def contracts_from_cache(path:str) -> list:
+	"""
+	Returns every contract of a ContractCache file, expired or not\n
+	"""
+	with open(path) as f:
+		return [Contract.create(**row["contract"]) for row in json.load(f)]
+
+
+class Replay:
+
+	def __init__(self, ticks:np.ndarray, symbol:str="SPX", expiry:str=None, contracts:list=(), vol:float=0.15, rate:float=0.0, drain:int=4):
+
+		self.ticks = ticks
+		self.symbol = symbol
+		self.expiry = expiry or credentials.date
+		self.contracts = {c.conId: c for c in contracts}
+		self.vol = vol
+		self.rate = rate
+		self.drain = drain
+
+	def _underlying_ids(self) -> set:
+		return {UNDERLYING} | {
+			conId for conId, c in self.contracts.items()
+			if c.symbol == self.symbol and c.secType in ("IND", "STK")
+		}
+
+	async def run(self, **params) -> dict:
+		"""
+		Replays the ticks through one Strategy built with params\n
+		"""
+		ticks = self.ticks
+		underlying = self._underlying_ids()
+		is_underlying = np.isin(ticks["conId"], list(underlying))
+		if not is_underlying.any():
+			raise ValueError(f"No {self.symbol} ticks to replay")
+
+		clock = VirtualClock(dt.datetime.fromtimestamp(ticks["time"][0], pytz.utc))
+		start = float(ticks["last"][is_underlying][0])
+		market = SimulatedMarket({self.symbol: start}, [self.expiry], vol=self.vol, rate=self.rate, clock=clock)
+		sim = SimulatedIB(market)
+		# Rate and duplicate limits run on wall time, which a replay compresses
+		creds = {
+			"host": "replay", "port": 0, "client_id": 1, "max_msg_rate": 1e9, "reconnect": False, "pnl": False,
+			"max_orders_per_sec": None, "duplicate_window": None,
+		}
+		api = IBTWSAPI(creds, ib_factory=lambda: sim)
+		await api.connect()
+
+		# Recorded option quotes go to the simulator's own contract of the same description
+		options = {
+			conId: sim.qualifyContracts(Option(c.symbol, c.lastTradeDateOrContractMonth, c.strike, c.right, "SMART"))
+			for conId, c in self.contracts.items() if c.secType == "OPT"
+		}
+		options = {conId: q[0] for conId, q in options.items() if q}
+
+		strategy = Strategy(broker=api, symbol=self.symbol, expiry=self.expiry, **params)
+		task = asyncio.ensure_future(strategy.run())
+		fed, t0 = 0, time.perf_counter()
+
+		for stamp, conId, bid, ask, last, flag in zip(
+				ticks["time"].tolist(), ticks["conId"].tolist(), ticks["bid"].tolist(),
+				ticks["ask"].tolist(), ticks["last"].tolist(), is_underlying.tolist()):
+			if task.done():
+				break
+			clock.set(stamp)
+			if flag:
+				sim.set_price(self.symbol, last)
+			elif conId in options:
+				sim.set_quote(options[conId], bid, ask, last)
+			else:
+				continue
+			fed += 1
+			for _ in range(self.drain):
+				await asyncio.sleep(0)
+
+		wall = time.perf_counter() - t0
+		error = None
+		if not task.done():
+			task.cancel()
+		try:
+			await task
+		except asyncio.CancelledError:
+			pass
+		except Exception as e:
+			error = repr(e)
+
+		result = {
+			"params": params,
+			"finished": error is None and not task.cancelled(),
+			"error": error,
+			"ticks": fed,
+			"virtual_s": fed and clock.now.timestamp() - ticks["time"][0],
+			"wall_s": wall,
+			**self.pnl(sim),
+		}
+		result["speedup"] = result["virtual_s"] / wall if wall else math.inf
+		if strategy.trail_manager is not None:
+			result["trail"] = strategy.trail_manager.stats()
+		result["hub"] = api.hub.stats().get(strategy.name, {})
+		result["risk"] = api.risk.stats()
+		api.disconnect()
+		# Let stopped trailing stops unwind before the loop closes
+		await asyncio.sleep(0)
+		return result
+
+	@staticmethod
+	def pnl(sim:SimulatedIB) -> dict:
+		"""
+		Returns realized cash flow, commissions and open positions marked at mid\n
+		"""
+		cash = commissions = 0.0
+		fills = sim.fills()
+		for fill in fills:
+			sign = 1 if fill.execution.side == "BOT" else -1
+			cash -= sign * fill.execution.shares * fill.execution.price * float(fill.contract.multiplier or 1)
+			commissions += fill.commissionReport.commission
+
+		positions = sim.positions()
+		marks = sim.market.quotes([p.contract for p in positions]) if positions else np.empty((0, 3))
+		open_value = sum(
+			p.position * (bid + ask) / 2 * float(p.contract.multiplier or 1)
+			for p, (bid, ask, last) in zip(positions, marks)
+		)
+		return {
+			"fills": len(fills),
+			"cash": cash,
+			"commissions": commissions,
+			"open_value": float(open_value),
+			"pnl": cash + float(open_value) - commissions,
+		}
+
+
+def _run_job(job:tuple) -> dict:
+	source, params = job
+	if "journal" in source:
+		ticks = read_day(source["journal"], source["day"])
+		contracts = contracts_from_cache(source["contracts"]) if source.get("contracts") else ()
+	else:
+		ticks = synthetic_ticks(**source["synthetic"])
+		contracts = ()
+	replay = Replay(ticks, symbol=source.get("symbol", "SPX"), expiry=source.get("expiry"), contracts=contracts, vol=source.get("vol", 0.15))
+
+	# Strategy prints every order, keep worker output to the summary
+	with contextlib.redirect_stdout(io.StringIO()):
+		return asyncio.run(replay.run(**params))
+
+
+def run_grid(source:dict, grid:list, workers:int=None) -> list:
+	"""
+	Runs every parameter set of grid against source in a process pool\n
+	"""
+	jobs = [(source, params) for params in grid]
+	if workers == 1:
+		return [_run_job(job) for job in jobs]
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		return list(pool.map(_run_job, jobs))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--symbol", default=credentials.instrument)
+	parser.add_argument("--expiry", default=credentials.date)
+	parser.add_argument("--journal", help="tick journal directory, synthetic ticks when omitted")
+	parser.add_argument("--day", help="journal day (YYYYMMDD), the expiry by default")
+	parser.add_argument("--contracts", help="ContractCache JSON mapping journal conIds to contracts")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--start", type=float, default=5860.0)
+	parser.add_argument("--vol", type=float, default=0.15)
+	parser.add_argument("--step", type=float, default=1.0, help="seconds between synthetic ticks")
+	parser.add_argument("--atm-sl", type=float, nargs="+", default=[0.15])
+	parser.add_argument("--percent", type=float, nargs="+", default=[0.15], help="trail percent the stop manager tightens from")
+	parser.add_argument("--hedge-offset", type=float, nargs="+", default=[10])
+	parser.add_argument("--hedge", action="store_true", help="buy the OTM strangle before the ATM entry")
+	parser.add_argument("--workers", type=int, default=os.cpu_count())
+	parser.add_argument("--output", help="write results JSON here")
+	args = parser.parse_args()
+
+	source = {"symbol": args.symbol, "expiry": args.expiry, "vol": args.vol}
+	if args.journal:
+		source.update(journal=args.journal, day=args.day or args.expiry, contracts=args.contracts)
+	else:
+		source["synthetic"] = {"day": args.expiry, "start": args.start, "vol": args.vol, "step": args.step, "seed": args.seed}
+
+	grid = [
+		{"atm_sl": sl, "percent": pct, "hedge_offset": off, "hedge": args.hedge}
+		for sl, pct, off in itertools.product(args.atm_sl, args.percent, args.hedge_offset)
+	]
+	t0 = time.perf_counter()
+	results = run_grid(source, grid, args.workers)
+	text = json.dumps({"wall_s": time.perf_counter() - t0, "runs": results}, indent=2, default=float)
+	if args.output:
+		with open(args.output, "w") as f:
+			f.write(text)
+	print(text)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,243 @@
+"""
+Live OHLCV bars built from ticks or 5 second real time bars
+
+	Every watched contract keeps a fixed size ring of closed bars per
+	timeframe plus the bar in progress. Rings are seeded from the historical
+	bar cache so indicators start warm, and barClosedEvent fires
+	(contract, seconds, ring) as each bar closes.
+
+	builder = await api.stream_bars(contract, ("5s", "1m", "5m"))
+	builder.barClosedEvent += on_bar
+	closes = builder.ring(contract, 60).columns()["close"]
+"""
+
+# Importing built-in libraries
+import asyncio
+import math
+import time
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+from eventkit import Event	# installed with ib_insync
+
+FIELDS = ("time", "open", "high", "low", "close", "volume")
+
+_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+
+def timeframe_seconds(timeframe) -> int:
+	"""
+	Returns seconds of a timeframe given as "5s", "1m", "1h" or seconds\n
+	"""
+	if isinstance(timeframe, str):
+		return int(timeframe[:-1]) * _UNITS[timeframe[-1]]
+	return int(timeframe)
+
+
+def bar_size(seconds:int) -> str:
+	"""
+	Returns the IB bar size setting of a timeframe in seconds\n
+	"""
+	for unit, name in ((3600, "hour"), (60, "min"), (1, "sec")):
+		if seconds % unit == 0:
+			n = seconds // unit
+			return f"{n} {name}" if (n == 1 and unit > 1) else f"{n} {name}s"
+
+
+class BarRing:
+	"""
+	Fixed capacity ring of closed bars and the bar in progress\n
+	"""
+
+	def __init__(self, seconds:int, capacity:int=1024):
+
+		self.seconds = seconds
+		self.capacity = capacity
+		self.count = 0			# bars closed since creation
+		self.current = None		# [time, open, high, low, close, volume]
+		self.closed = -math.inf	# start of the last closed bar
+		self.lag = 0			# length of the bars feeding the ring, the last one arrives after the boundary
+		self._columns = {name: np.zeros(capacity) for name in FIELDS}
+
+	def __len__(self) -> int:
+		return min(self.count, self.capacity)
+
+	def append(self, bar) -> None:
+		i = self.count % self.capacity
+		for name, value in zip(FIELDS, bar):
+			self._columns[name][i] = value
+		self.count += 1
+		self.closed = bar[0]
+
+	def update(self, stamp:float, open_:float, high:float, low:float, close:float, volume:float, span:int=0):
+		"""
+		Folds a tick or a smaller bar of span seconds into the bar in progress\n
+		Returns the bar it closed, if any, a bar ending on the boundary closes it at once\n
+		"""
+		self.lag = span
+		start = stamp - stamp % self.seconds
+		if start <= self.closed:
+			# Late updates of closed bars are dropped, close_due may have closed it without a later tick
+			return None
+		bar = self.current
+		if bar is None or start > bar[0]:
+			self.current = [start, open_, high, low, close, volume]
+			if bar is not None:
+				self.append(bar)
+				return bar
+		elif start == bar[0]:
+			bar[2] = max(bar[2], high)
+			bar[3] = min(bar[3], low)
+			bar[4] = close
+			bar[5] += volume
+		if span and stamp + span >= start + self.seconds:
+			return self.close_due(math.inf)
+		return None
+
+	def close_due(self, now:float):
+		"""
+		Closes the bar in progress once its interval, and the lag of its feed, has passed, returns it\n
+		"""
+		bar = self.current
+		if bar is not None and bar[0] + self.seconds + self.lag <= now:
+			self.current = None
+			self.append(bar)
+			return bar
+		return None
+
+	def columns(self, n:int=None) -> dict:
+		"""
+		Returns the last n closed bars, oldest first, as NumPy columns\n
+		"""
+		n = len(self) if n is None else min(n, len(self))
+		index = np.arange(self.count - n, self.count) % self.capacity
+		return {name: column[index] for name, column in self._columns.items()}
+
+	def last(self):
+		if not self.count:
+			return None
+		i = (self.count - 1) % self.capacity
+		return tuple(float(self._columns[name][i]) for name in FIELDS)
+
+
+class BarBuilder:
+
+	def __init__(self, timeframes=("5s", "1m", "5m"), capacity:int=1024, clock=time.time):
+
+		self.timeframes = sorted({timeframe_seconds(tf) for tf in timeframes})
+		self.capacity = capacity
+		self.clock = clock
+		self.rings = {}			# conId -> {seconds: BarRing}
+		self.contracts = {}		# conId -> contract
+		self.volumes = {}		# conId -> last cumulative volume
+		self.tickers = {}		# conId -> Ticker feeding the rings
+		self.barClosedEvent = Event("barClosedEvent")
+		self._timer = None
+
+	def watch(self, contract, timeframes=None) -> dict:
+		"""
+		Adds a contract's rings, returns them by seconds\n
+		"""
+		rings = self.rings.setdefault(contract.conId, {})
+		for seconds in (self.timeframes if timeframes is None else map(timeframe_seconds, timeframes)):
+			if seconds not in rings:
+				rings[seconds] = BarRing(seconds, self.capacity)
+		self.contracts[contract.conId] = contract
+		return rings
+
+	def unwatch(self, contract):
+		"""
+		Drops a contract's rings, returns the ticker that fed them, if any\n
+		"""
+		self.rings.pop(contract.conId, None)
+		self.contracts.pop(contract.conId, None)
+		self.volumes.pop(contract.conId, None)
+		ticker = self.tickers.pop(contract.conId, None)
+		if ticker is not None:
+			ticker.updateEvent -= self.on_ticker
+		return ticker
+
+	def attach(self, ticker) -> None:
+		self.tickers[ticker.contract.conId] = ticker
+		ticker.updateEvent += self.on_ticker
+
+	def on_moved(self, contract, ticker) -> None:
+		old = self.tickers.get(contract.conId)
+		if old is not None:
+			old.updateEvent -= self.on_ticker
+			self.attach(ticker)
+
+	def ring(self, contract, timeframe) -> BarRing:
+		return self.rings[contract.conId][timeframe_seconds(timeframe)]
+
+	def seed(self, contract, timeframe, bars:dict, now:float=None) -> None:
+		"""
+		Loads historical columns (BarCache.get) into a ring, the last one stays open if unfinished\n
+		"""
+		ring = self.watch(contract, (timeframe,))[timeframe_seconds(timeframe)]
+		now = self.clock() if now is None else now
+		rows = zip(*(bars[name].tolist() for name in FIELDS))
+		for bar in list(rows)[-(ring.capacity + 1):]:
+			if ring.current is not None and bar[0] <= ring.current[0]:
+				continue
+			ring.update(*bar)
+		ring.close_due(now)
+
+	# Feeding
+
+	def _emit(self, conId:int, ring:BarRing, bar) -> None:
+		if bar is not None:
+			self.barClosedEvent.emit(self.contracts[conId], ring.seconds, ring)
+
+	def update(self, conId:int, stamp:float, open_:float, high:float, low:float, close:float, volume:float=0.0, smallest:int=0) -> None:
+		for ring in self.rings.get(conId, {}).values():
+			if ring.seconds >= smallest and ring.seconds % max(smallest, 1) == 0:
+				self._emit(conId, ring, ring.update(stamp, open_, high, low, close, volume, smallest))
+
+	def on_ticker(self, ticker) -> None:
+		"""
+		Handler for Ticker.updateEvent\n
+		"""
+		conId = ticker.contract.conId
+		if conId not in self.rings:
+			return
+		price = ticker.marketPrice()
+		if math.isnan(price):
+			return
+		# Volume is the day's running total, bars get its increments
+		volume, known = ticker.volume, self.volumes.get(conId)
+		self.volumes[conId] = volume
+		traded = volume - known if known is not None and volume > known else 0.0
+		stamp = ticker.time.timestamp() if ticker.time else self.clock()
+		self.update(conId, stamp, price, price, price, price, traded)
+
+	def on_realtime_bars(self, bars, hasNewBar:bool) -> None:
+		"""
+		Handler for RealTimeBarList.updateEvent, feeds 5 second bars into rings of 5s multiples\n
+		"""
+		if hasNewBar:
+			bar = bars[-1]
+			self.update(bars.contract.conId, bar.time.timestamp(), bar.open_, bar.high, bar.low, bar.close, max(bar.volume, 0.0), smallest=bars.barSize)
+
+	def close_due(self, now:float=None) -> None:
+		"""
+		Closes every bar whose interval has passed, even without a later tick\n
+		"""
+		now = self.clock() if now is None else now
+		for conId, rings in self.rings.items():
+			for ring in rings.values():
+				self._emit(conId, ring, ring.close_due(now))
+
+	async def run(self, interval:float=0.25) -> None:
+		while True:
+			self.close_due()
+			await asyncio.sleep(interval)
+
+	def start(self, interval:float=0.25) -> None:
+		if self._timer is None or self._timer.done():
+			self._timer = asyncio.ensure_future(self.run(interval))
+
+	def stop(self) -> None:
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
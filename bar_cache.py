@@ -0,0 +1,235 @@
+"""
+Incremental historical bar store
+
+	Bars are kept per (conId, barSize, whatToShow, useRTH) as NumPy columns,
+	persisted one .npz file per key. A request fetches only the bars after the
+	last cached one (and the last one again, it may have been partial) and
+	overlapping requests are answered from the store. Whatever still has to go
+	to TWS waits in the pacer's historical queue.
+
+	bars = BarCache(api.md, "bars", api.pacer)
+	columns = await bars.get(contract, "1 min", "2 D")
+"""
+
+# Importing built-in libraries
+import asyncio
+import datetime as dt
+import math
+import os
+import time
+from collections import defaultdict
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+import pandas as pd			# pip install pandas
+
+COLUMNS = ("time", "open", "high", "low", "close", "volume", "average", "barCount")
+
+_BAR_UNITS = {"sec": 1, "min": 60, "hour": 3600, "day": 86400, "week": 7 * 86400, "month": 30 * 86400}
+_DURATION_UNITS = {"S": 1, "D": 86400, "W": 7 * 86400, "M": 30 * 86400, "Y": 365 * 86400}
+
+
+def bar_seconds(barSize:str) -> int:
+	"""
+	Returns the length of an IB bar size ("1 min", "5 secs", "1 day") in seconds\n
+	"""
+	n, unit = barSize.split()
+	return int(n) * _BAR_UNITS[unit.rstrip("s")]
+
+
+def duration_seconds(durationStr:str) -> int:
+	"""
+	Returns the calendar span of an IB duration ("3600 S", "2 D", "1 Y") in seconds\n
+	"""
+	n, unit = durationStr.split()
+	return int(n) * _DURATION_UNITS[unit.upper()]
+
+
+def tail_duration(seconds:float, barSize:str) -> str:
+	"""
+	Returns the shortest IB duration string covering seconds\n
+	"""
+	if seconds <= 86400 and bar_seconds(barSize) < 86400:
+		return f"{max(int(math.ceil(seconds)), 30)} S"
+	days = int(math.ceil(seconds / 86400))
+	return f"{days} D" if days <= 365 else f"{int(math.ceil(days / 365))} Y"
+
+
+def _timestamp(date) -> float:
+	if isinstance(date, dt.datetime):
+		return date.timestamp() if date.tzinfo else date.replace(tzinfo=dt.timezone.utc).timestamp()
+	# daily and longer bars carry a date
+	return dt.datetime(date.year, date.month, date.day, tzinfo=dt.timezone.utc).timestamp()
+
+
+def to_columns(bars) -> dict:
+	"""
+	Converts a list of ib_insync BarData into NumPy columns\n
+	"""
+	n = len(bars)
+	out = {"time": np.fromiter((_timestamp(b.date) for b in bars), dtype=np.float64, count=n)}
+	for name in COLUMNS[1:]:
+		out[name] = np.fromiter((getattr(b, name) for b in bars), dtype=np.float64, count=n)
+	return out
+
+
+def merge(old:dict, new:dict) -> dict:
+	"""
+	Appends new bars, which replace every cached bar from their first one on\n
+	"""
+	if not len(new["time"]):
+		return old
+	keep = old["time"] < new["time"][0]
+	return {name: np.concatenate((old[name][keep], new[name])) for name in COLUMNS}
+
+
+class BarCache:
+
+	def __init__(self, client, directory:str=None, pacer=None, max_age:float=None, timeout:float=None):
+
+		self.client = client
+		self.directory = directory
+		self.pacer = pacer
+		self.max_age = max_age
+		self.timeout = timeout	# seconds per TWS request, not counting the pacer queue
+		self.series = {}		# key -> columns
+		self.fetched = {}		# key -> time of the last tail fetch
+		self.start = {}			# key -> time from which the columns are complete, -inf when TWS has nothing older
+		self.hits = 0
+		self.requests = 0
+		self._locks = defaultdict(asyncio.Lock)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+
+	# Storage
+
+	def _path(self, key:tuple) -> str:
+		conId, barSize, whatToShow, useRTH = key
+		return os.path.join(self.directory, f"{conId}-{barSize.replace(' ', '')}-{whatToShow}-{int(useRTH)}.npz")
+
+	def _load(self, key:tuple):
+		if key not in self.series and self.directory and os.path.exists(self._path(key)):
+			with np.load(self._path(key)) as f:
+				self.series[key] = {name: f[name] for name in COLUMNS}
+				self.fetched[key] = float(f["fetched"])
+				self.start[key] = float(f["start"])
+		return self.series.get(key)
+
+	def _save(self, key:tuple) -> None:
+		if not self.directory:
+			return
+		path = self._path(key)
+		# Written aside and renamed so a crash never leaves a torn file
+		with open(path + ".tmp", "wb") as f:
+			np.savez(f, fetched=self.fetched[key], start=self.start[key], **self.series[key])
+		os.replace(path + ".tmp", path)
+
+	# Fetching
+
+	async def _fetch(self, contract, key:tuple, durationStr:str) -> dict:
+		conId, barSize, whatToShow, useRTH = key
+		request = (key, durationStr)
+		source = (conId, contract.exchange, whatToShow)
+		if self.pacer is not None:
+			async with self.pacer.historical.request(request, source):
+				await self.pacer.send()
+				bars = await self._request(contract, key, durationStr)
+		else:
+			bars = await self._request(contract, key, durationStr)
+		return to_columns(bars)
+
+	async def _request(self, contract, key:tuple, durationStr:str) -> list:
+		conId, barSize, whatToShow, useRTH = key
+		self.requests += 1
+		t0 = time.monotonic()
+		bars = await self.client.reqHistoricalDataAsync(
+			contract, '', durationStr=durationStr, barSizeSetting=barSize,
+			whatToShow=whatToShow, useRTH=useRTH, formatDate=2, timeout=self.timeout or 0,
+		)
+		if not bars and self.timeout and time.monotonic() - t0 >= self.timeout:
+			# ib_insync cancels a timed out request and returns no bars, which must not be cached as none
+			raise asyncio.TimeoutError(f"Historical data request for {contract.localSymbol or contract.symbol} timed out")
+		return bars
+
+	async def get(self, contract, barSize:str, durationStr:str, whatToShow:str="MIDPOINT", useRTH:bool=True, max_age:float=None, tz:str=None) -> dict:
+		"""
+		Returns the bars of durationStr up to now as NumPy columns, time in epoch seconds\n
+		The tail is refetched when older than max_age, one bar interval by default\n
+		tz is the exchange's timezone, "N D" counts its session dates (UTC dates when None)\n
+		"""
+		key = (contract.conId, barSize, whatToShow, bool(useRTH))
+		max_age = self.max_age if max_age is None else max_age
+		async with self._locks[key]:
+			now = time.time()
+			size = bar_seconds(barSize)
+			wanted = now - duration_seconds(durationStr)
+			n, unit = durationStr.split()
+			sessions = int(n) if unit.upper() == "D" else None
+			tz = tz if size < 86400 else None
+			series = self._load(key)
+			requests = self.requests
+
+			if series is not None and now - self.fetched[key] >= (size if max_age is None else max_age):
+				last = series["time"][-1] if len(series["time"]) else self.fetched[key]
+				tail = await self._fetch(contract, key, tail_duration(now - last + size, barSize))
+				series = self.series[key] = merge(series, tail)
+				self.fetched[key] = now
+
+			if not self._covers(series, self.start.get(key), wanted, sessions, tz):
+				full = await self._fetch(contract, key, durationStr)
+				series = self.series[key] = full if series is None else merge(series, full)
+				self.fetched[key] = now
+				first = full["time"][0] if len(full["time"]) else now
+				if sessions is None:
+					self.start[key] = min(wanted, first, self.start.get(key, now))
+				elif len(np.unique(self._days(full["time"], tz))) < sessions:
+					# Fewer sessions than asked for, TWS has no older bars
+					self.start[key] = -math.inf
+				else:
+					self.start[key] = min(first, self.start.get(key, now))
+
+			if self.requests == requests:
+				self.hits += 1
+			else:
+				self._save(key)
+		return self._slice(series, durationStr, wanted, tz)
+
+	@classmethod
+	def _covers(cls, series:dict, start:float, wanted:float, sessions:int=None, tz:str=None) -> bool:
+		# Calendar durations are covered from wanted on, "N D" by N complete sessions
+		if series is None:
+			return False
+		if sessions is None or start == -math.inf:
+			return wanted >= start
+		times = series["time"]
+		return len(np.unique(cls._days(times[times >= start], tz))) >= sessions
+
+	@staticmethod
+	def _days(times, tz:str=None):
+		# Session date of each bar as days since the epoch, in the exchange's timezone
+		# (daily bars are stamped at UTC midnight of their session date already)
+		if tz is None:
+			return times // 86400
+		local = pd.to_datetime(times, unit="s", utc=True).tz_convert(tz).tz_localize(None)
+		return local.values.astype("datetime64[D]").astype(np.int64)
+
+	@classmethod
+	def _slice(cls, series:dict, durationStr:str, wanted:float, tz:str=None) -> dict:
+		times = series["time"]
+		n, unit = durationStr.split()
+		if unit.upper() == "D":
+			# Like TWS, N D means the last N sessions that have bars
+			days = cls._days(times, tz)
+			unique = np.unique(days)
+			i = int(np.searchsorted(days, unique[-int(n)], side="left")) if len(unique) >= int(n) else 0
+		else:
+			i = int(np.searchsorted(times, wanted, side="left"))
+		return {name: column[i:] for name, column in series.items()}
+
+	def stats(self) -> dict:
+		return {
+			"series": len(self.series),
+			"bars": sum(len(s["time"]) for s in self.series.values()),
+			"hits": self.hits,
+			"requests": self.requests,
+		}
@@ -0,0 +1,74 @@
+"""
+Historical bar cache benchmark
+
+	Compares the old get_candle_data path (a full reqHistoricalData rebuilt
+	into a DataFrame from dicts) with the bar cache, against the simulator
+	with a fixed historical request latency.
+
+	python benchmarks/bench_bars.py --queries 20 --latency 0.25
+"""
+
+# Importing built-in libraries
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Importing third-party libraries
+import pandas as pd			# pip install pandas
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ib_wrapper import IBTWSAPI
+from tws_simulator import SimulatedIB, SimulatedMarket
+
+
+async def bench(args, directory:str) -> dict:
+	sim = SimulatedIB(SimulatedMarket({"AAPL": 230.0}), latency=args.latency)
+	api = IBTWSAPI({"host": "sim", "port": 0, "client_id": 1, "reconnect": False, "bar_cache": directory}, ib_factory=lambda: sim)
+	await api.connect()
+	contract, = await api.qualify(api._create_contract("stocks", "AAPL", "SMART"))
+
+	uncached = []
+	for _ in range(args.queries):
+		t0 = time.perf_counter()
+		data = await sim.reqHistoricalDataAsync(contract, '', durationStr=args.period, barSizeSetting="1 min", whatToShow="MIDPOINT", useRTH=True)
+		df = pd.DataFrame([{"datetime": i.date, "open": i.open, "high": i.high, "low": i.low, "close": i.close} for i in data])
+		df.set_index('datetime', inplace=True)
+		uncached.append(time.perf_counter() - t0)
+
+	requests = sim.historical_requests
+	cached = []
+	for _ in range(args.queries):
+		t0 = time.perf_counter()
+		df = await api.get_candle_data("stocks", "AAPL", "1m", args.period.replace(" ", "").lower())
+		cached.append(time.perf_counter() - t0)
+
+	api.disconnect()
+	return {
+		"bars": len(df),
+		"uncached_ms": {"first": uncached[0] * 1e3, "median": statistics.median(uncached) * 1e3},
+		"cached_ms": {"first": cached[0] * 1e3, "median": statistics.median(cached[1:] or cached) * 1e3},
+		"cached_requests": sim.historical_requests - requests,
+		"cache": api.bars.stats(),
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--queries", type=int, default=20)
+	parser.add_argument("--period", default="5 D")
+	parser.add_argument("--latency", type=float, default=0.25, help="seconds per historical request")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		print(json.dumps(asyncio.run(bench(args, directory)), indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,105 @@
+"""
+Event loop lag with scenario reprices inline versus in the compute pool
+
+	A 1 ms heartbeat task measures how late the loop runs it while a large
+	scenario grid is repriced over and over, first on the loop, then in
+	ComputePool workers.
+
+	python benchmarks/bench_compute.py --positions 200 --rounds 20
+"""
+
+# Importing built-in libraries
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import sys
+import time
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+import pytz					# pip install pytz
+from ib_insync import *		# pip install ib_insync
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compute import ComputePool
+from greeks import bs_price, year_fraction
+from scenarios import ScenarioGrid
+
+
+def book(positions:int) -> ScenarioGrid:
+	now = pytz.timezone("America/New_York").localize(dt.datetime(2024, 11, 19, 10)).astimezone(pytz.utc)
+	spot, expiry = 5860.0, "20241119"
+	t = year_fraction(expiry, now)
+	rng = np.random.default_rng(0)
+	grid = ScenarioGrid(clock=lambda: now)
+	grid.set_underlying(Index("SPX", "CBOE", conId=1), spot)
+	for i, strike in enumerate(spot + 5.0 * (np.arange(positions) - positions // 2)):
+		right = "C" if i % 2 else "P"
+		price = float(bs_price(spot, strike, t, 0.0, 0.15 + 0.4 * abs(np.log(strike / spot)), right == "C"))
+		grid.add(Option("SPX", expiry, float(strike), right, "SMART", multiplier="100", conId=100 + i), float(rng.choice((-1, 1))), max(price, 0.05))
+	return grid
+
+
+async def heartbeat(lags:list, stop:asyncio.Event, interval:float=0.001) -> None:
+	loop = asyncio.get_event_loop()
+	while not stop.is_set():
+		t0 = loop.time()
+		await asyncio.sleep(interval)
+		lags.append(max(loop.time() - t0 - interval, 0.0))
+
+
+async def measure(grid:ScenarioGrid, refresh, rounds:int) -> dict:
+	lags, stop = [], asyncio.Event()
+	beat = asyncio.ensure_future(heartbeat(lags, stop))
+	await asyncio.sleep(0.01)
+	t0 = time.perf_counter()
+	for i in range(rounds):
+		grid.set_spot(5860.0 + (i % 2))
+		await refresh()
+		await asyncio.sleep(0)
+	elapsed = time.perf_counter() - t0
+	stop.set()
+	await beat
+	ms = np.asarray(lags) * 1e3
+	return {
+		"reprice_ms": elapsed / rounds * 1e3,
+		"lag_p50_ms": float(np.percentile(ms, 50)),
+		"lag_p99_ms": float(np.percentile(ms, 99)),
+		"lag_max_ms": float(ms.max()),
+		"heartbeats": len(lags),
+	}
+
+
+async def bench(args) -> dict:
+	grid = book(args.positions)
+
+	async def inline():
+		grid.refresh()
+
+	compute = ComputePool(args.workers).start()
+	# Workers import numpy on their first job
+	await compute.refresh_scenarios(grid)
+	result = {
+		"positions": len(grid),
+		"cells": len(grid) * grid.scenarios,
+		"inline": await measure(grid, inline, args.rounds),
+		"pool": await measure(grid, lambda: compute.refresh_scenarios(grid), args.rounds),
+	}
+	compute.close()
+	return result
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--positions", type=int, default=200)
+	parser.add_argument("--rounds", type=int, default=20)
+	parser.add_argument("--workers", type=int, default=2)
+	args = parser.parse_args()
+	print(json.dumps(asyncio.run(bench(args)), indent=2))
+
+
+if __name__ == "__main__":
+	main()
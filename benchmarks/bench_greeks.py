@@ -0,0 +1,75 @@
+"""
+Benchmark of the chain greeks engine on a synthetic SPX 0DTE chain
+
+	python benchmarks/bench_greeks.py
+"""
+
+# Importing built-in libraries
+import os
+import sys
+import time
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from greeks import ChainGreeks, bs_price
+from option_chain import OptionChain
+
+
+def synthetic_chain(spot:float=5860.0, t:float=4 / (365 * 24), n:int=1500) -> OptionChain:
+	strikes = spot + 5.0 * (np.arange(n) - n // 2)
+	chain = OptionChain("SPX", "20241119", strikes)
+	# Skewed smile, priced with the same model the solver inverts
+	k = chain.strikes[:, None]
+	vol = 0.15 + 0.4 * np.abs(np.log(k / spot))
+	is_call = np.asarray(chain.rights) == "C"
+	mid = bs_price(spot, k, t, 0.0, vol, is_call)
+	intrinsic = np.where(is_call, np.maximum(spot - k, 0), np.maximum(k - spot, 0))
+	chain.mid[:] = np.where(mid - intrinsic > 0.05, mid, np.nan)
+	return chain
+
+
+def timeit(fn, repeat:int=20) -> np.ndarray:
+	samples = []
+	for _ in range(repeat):
+		t0 = time.perf_counter()
+		fn()
+		samples.append(time.perf_counter() - t0)
+	return np.asarray(samples) * 1e3
+
+
+def run(label:str, spot:float, t:float) -> None:
+	chain = synthetic_chain(spot, t)
+	engine = ChainGreeks(chain)
+	priced = int(np.isfinite(chain.mid).sum())
+	rng = np.random.default_rng(0)
+
+	def full_recompute():
+		engine.iv[:] = np.nan
+		engine.update(spot + rng.normal(), t)
+
+	full = timeit(full_recompute)
+	engine.update(spot, t)
+	finite = np.argwhere(np.isfinite(chain.mid))
+
+	def tick():
+		i, j = finite[rng.integers(len(finite))]
+		chain.mid[i, j] *= 1.001
+		engine.update(spot, t)
+
+	incremental = timeit(tick, repeat=200)
+
+	print(f"[{label}] contracts priced: {priced} of {chain.mid.size}, IV solved: {int(np.isfinite(engine.iv).sum())}")
+	print(f"[{label}] full recompute:   p50 {np.percentile(full, 50):.2f} ms   p99 {np.percentile(full, 99):.2f} ms")
+	print(f"[{label}] one quote change: p50 {np.percentile(incremental, 50):.3f} ms   p99 {np.percentile(incremental, 99):.3f} ms")
+
+
+def main():
+	# 0DTE at the open, then a 30 day chain where most strikes carry time value
+	run("0DTE", 5860.0, 6.5 / (365 * 24))
+	run("30D", 5860.0, 30 / 365)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,222 @@
+"""
+Tick-to-order latency benchmark for IBTWSAPI and Strategy
+
+	Runs the wrapper and the strategy against the in-process TWS simulator
+	with a scripted SPX tick path and reports p50/p99 latencies and
+	throughput. Results are written as JSON to compare across commits.
+
+	python benchmarks/bench_latency.py --output bench_latency.json
+"""
+
+# Importing built-in libraries
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+import pytz					# pip install pytz
+from ib_insync import *		# pip install ib_insync
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import credentials
+from ib_wrapper import IBTWSAPI
+from main import Strategy
+from tws_simulator import SimulatedIB, SimulatedMarket
+
+
+class Recorder:
+
+	def __init__(self):
+		self.samples = {}
+
+	def add(self, name:str, seconds:float) -> None:
+		self.samples.setdefault(name, []).append(seconds)
+
+	async def time(self, name:str, coro):
+		t0 = time.perf_counter()
+		result = await coro
+		self.add(name, time.perf_counter() - t0)
+		return result
+
+	def summary(self) -> dict:
+		out = {}
+		for name, samples in self.samples.items():
+			ms = np.asarray(samples) * 1e3
+			out[name] = {
+				"n": len(ms),
+				"p50_ms": float(np.percentile(ms, 50)),
+				"p99_ms": float(np.percentile(ms, 99)),
+				"mean_ms": float(ms.mean()),
+				"max_ms": float(ms.max()),
+			}
+		return out
+
+
+class ScriptedTicks:
+	"""
+	Deterministic random walk for the underlying\n
+	"""
+
+	def __init__(self, sim:SimulatedIB, symbol:str="SPX", seed:int=7, step:float=0.5):
+		self.sim = sim
+		self.symbol = symbol
+		self.rng = np.random.default_rng(seed)
+		self.step = step
+
+	def tick(self, drift:float=0.0) -> float:
+		price = self.sim.market.underlyings[self.symbol] + drift + self.step * self.rng.standard_normal()
+		self.sim.set_price(self.symbol, round(price, 2))
+		return price
+
+
+def make_broker(args) -> tuple:
+	zone = pytz.timezone("America/New_York")
+	expiry = credentials.date
+	now = zone.localize(dt.datetime(int(expiry[:4]), int(expiry[4:6]), int(expiry[6:]), 10)).astimezone(pytz.utc)
+	market = SimulatedMarket({"SPX": 5860.0}, [expiry], clock=lambda: now)
+	sim = SimulatedIB(market, latency=args.latency)
+	creds = {"host": "127.0.0.1", "port": 7497, "client_id": 12, "max_msg_rate": args.msg_rate}
+	# The order burst measures the pipeline, the risk gate has its own benchmark
+	creds.update(max_open_orders=None, max_orders_per_sec=None, duplicate_window=None)
+	return IBTWSAPI(creds, ib_factory=lambda: sim), sim
+
+
+def option(strike:float, right:str="C") -> Option:
+	return Option("SPX", credentials.date, strike, right, "SMART")
+
+
+async def bench_wrapper(args, rec:Recorder, throughput:dict) -> None:
+	api, _ = make_broker(args)
+	await rec.time("connect", api.connect())
+	index = await rec.time("fetch_strike_index", api.fetch_strike_index("SPX", credentials.date))
+	atm = index.nearest(5860.0)
+
+	# Contract qualification, cold then warm
+	strikes = index.around(atm, args.quotes // 2)
+	for strike in strikes:
+		await rec.time("qualify_miss", api.qualify(option(strike)))
+	for _ in range(args.iterations):
+		await rec.time("qualify_hit", api.qualify(option(atm)))
+
+	# Quote fetch
+	for _ in range(args.iterations):
+		await rec.time("quote_fetch", api.get_latest_premium_price("SPX", credentials.date, atm, "C", exchange="SMART"))
+
+	contracts = [option(k) for k in strikes]
+	t0 = time.perf_counter()
+	for _ in range(args.iterations // 10 or 1):
+		await rec.time("quote_batch", api.get_premium_prices(contracts))
+	throughput["quotes_per_sec"] = len(contracts) * (args.iterations // 10 or 1) / (time.perf_counter() - t0)
+
+	# Order submit (place_order until Submitted) and fill await
+	contract, = await api.qualify(option(atm))
+	order = dict(contract="options", symbol="SPX", quantity=1, expiry=credentials.date, strike=atm, right="C")
+	for _ in range(args.iterations):
+		t0 = time.perf_counter()
+		trade = await api.place_order(side="BUY", **order)
+		while trade.orderStatus.status != OrderStatus.Submitted and not trade.isDone():
+			await trade.statusEvent
+		rec.add("order_submit", time.perf_counter() - t0)
+		await api.orders.wait(trade)
+
+	for _ in range(args.iterations):
+		await rec.time("fill_await", api.place_market_order(contract, 1, "SELL"))
+
+	t0 = time.perf_counter()
+	trades = [await api.place_order(side="BUY", **order) for _ in range(args.orders)]
+	await asyncio.gather(*(api.orders.wait(t) for t in trades))
+	throughput["orders_per_sec"] = args.orders / (time.perf_counter() - t0)
+
+	# Trail modify, the same TRAIL orderId re-placed in place
+	bid = (await api.get_premium_prices([contract]))[0]["bid"]
+	bracket = await rec.time("bracket_entry", api.place_bracket_order("SPX", 1, price=bid, expiry=credentials.date, strike=atm, right="C", trailingpercent=50))
+	trail = bracket["stoploss"]
+	while trail.orderStatus.status != OrderStatus.Submitted:
+		await trail.statusEvent
+	for n in range(args.iterations):
+		t0 = time.perf_counter()
+		await api.modify_option_trail_percent(trail, 50 - (n % 10))
+		rec.add("trail_modify", time.perf_counter() - t0)
+
+
+async def bench_strategy(args, rec:Recorder) -> None:
+	api, sim = make_broker(args)
+	ticks = ScriptedTicks(sim)
+	strategy = Strategy(broker=api)
+
+	await api.connect()
+	strategy.strikes = await api.fetch_strike_index("SPX", credentials.date)
+
+	# Entry: the SELL limit rests at mid until the market lifts into it
+	t0 = time.perf_counter()
+	entry = asyncio.ensure_future(strategy.place_atm_call_order(strategy.atm_sl))
+	while not entry.done():
+		await asyncio.sleep(0)
+		if any(o.orderType == "LMT" for o in sim.openOrders()):
+			ticks.tick(drift=0.2)
+	await entry
+	rec.add("strategy_atm_entry", time.perf_counter() - t0)
+
+	# Trail: premium falls, every 5% drop must become a modify of the live TRAIL
+	trail = asyncio.ensure_future(strategy.atm_call_trail_sl())
+	await asyncio.sleep(0)
+	while not trail.done():
+		ticks.tick(drift=-0.5)
+		await asyncio.sleep(0)
+	await trail
+
+	for seconds in strategy.trail_manager.latencies:
+		rec.add("strategy_tick_to_modify", seconds)
+
+
+def git_commit() -> str:
+	try:
+		return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return ""
+
+
+async def run(args) -> dict:
+	rec = Recorder()
+	throughput = {}
+	await bench_wrapper(args, rec, throughput)
+	await bench_strategy(args, rec)
+	return {
+		"commit": git_commit(),
+		"timestamp": dt.datetime.now(dt.timezone.utc).isoformat(),
+		"python": platform.python_version(),
+		"config": vars(args),
+		"latency": rec.summary(),
+		"throughput": throughput,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--iterations", type=int, default=200)
+	parser.add_argument("--orders", type=int, default=2000, help="orders in the throughput burst")
+	parser.add_argument("--quotes", type=int, default=20, help="strikes in the batch quote test")
+	parser.add_argument("--latency", type=float, default=0.0, help="simulated gateway latency in seconds")
+	parser.add_argument("--msg-rate", type=float, default=1e6, help="pacing limit, high by default to time the code path only")
+	parser.add_argument("--output", help="write results JSON here")
+	args = parser.parse_args()
+
+	results = asyncio.run(run(args))
+	text = json.dumps(results, indent=2)
+	if args.output:
+		with open(args.output, "w") as f:
+			f.write(text)
+	print(text)
+
+
+if __name__ == "__main__":
+	main()
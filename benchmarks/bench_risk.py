@@ -0,0 +1,101 @@
+"""
+Pre-trade risk gate benchmark
+
+	Times RiskGate.check with every check enabled against a loaded order
+	store, positions and a live quote, and compares placing orders through
+	the gate with placing them on the client directly.
+
+	python benchmarks/bench_risk.py --checks 100000 --working 200
+"""
+
+# Importing built-in libraries
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import sys
+import time
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+import pytz					# pip install pytz
+from ib_insync import *		# pip install ib_insync
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ib_wrapper import IBTWSAPI
+from tws_simulator import SimulatedIB, SimulatedMarket
+
+
+def percentiles(samples:list) -> dict:
+	us = np.array(samples) * 1e6
+	return {"p50_us": float(np.percentile(us, 50)), "p99_us": float(np.percentile(us, 99)), "mean_us": float(us.mean())}
+
+
+async def bench(args) -> dict:
+	# Quotes as of the morning of expiry
+	now = pytz.timezone("America/New_York").localize(dt.datetime(2024, 11, 19, 10)).astimezone(pytz.utc)
+	sim = SimulatedIB(SimulatedMarket({"SPX": 5860.0}, ["20241119"], clock=lambda: now), fill=False)
+	creds = {
+		"host": "sim", "port": 0, "client_id": 1, "reconnect": False, "max_msg_rate": 1e9,
+		"max_position": 1e6, "max_open_orders": 1e6, "max_orders_per_sec": 1e9, "max_order_burst": 1e9,
+		"duplicate_window": 1.0, "price_band": 0.25,
+	}
+	api = IBTWSAPI(creds, ib_factory=lambda: sim)
+	await api.connect()
+	contract, = await api.qualify(Option("SPX", "20241119", 5860, "C", "SMART"))
+	ticker = await api.lines.subscribe(contract)
+	await api._wait_quote(ticker)
+	mid = ticker.midpoint()
+
+	# Working orders on the contract and elsewhere, all seen by the position check
+	others = await api.qualify(*(Option("SPX", "20241119", 5800 + 5 * i, "P", "SMART") for i in range(20)))
+	for i in range(args.working):
+		c = contract if i % 4 == 0 else others[i % len(others)]
+		sim.placeOrder(c, LimitOrder("BUY" if i % 2 else "SELL", 1, round(mid * 0.5, 2)))
+
+	checks = []
+	for i in range(args.checks):
+		# Every fourth order repeats the previous one and is caught as a duplicate
+		order = LimitOrder("BUY", 1, mid + (i - (i % 4 == 3)) * 1e-6)
+		t0 = time.perf_counter()
+		try:
+			api.risk.check(contract, order)
+		except ValueError:
+			pass
+		checks.append(time.perf_counter() - t0)
+
+	raw, gated = [], []
+	for i in range(args.orders):
+		order = LimitOrder("SELL", 1, mid + i * 1e-6)
+		t0 = time.perf_counter()
+		sim.placeOrder(contract, order)
+		raw.append(time.perf_counter() - t0)
+		order = LimitOrder("SELL", 1, mid - i * 1e-6)
+		t0 = time.perf_counter()
+		api.risk.placeOrder(contract, order)
+		gated.append(time.perf_counter() - t0)
+
+	api.disconnect()
+	return {
+		"working_orders": len(api.store.open_ids),
+		"check": percentiles(checks),
+		"place_raw": percentiles(raw),
+		"place_gated": percentiles(gated),
+		"gate": api.risk.stats(),
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--checks", type=int, default=100_000)
+	parser.add_argument("--orders", type=int, default=2000)
+	parser.add_argument("--working", type=int, default=200, help="working orders in the store")
+	args = parser.parse_args()
+	print(json.dumps(asyncio.run(bench(args)), indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,84 @@
+"""
+Benchmark of the scenario P&L grid on a synthetic SPX option book
+
+	Times a full reprice (spot moved) and a single position quote change
+	over the default grid of moves x vol shifts x days of decay.
+
+	python benchmarks/bench_scenarios.py --positions 40
+"""
+
+# Importing built-in libraries
+import argparse
+import datetime as dt
+import json
+import os
+import sys
+import time
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+import pytz					# pip install pytz
+from ib_insync import *		# pip install ib_insync
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from greeks import bs_price, year_fraction
+from scenarios import ScenarioGrid
+
+
+def timeit(fn, repeat:int) -> dict:
+	samples = []
+	for _ in range(repeat):
+		t0 = time.perf_counter()
+		fn()
+		samples.append(time.perf_counter() - t0)
+	ms = np.asarray(samples) * 1e3
+	return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+
+
+def bench(args) -> dict:
+	now = pytz.timezone("America/New_York").localize(dt.datetime(2024, 11, 19, 10)).astimezone(pytz.utc)
+	spot, expiry = 5860.0, "20241119"
+	t = year_fraction(expiry, now)
+	rng = np.random.default_rng(0)
+
+	grid = ScenarioGrid(clock=lambda: now)
+	grid.set_underlying(Index("SPX", "CBOE", conId=1), spot)
+	strikes = spot + 5.0 * (np.arange(args.positions) - args.positions // 2)
+	for i, strike in enumerate(strikes):
+		right = "C" if i % 2 else "P"
+		vol = 0.15 + 0.4 * abs(np.log(strike / spot))
+		price = float(bs_price(spot, strike, t, 0.0, vol, right == "C"))
+		contract = Option("SPX", expiry, float(strike), right, "SMART", multiplier="100", conId=100 + i)
+		grid.add(contract, float(rng.choice((-2, -1, 1, 2))), max(price, 0.05))
+	grid.refresh()
+
+	def full():
+		grid.set_spot(spot + rng.normal())
+		grid.refresh()
+
+	def tick():
+		conId = 100 + int(rng.integers(args.positions))
+		grid.set_price(conId, grid.mark[grid.index[conId]] * (1 + 0.001 * rng.normal()))
+		grid.refresh()
+
+	return {
+		"positions": len(grid),
+		"scenarios": grid.scenarios,
+		"cells": len(grid) * grid.scenarios,
+		"full_reprice": timeit(full, args.repeat),
+		"one_quote": timeit(tick, args.repeat * 10),
+		"worst": grid.worst(),
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--positions", type=int, default=40)
+	parser.add_argument("--repeat", type=int, default=50)
+	args = parser.parse_args()
+	print(json.dumps(bench(args), indent=2))
+
+
+if __name__ == "__main__":
+	main()
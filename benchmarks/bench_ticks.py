@@ -0,0 +1,68 @@
+"""
+Tick journal write and read benchmark
+
+	Records synthetic ticker updates through TickRecorder.on_tickers, the
+	pendingTickersEvent handler, and reads them back with read_day.
+
+	python benchmarks/bench_ticks.py --ticks 1000000
+"""
+
+# Importing built-in libraries
+import argparse
+import datetime as dt
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Importing third-party libraries
+from ib_insync import *		# pip install ib_insync
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tick_journal import TickRecorder, read_day
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument("--ticks", type=int, default=1_000_000)
+	parser.add_argument("--contracts", type=int, default=100)
+	parser.add_argument("--batch", type=int, default=10, help="tickers per pendingTickersEvent")
+	args = parser.parse_args()
+
+	tickers = []
+	for i in range(args.contracts):
+		ticker = Ticker(contract=Option("SPX", "20241119", 5800 + 5 * i, "C", "SMART", conId=100000 + i))
+		ticker.bid, ticker.ask, ticker.last = 10.0 + i, 10.2 + i, 10.1 + i
+		ticker.bidSize = ticker.askSize = ticker.lastSize = 1.0
+		tickers.append(ticker)
+	batches = [tickers[i:i + args.batch] for i in range(0, len(tickers), args.batch)]
+
+	with tempfile.TemporaryDirectory() as directory:
+		recorder = TickRecorder(directory, capacity=args.ticks)
+		n, t0 = 0, time.perf_counter()
+		while n < args.ticks:
+			batch = batches[(n // args.batch) % len(batches)]
+			recorder.on_tickers(batch)
+			n += len(batch)
+		write = time.perf_counter() - t0
+		recorder.close()
+
+		t0 = time.perf_counter()
+		ticks = read_day(directory, dt.datetime.now(dt.timezone.utc).strftime("%Y%m%d"))
+		read = time.perf_counter() - t0
+		mid = float(((ticks["bid"] + ticks["ask"]) / 2).mean())
+
+	print(json.dumps({
+		"ticks": int(len(ticks)),
+		"write_ticks_per_sec": n / write,
+		"write_us_per_tick": write / n * 1e6,
+		"read_ms": read * 1e3,
+		"mean_mid": mid,
+	}, indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,239 @@
+"""
+Worker process pool for chain analytics
+
+	IV fits, scenario grid reprices and large DataFrames run in worker
+	processes and come back as awaitables, so order and market data
+	callbacks keep running on the event loop meanwhile. Arrays cross in
+	one shared memory segment per job; only its name and layout are pickled.
+
+	compute = ComputePool(workers=2)
+	await compute.chain_greeks(engine, spot)
+	await compute.refresh_scenarios(grid)
+"""
+
+# Importing built-in libraries
+import asyncio
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+import pandas as pd			# pip install pandas
+
+# Importing project modules
+from greeks import bs_greeks, implied_vol
+from scenarios import ScenarioGrid
+
+GREEKS = ("delta", "gamma", "vega", "theta")
+
+
+class SharedBlock:
+	"""
+	Named arrays in one shared memory segment, pickled as (name, layout)\n
+	"""
+
+	def __init__(self, arrays:dict, outputs:dict=None):
+
+		# outputs: name -> (shape, dtype), left for the worker to fill
+		specs = [(name, np.asarray(a).dtype, np.shape(a)) for name, a in arrays.items()]
+		specs += [(name, np.dtype(dtype), tuple(shape)) for name, (shape, dtype) in (outputs or {}).items()]
+		self.layout, offset = [], 0
+		for name, dtype, shape in specs:
+			self.layout.append((name, dtype.str, shape, offset))
+			offset += -(-int(np.prod(shape, dtype=np.int64)) * dtype.itemsize // 64) * 64
+		self.shm = SharedMemory(create=True, size=max(offset, 1))
+		self.arrays = _views(self.shm, self.layout)
+		for name, a in arrays.items():
+			self.arrays[name][...] = a
+
+	@property
+	def descriptor(self) -> tuple:
+		return (self.shm.name, self.layout)
+
+	def read(self, *names) -> list:
+		return [self.arrays[name].copy() for name in names]
+
+	def close(self) -> None:
+		# Views first, the buffer cannot close while they hold it
+		self.arrays = None
+		self.shm.close()
+		self.shm.unlink()
+
+
+def _views(shm:SharedMemory, layout:list) -> dict:
+	return {name: np.ndarray(shape, dtype, buffer=shm.buf, offset=offset) for name, dtype, shape, offset in layout}
+
+
+def build_frame(columns:dict, index=None, index_name:str=None, unit:str=None) -> pd.DataFrame:
+	"""
+	Builds a DataFrame from NumPy columns, unit turns a numeric index into a UTC DatetimeIndex (e.g. "s")\n
+	"""
+	if index is not None:
+		index = pd.DatetimeIndex(pd.to_datetime(index, unit=unit, utc=True), name=index_name) if unit else pd.Index(index, name=index_name)
+	return pd.DataFrame(columns, index=index)
+
+
+# Jobs, run in the workers
+
+def _warm() -> int:
+	return os.getpid()
+
+
+def _greeks_job(descriptor:tuple, spot:float, t:float, rate:float) -> float:
+	t0 = time.perf_counter()
+	shm = SharedMemory(name=descriptor[0])
+	a = _views(shm, descriptor[1])
+	a["iv"][:] = implied_vol(a["mid"], spot, a["strike"], t, rate, a["is_call"], guess=a["guess"])
+	greeks = bs_greeks(spot, a["strike"], t, rate, a["iv"], a["is_call"])
+	for name in GREEKS:
+		a[name][:] = greeks[name]
+	del a, greeks
+	shm.close()
+	return time.perf_counter() - t0
+
+
+def _scenario_job(descriptor:tuple, axes:tuple, rate:float, spot:float) -> float:
+	t0 = time.perf_counter()
+	shm = SharedMemory(name=descriptor[0])
+	a = _views(shm, descriptor[1])
+	grid = ScenarioGrid(*axes, rate=rate)
+	pnl, iv = grid._price(spot, a["strike"], a["t"], a["is_call"], a["is_option"], a["quantity"], a["mark"], a["guess"])
+	a["pnl"][:] = pnl
+	a["iv"][:] = iv
+	del a, pnl, iv
+	shm.close()
+	return time.perf_counter() - t0
+
+
+def _frame_job(descriptor:tuple, index_name:str, unit:str) -> pd.DataFrame:
+	shm = SharedMemory(name=descriptor[0])
+	a = {name: column.copy() for name, column in _views(shm, descriptor[1]).items()}
+	shm.close()
+	return build_frame(a, a.pop("__index__", None), index_name, unit)
+
+
+class ComputePool:
+
+	def __init__(self, workers:int=None, frame_rows:int=100_000):
+
+		self.workers = workers or max((os.cpu_count() or 2) - 1, 1)
+		self.frame_rows = frame_rows	# smaller frames are built on the loop, the round trip costs more
+		self.executor = None
+		self.jobs = Counter()			# kind -> jobs run
+		self.worker_time = Counter()	# kind -> seconds spent in workers
+		self.in_flight = 0
+		self._locks = defaultdict(asyncio.Lock)
+
+	def start(self) -> "ComputePool":
+		if self.executor is None:
+			# Workers share the parent's tracker, which unlinks segments left behind by a crash
+			resource_tracker.ensure_running()
+			self.executor = ProcessPoolExecutor(max_workers=self.workers)
+			for _ in range(self.workers):
+				self.executor.submit(_warm)
+		return self
+
+	def close(self) -> None:
+		if self.executor is not None:
+			self.executor.shutdown(wait=False, cancel_futures=True)
+			self.executor = None
+
+	async def run(self, fn, *args):
+		"""
+		Runs a picklable function in a worker, awaits its result\n
+		"""
+		self.start()
+		self.in_flight += 1
+		try:
+			return await asyncio.get_event_loop().run_in_executor(self.executor, fn, *args)
+		finally:
+			self.in_flight -= 1
+
+	async def _job(self, kind:str, block:SharedBlock, fn, *args) -> None:
+		self.worker_time[kind] += await self.run(fn, block.descriptor, *args)
+		self.jobs[kind] += 1
+
+	async def chain_greeks(self, engine, spot:float, t:float=None) -> int:
+		"""
+		ChainGreeks.update with the IV fit and greeks computed in a worker\n
+		"""
+		async with self._locks[id(engine)]:
+			mask, mid = engine.take_stale(spot, t)
+			n = int(mask.sum())
+			if not n:
+				return 0
+			block = SharedBlock(
+				{"mid": mid, "strike": engine.strike[mask], "is_call": engine.is_call[mask], "guess": engine.iv[mask]},
+				{name: ((n,), np.float64) for name in ("iv",) + GREEKS},
+			)
+			try:
+				await self._job("greeks", block, _greeks_job, spot, engine.t, engine.rate)
+				iv, *greeks = block.read("iv", *GREEKS)
+			except BaseException:
+				# Nothing was applied, the next update recomputes everything
+				engine.spot = np.nan
+				raise
+			finally:
+				block.close()
+			engine.apply(mask, mid, iv, dict(zip(GREEKS, greeks)))
+			return n
+
+	async def refresh_scenarios(self, grid:ScenarioGrid) -> int:
+		"""
+		ScenarioGrid.refresh with the reprice done in a worker\n
+		"""
+		async with self._locks[id(grid)]:
+			taken = grid.take_stale()
+			if taken is None:
+				return 0
+			rows, (spot, strike, t, is_call, is_option, quantity, mark, guess) = taken
+			removed = grid.removed
+			block = SharedBlock(
+				{"strike": strike, "t": t, "is_call": is_call, "is_option": is_option, "quantity": quantity, "mark": mark, "guess": guess},
+				{"pnl": ((len(rows),) + grid.shape, np.float64), "iv": ((len(rows),), np.float64)},
+			)
+			try:
+				await self._job("scenarios", block, _scenario_job, (grid.moves, grid.vol_shifts, grid.decay_days), grid.rate, spot)
+				pnl, iv = block.read("pnl", "iv")
+			except BaseException:
+				grid.stale[:] = True
+				raise
+			finally:
+				block.close()
+			if grid.removed != removed:
+				# Rows moved while the job ran, reprice everything next time
+				grid.stale[:] = True
+				return 0
+			grid.apply(rows, pnl, iv)
+			return len(rows)
+
+	async def frame(self, columns:dict, index=None, index_name:str=None, unit:str=None) -> pd.DataFrame:
+		"""
+		build_frame, in a worker when the frame has frame_rows rows or more\n
+		"""
+		rows = len(next(iter(columns.values()))) if columns else 0
+		if rows < self.frame_rows:
+			return build_frame(columns, index, index_name, unit)
+
+		arrays = dict(columns)
+		if index is not None:
+			arrays["__index__"] = np.asarray(index)
+		block = SharedBlock(arrays)
+		try:
+			frame = await self.run(_frame_job, block.descriptor, index_name, unit)
+			self.jobs["frame"] += 1
+			return frame
+		finally:
+			block.close()
+
+	def stats(self) -> dict:
+		return {
+			"workers": self.workers,
+			"in_flight": self.in_flight,
+			"jobs": dict(self.jobs),
+			"worker_ms": {kind: seconds * 1e3 for kind, seconds in self.worker_time.items()},
+		}
@@ -0,0 +1,222 @@
+"""
+Several TWS connections (clientIds) against one gateway
+
+	Order traffic keeps its own connection, market data subscriptions and
+	reference data requests are spread over the data connections. The pool
+	quacks like IB for the market data calls IBTWSAPI makes, so wrapper
+	methods run unchanged on top of it.
+"""
+
+# Importing built-in libraries
+import asyncio
+import itertools
+import logging
+
+# Importing third-party libraries
+from eventkit import Event	# installed with ib_insync
+
+logger = logging.getLogger("ibtws.connection")
+
+# Errors worth retrying, the gateway is restarting or not up yet
+RETRY_ERRORS = (OSError, ConnectionError, asyncio.TimeoutError)
+
+
+async def connect_with_backoff(ib, host:str, port:int, clientId:int, timeout:float=60, delay:float=1.0, max_delay:float=60.0, attempts:int=None):
+	"""
+	Connects ib with connectAsync, retrying with exponential backoff\n
+	Gives up after attempts tries (never when None)\n
+	"""
+	for attempt in itertools.count(1):
+		try:
+			await ib.connectAsync(host=host, port=port, clientId=clientId, timeout=timeout)
+			return ib
+		except RETRY_ERRORS as e:
+			if attempts is not None and attempt >= attempts:
+				raise
+			logger.warning(f"clientId {clientId}: connect attempt {attempt} failed ({e!r}), retrying in {delay:.1f}s")
+			await asyncio.sleep(delay)
+			delay = min(delay * 2, max_delay)
+
+
+class ConnectionPool:
+
+	def __init__(self, ib_factory, host:str, port:int, client_ids:list, order=None, timeout:float=60, reconnect:bool=True, max_delay:float=60.0):
+
+		self.ib_factory = ib_factory
+		self.host = host
+		self.port = port
+		self.client_ids = list(client_ids)
+		self.order = order
+		self.timeout = timeout
+		self.reconnect = reconnect
+		self.max_delay = max_delay
+		self.market_data_type = None
+
+		self.connections = []
+		self.subscriptions = {}
+		self.realtime_bars = {}		# id(RealTimeBarList) -> (ib, bars)
+		self._load = {}
+		self._round_robin = None
+		self._reconnecting = {}
+		self._closing = False
+
+		self.pendingTickersEvent = Event("pendingTickersEvent")
+		self.tickerMovedEvent = Event("tickerMovedEvent")
+		self.barsMovedEvent = Event("barsMovedEvent")
+
+	def connect(self):
+		"""
+		Opens one connection per data clientId\n
+		"""
+		for client_id in self.client_ids:
+			ib = self.ib_factory()
+			ib.connect(host=self.host, port=self.port, clientId=client_id, timeout=self.timeout)
+			self._attach(ib, client_id)
+		return self
+
+	async def connectAsync(self):
+		"""
+		Opens the data connections concurrently\n
+		"""
+		connections = [self.ib_factory() for _ in self.client_ids]
+		await asyncio.gather(*(
+			ib.connectAsync(host=self.host, port=self.port, clientId=client_id, timeout=self.timeout)
+			for ib, client_id in zip(connections, self.client_ids)
+		))
+		for ib, client_id in zip(connections, self.client_ids):
+			self._attach(ib, client_id)
+		return self
+
+	def _attach(self, ib, client_id:int) -> None:
+		ib.pendingTickersEvent += self.pendingTickersEvent.emit
+		ib.disconnectedEvent += lambda: self._on_disconnected(ib, client_id)
+		self.connections.append(ib)
+		self._round_robin = itertools.cycle(self.connections)
+
+	def _on_disconnected(self, ib, client_id:int) -> None:
+		self.rebalance(ib)
+		if self.reconnect and not self._closing and client_id not in self._reconnecting:
+			self._reconnecting[client_id] = asyncio.ensure_future(self._reconnect(ib, client_id))
+
+	async def _reconnect(self, ib, client_id:int) -> None:
+		try:
+			await connect_with_backoff(ib, self.host, self.port, client_id, self.timeout, max_delay=self.max_delay)
+			if self.market_data_type is not None:
+				ib.reqMarketDataType(self.market_data_type)
+		finally:
+			self._reconnecting.pop(client_id, None)
+
+	def disconnect(self) -> None:
+		self._closing = True
+		for task in self._reconnecting.values():
+			task.cancel()
+		for ib in self.connections:
+			ib.disconnect()
+
+	def live(self) -> list:
+		return [ib for ib in self.connections if ib.isConnected()]
+
+	def load(self, ib) -> int:
+		"""
+		Returns the number of market data lines held on a connection\n
+		"""
+		return self._load.get(id(ib), 0)
+
+	def pick(self):
+		"""
+		Returns the least loaded live data connection, the order connection if none is left\n
+		"""
+		live = self.live()
+		if not live:
+			return self.order
+		return min(live, key=self.load)
+
+	def __getattr__(self, name:str):
+		# Reference data (qualification, contract details, secdef, history) round-robins over live connections
+		if name.startswith("_") or not self.connections:
+			raise AttributeError(name)
+		for _ in self.connections:
+			ib = next(self._round_robin)
+			if ib.isConnected():
+				return getattr(ib, name)
+		return getattr(self.order, name)
+
+	def isConnected(self) -> bool:
+		return bool(self.live())
+
+	def reqMarketDataType(self, marketDataType:int) -> None:
+		self.market_data_type = marketDataType
+		for ib in self.live():
+			ib.reqMarketDataType(marketDataType)
+
+	def reqMktData(self, contract, genericTickList:str='', snapshot:bool=False, regulatorySnapshot:bool=False, mktDataOptions=None):
+		"""
+		Subscribes on the least loaded connection (or the one already holding the contract)\n
+		"""
+		held = self.subscriptions.get(contract.conId)
+		ib = held[0] if held and held[0].isConnected() else self.pick()
+		ticker = ib.reqMktData(contract, genericTickList, snapshot, regulatorySnapshot, mktDataOptions or [])
+		if not snapshot and held is None:
+			self._hold(ib, contract, genericTickList)
+		return ticker
+
+	def cancelMktData(self, contract) -> None:
+		held = self._release(contract.conId)
+		if held is not None and held[0].isConnected():
+			held[0].cancelMktData(contract)
+
+	def reqRealTimeBars(self, contract, barSize:int, whatToShow:str, useRTH:bool, realTimeBarsOptions=None):
+		"""
+		Subscribes on the least loaded connection, which is remembered for the cancel\n
+		"""
+		ib = self.pick()
+		bars = ib.reqRealTimeBars(contract, barSize, whatToShow, useRTH, realTimeBarsOptions or [])
+		self.realtime_bars[id(bars)] = (ib, bars)
+		return bars
+
+	def cancelRealTimeBars(self, bars) -> None:
+		held = self.realtime_bars.pop(id(bars), None)
+		if held is not None and held[0].isConnected():
+			held[0].cancelRealTimeBars(bars)
+
+	def _hold(self, ib, contract, genericTickList:str) -> None:
+		self.subscriptions[contract.conId] = (ib, contract, genericTickList)
+		self._load[id(ib)] = self._load.get(id(ib), 0) + 1
+
+	def _release(self, conId:int):
+		held = self.subscriptions.pop(conId, None)
+		if held is not None:
+			self._load[id(held[0])] -= 1
+		return held
+
+	def ticker(self, contract):
+		held = self.subscriptions.get(contract.conId)
+		return held[0].ticker(contract) if held else None
+
+	def tickers(self) -> list:
+		return [t for ib in self.live() for t in ib.tickers()]
+
+	def rebalance(self, dropped) -> None:
+		"""
+		Moves the subscriptions of a dropped connection onto the live ones\n
+		Emits tickerMovedEvent(contract, ticker) for each moved subscription\n
+		and barsMovedEvent(old, new) for each moved RealTimeBarList\n
+		"""
+		moved = [held for held in self.subscriptions.values() if held[0] is dropped]
+		for _, contract, generic in moved:
+			self._release(contract.conId)
+			if not self.live():
+				continue
+			ib = self.pick()
+			if self.market_data_type is not None:
+				ib.reqMarketDataType(self.market_data_type)
+			ticker = ib.reqMktData(contract, generic, False, False, [])
+			self._hold(ib, contract, generic)
+			self.tickerMovedEvent.emit(contract, ticker)
+
+		for key, (ib, bars) in list(self.realtime_bars.items()):
+			if ib is not dropped or not self.live():
+				continue
+			del self.realtime_bars[key]
+			fresh = self.reqRealTimeBars(bars.contract, bars.barSize, bars.whatToShow, bars.useRTH, bars.realTimeBarsOptions)
+			self.barsMovedEvent.emit(bars, fresh)
@@ -0,0 +1,131 @@
+"""
+Qualified contract cache with TTL and LRU eviction
+
+	Optionally persisted to a JSON file so a restart starts warm
+"""
+
+# Importing built-in libraries
+import dataclasses
+import json
+import os
+import time
+from collections import OrderedDict
+
+# Importing third-party libraries
+from ib_insync import Contract		# pip install ib_insync
+
+
+def contract_key(contract:Contract) -> tuple:
+	"""
+	Returns ("conId", conId) key of a contract with a conId\n
+	else (secType, symbol, expiry, strike, right, exchange, tradingClass, currency)\n
+	"""
+	if contract.conId:
+		return ("conId", contract.conId)
+	return (
+		contract.secType,
+		contract.symbol,
+		contract.lastTradeDateOrContractMonth,
+		float(contract.strike or 0.0),
+		contract.right,
+		contract.exchange,
+		contract.tradingClass,
+		contract.currency,
+	)
+
+
+class ContractCache:
+
+	def __init__(self, ttl:float=24 * 3600, maxsize:int=4096, path:str=None):
+
+		self.ttl = ttl
+		self.maxsize = maxsize
+		self.path = path
+		self.hits = 0
+		self.misses = 0
+		self._entries = OrderedDict()
+
+		if path and os.path.exists(path):
+			self.load()
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def __contains__(self, contract:Contract) -> bool:
+		return self.get(contract, count=False) is not None
+
+	def get(self, contract:Contract, count:bool=True):
+		"""
+		Returns the cached qualified contract or None\n
+		"""
+		key = contract_key(contract)
+		entry = self._entries.get(key)
+		if entry is not None and entry[0] > time.time():
+			self._entries.move_to_end(key)
+			if count:
+				self.hits += 1
+			return entry[1]
+
+		if entry is not None:
+			del self._entries[key]
+		if count:
+			self.misses += 1
+		return None
+
+	def put(self, contract:Contract, qualified:Contract) -> None:
+		"""
+		Stores a qualified contract under the key of the requested one\n
+		"""
+		expires = time.time() + self.ttl
+		for key in {contract_key(contract), contract_key(qualified)}:
+			self._entries[key] = (expires, qualified)
+			self._entries.move_to_end(key)
+
+		while len(self._entries) > self.maxsize:
+			self._entries.popitem(last=False)
+
+	def clear(self) -> None:
+		self._entries.clear()
+
+	def stats(self) -> dict:
+		"""
+		Returns hit/miss counters\n
+		"""
+		total = self.hits + self.misses
+		return {
+			"size": len(self._entries),
+			"hits": self.hits,
+			"misses": self.misses,
+			"hit_rate": self.hits / total if total else 0.0,
+		}
+
+	def save(self, path:str=None) -> None:
+		"""
+		Writes unexpired entries to a JSON file\n
+		"""
+		path = path or self.path
+		now = time.time()
+		rows = [
+			{"key": list(key), "expires": expires, "contract": dataclasses.asdict(contract)}
+			for key, (expires, contract) in self._entries.items() if expires > now
+		]
+		tmp = path + ".tmp"
+		with open(tmp, "w") as f:
+			json.dump(rows, f)
+		os.replace(tmp, path)
+
+	def load(self, path:str=None) -> None:
+		"""
+		Reads entries saved by save(), dropping expired ones\n
+		"""
+		path = path or self.path
+		now = time.time()
+		with open(path) as f:
+			rows = json.load(f)
+
+		for row in rows:
+			if row["expires"] > now:
+				self._entries[tuple(row["key"])] = (row["expires"], Contract.create(**row["contract"]))
+
+		while len(self._entries) > self.maxsize:
+			self._entries.popitem(last=False)
@@ -0,0 +1,213 @@
+"""
+Vectorized Black-Scholes implied volatility and greeks
+
+	Every function broadcasts over NumPy arrays so a whole chain is one pass
+"""
+
+# Importing built-in libraries
+import datetime as dt
+import math
+import pytz
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+
+try:
+	from scipy.special import ndtr as norm_cdf		# pip install scipy
+except ImportError:
+	_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+	def norm_cdf(x):
+		x = np.asarray(x, dtype=np.float64)
+		if x.size <= 16:
+			# A few scalars are cheaper through math.erfc than a dozen array ops
+			return np.asarray(0.5 * _erfc(-x / math.sqrt(2.0)), dtype=np.float64)[()]
+		# Chebyshev erfc approximation, relative error < 1.2e-7
+		z = np.abs(x) / np.sqrt(2.0)
+		t = 1.0 / (1.0 + 0.5 * z)
+		erfc = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (
+			-0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (-0.82215223 + t * 0.17087277)))))))))
+		return np.where(x >= 0, 1.0 - 0.5 * erfc, 0.5 * erfc)
+
+
+SQRT_2PI = np.sqrt(2.0 * np.pi)
+MIN_VOL, MAX_VOL = 1e-4, 5.0
+
+
+def norm_pdf(x):
+	return np.exp(-0.5 * x * x) / SQRT_2PI
+
+
+def year_fraction(expiry:str, now:dt.datetime=None, tz:str="America/New_York") -> float:
+	"""
+	Returns years until 16:00 exchange time on expiry (YYYYMMDD)\n
+	"""
+	zone = pytz.timezone(tz)
+	close = zone.localize(dt.datetime(int(expiry[:4]), int(expiry[4:6]), int(expiry[6:8]), 16))
+	now = now or dt.datetime.now(pytz.utc)
+	return max((close - now).total_seconds(), 1.0) / (365.0 * 24 * 3600)
+
+
+def _d1_d2(S, K, T, r, sigma):
+	vol_t = sigma * np.sqrt(T)
+	d1 = (np.log(S / K) + (r + 0.5 * sigma * sigma) * T) / vol_t
+	return d1, d1 - vol_t
+
+
+def bs_price(S, K, T, r, sigma, is_call):
+	"""
+	Returns Black-Scholes prices\n
+	"""
+	d1, d2 = _d1_d2(S, K, T, r, sigma)
+	df = np.exp(-r * T)
+	call = S * norm_cdf(d1) - K * df * norm_cdf(d2)
+	return np.where(is_call, call, call - S + K * df)
+
+
+def bs_greeks(S, K, T, r, sigma, is_call) -> dict:
+	"""
+	Returns delta, gamma, vega (per 1.00 vol) and theta (per year)\n
+	"""
+	d1, d2 = _d1_d2(S, K, T, r, sigma)
+	sqrt_t = np.sqrt(T)
+	df = np.exp(-r * T)
+	pdf = norm_pdf(d1)
+	nd1, nd2 = norm_cdf(d1), norm_cdf(d2)
+
+	call_theta = -S * pdf * sigma / (2 * sqrt_t) - r * K * df * nd2
+	return {
+		"delta": np.where(is_call, nd1, nd1 - 1.0),
+		"gamma": pdf / (S * sigma * sqrt_t),
+		"vega": S * pdf * sqrt_t,
+		"theta": np.where(is_call, call_theta, call_theta + r * K * df),
+	}
+
+
+def implied_vol(price, S, K, T, r, is_call, guess=None, tol:float=1e-6, max_iter:int=50) -> np.ndarray:
+	"""
+	Solves implied volatility with a bracketed Newton iteration\n
+	guess seeds the solver (e.g. the previous IV), prices outside the no-arbitrage bounds give NaN\n
+	"""
+	price, S, K, T, r, is_call, guess = np.broadcast_arrays(
+		np.asarray(price, dtype=np.float64), S, K, T, r, np.asarray(is_call, dtype=bool),
+		np.nan if guess is None else np.asarray(guess, dtype=np.float64))
+	df = np.exp(-r * T)
+	lower = np.where(is_call, np.maximum(S - K * df, 0.0), np.maximum(K * df - S, 0.0))
+	upper = np.where(is_call, S, K * df)
+
+	vol = np.full(price.shape, np.nan)
+	active = np.flatnonzero((price > lower) & (price < upper))
+	if not len(active):
+		return vol
+
+	p, s, k, t, rr, c, g = (a.ravel()[active] for a in (price, S, K, T, r, is_call, guess))
+	lo = np.full(len(active), MIN_VOL)
+	hi = np.full(len(active), MAX_VOL)
+	# Brenner-Subrahmanyam start unless seeded
+	sigma = np.where(np.isfinite(g), g, np.sqrt(2 * np.pi / t) * p / s)
+	sigma = np.clip(sigma, MIN_VOL, MAX_VOL)
+	idx = np.arange(len(active))
+	out = np.full(len(active), np.nan)
+
+	for _ in range(max_iter):
+		diff = bs_price(s, k, t, rr, sigma, c) - p
+		done = (np.abs(diff) < tol) | (hi - lo < tol)
+		out[idx[done]] = sigma[done]
+		keep = ~done
+		if not keep.any():
+			break
+		idx, s, k, t, rr, c, p, sigma, diff, lo, hi = (
+			a[keep] for a in (idx, s, k, t, rr, c, p, sigma, diff, lo, hi))
+
+		# Shrink the bracket, then take Newton where it stays inside, bisection otherwise
+		lo = np.where(diff < 0, sigma, lo)
+		hi = np.where(diff > 0, sigma, hi)
+		vega = s * norm_pdf(_d1_d2(s, k, t, rr, sigma)[0]) * np.sqrt(t)
+		with np.errstate(divide="ignore", invalid="ignore"):
+			newton = sigma - diff / vega
+		sigma = np.where((newton > lo) & (newton < hi), newton, 0.5 * (lo + hi))
+	else:
+		out[idx] = sigma
+
+	vol.ravel()[active] = out
+	return vol
+
+
+class ChainGreeks:
+
+	def __init__(self, chain, rate:float=0.0, clock=None, time_step:float=60.0):
+
+		self.chain = chain
+		self.rate = rate
+		self.clock = clock or (lambda: dt.datetime.now(pytz.utc))
+		self.time_step = time_step		# seconds between time to expiry updates when t is not given
+		self._timed = None
+		self._clock_t = np.nan
+		shape = chain.mid.shape
+		self.is_call = np.broadcast_to(np.asarray(chain.rights) == "C", shape)
+		self.strike = np.broadcast_to(chain.strikes[:, None], shape)
+		self.spot = np.nan
+		self.t = np.nan
+		self.iv = np.full(shape, np.nan)
+		self.delta = np.full(shape, np.nan)
+		self.gamma = np.full(shape, np.nan)
+		self.vega = np.full(shape, np.nan)
+		self.theta = np.full(shape, np.nan)
+		self._mid = np.full(shape, np.nan)
+
+	def update(self, spot:float, t:float=None) -> int:
+		"""
+		Recomputes IV and greeks of changed quotes, or all of them when spot/time moved\n
+		Returns the number of contracts recomputed\n
+		"""
+		mask, mid = self.take_stale(spot, t)
+		n = int(mask.sum())
+		if not n:
+			return 0
+
+		k, c = self.strike[mask], self.is_call[mask]
+		iv = implied_vol(mid, spot, k, self.t, self.rate, c, guess=self.iv[mask])
+		self.apply(mask, mid, iv, bs_greeks(spot, k, self.t, self.rate, iv, c))
+		return n
+
+	def take_stale(self, spot:float, t:float=None) -> tuple:
+		"""
+		Returns the mask of contracts to recompute at spot/t and a copy of their mids\n
+		"""
+		if t is None:
+			# Time to expiry moves every time_step, not on every call, so unchanged quotes stay cached
+			now = self.clock()
+			if self._timed is None or (now - self._timed).total_seconds() >= self.time_step:
+				self._timed = now
+				self._clock_t = year_fraction(self.chain.expiry, now)
+			t = self._clock_t
+		mid = self.chain.mid
+		if spot != self.spot or t != self.t:
+			mask = np.isfinite(mid) | np.isfinite(self._mid)
+		else:
+			mask = ~((mid == self._mid) | (np.isnan(mid) & np.isnan(self._mid)))
+		self.spot, self.t = spot, t
+		return mask, mid[mask]
+
+	def apply(self, mask:np.ndarray, mid:np.ndarray, iv:np.ndarray, greeks:dict) -> None:
+		self.iv[mask] = iv
+		self.delta[mask] = greeks["delta"]
+		self.gamma[mask] = greeks["gamma"]
+		self.vega[mask] = greeks["vega"]
+		self.theta[mask] = greeks["theta"]
+		# The mids priced, a quote that changed meanwhile is picked up next time
+		self._mid[mask] = mid
+
+	def delta_band(self, right:str, low:float, high:float) -> np.ndarray:
+		"""
+		Returns the strikes whose |delta| lies in [low, high]\n
+		"""
+		delta = np.abs(self.delta[:, self.chain.rights.index(right)])
+		return self.chain.strikes[(delta >= low) & (delta <= high)]
+
+	def strike_for_delta(self, right:str, target:float) -> float:
+		"""
+		Returns the strike whose |delta| is closest to target\n
+		"""
+		delta = np.abs(self.delta[:, self.chain.rights.index(right)])
+		return float(self.chain.strikes[np.nanargmin(np.abs(delta - target))])
@@ -8,19 +8,69 @@ Interactive broker's API maintained with IB-INSYNC library
 
 # Importing built-in libraries
 import asyncio
+import copy
+import math
+import time
 import pytz
 import datetime as dt
+from collections import Counter
 
 # Importing third-party libraries
 from ib_insync import *		# pip install ib_insync
 import pandas as pd			# pip install pandas
 #util.logToConsole('DEBUG')
 
+# Importing project modules
+from bar_builder import BarBuilder, bar_size
+from bar_cache import BarCache, tail_duration
+from compute import ComputePool, build_frame
+from connection_pool import ConnectionPool, connect_with_backoff
+from contract_cache import ContractCache
+from greeks import ChainGreeks
+from market_hub import MarketDataHub
+from metrics import Metrics
+from option_chain import RIGHTS, OptionChain
+from order_store import OrderStore
+from order_tracker import OrderTracker
+from pacing import PacingScheduler
+from portfolio import Portfolio
+from risk import OrderRejected, RiskGate
+from scenarios import ScenarioGrid
+from strike_index import StrikeIndex
+from subscriptions import SubscriptionManager
+from tick_journal import TickRecorder
+from trail_manager import TrailingStopManager
+
 class IBTWSAPI:
 
-	def __init__(self, creds:dict):
+	def __init__(self, creds:dict, ib_factory=IB):
 		
 		self.CREDS = creds
+		self.ib_factory = ib_factory
+		self.chains = {}
+		self.greeks = {}
+		self.scenarios = {}
+		self.strike_indexes = {}
+		self.metrics = None
+		self.pool = None
+		self.compute = None
+		self.ticks = None
+		self.candles = None
+		self.stops = {}
+		self.realtime_bars = {}
+		self.scenario_lines = set()		# conIds of scenario positions holding a line
+		self._scenario_pending = set()
+		self.orphaned_orders = {}		# orderId -> journal record of orders TWS no longer reports
+		self.timezones = {}				# conId -> exchange timezone
+		self._reconnect_task = None
+		self._closing = False
+		self.contracts = ContractCache(
+			ttl=creds.get('contract_cache_ttl', 24 * 3600),
+			path=creds.get('contract_cache'),
+		)
+		self.pacer = PacingScheduler(
+			messages_per_sec=creds.get('max_msg_rate', 40),
+		)
 
 	def _create_contract(self, contract:str, symbol:str, exchange:str, expiry:str=..., strike:int=..., right:str=...):
 		"""
@@ -36,48 +86,293 @@ class IBTWSAPI:
 		elif contract == "futureContracts":
 			return ContFuture(symbol=symbol, exchange=exchange, currency="USD")
 
+	def _create_order(self, side:str, quantity:int, order_type:str="MARKET", price:float=...):
+		"""
+		Creates order object for api\n
+		"""
+
+		if order_type.upper() == "MARKET":
+			return MarketOrder(action=side.upper(), totalQuantity=quantity)
+
+		elif order_type.upper() == "LIMIT":
+			return LimitOrder(action=side.upper(), totalQuantity=quantity, lmtPrice=price)
+
+		elif order_type.upper() == "STOP":
+			return StopOrder(action=side.upper(), totalQuantity=quantity, stopPrice=price)
+
 	async def connect(self) -> bool:
 		"""
 		Connect the system with TWS account\n
+		The order and data connections are opened concurrently\n
 		"""
 		# try:
 		host, port = self.CREDS['host'], self.CREDS['port']
-		self.client = IB()
-		self.client.connect(host=host, port=port, clientId=self.CREDS['client_id'], timeout=60)
+		timeout = self.CREDS.get('timeout', 60)
+		self.client = self.ib_factory()
+		connecting = [self.client.connectAsync(host=host, port=port, clientId=self.CREDS['client_id'], timeout=timeout)]
+
+		# Market and reference data go to their own clientIds when configured
+		if self.CREDS.get('data_client_ids'):
+			self.pool = ConnectionPool(
+				self.ib_factory, host, port, self.CREDS['data_client_ids'], order=self.client, timeout=timeout,
+				reconnect=self.CREDS.get('reconnect', True), max_delay=self.CREDS.get('reconnect_max_delay', 60),
+			)
+			connecting.append(self.pool.connectAsync())
+		await asyncio.gather(*connecting)
+
+		self.orders = OrderTracker(self.client)
+		journal = self.CREDS.get('order_journal')
+		# Read before this session appends to it
+		unfinished = OrderStore.unfinished(journal) if journal else {}
+		self.store = OrderStore(self.client, journal=journal)
+		self._recover(unfinished)
+		self.portfolio = Portfolio(self.client, history=self.CREDS.get('portfolio_history', 4096), pnl=self.CREDS.get('pnl', True))
+		self.md = self.pool if self.pool is not None else self.client
+		self.lines = SubscriptionManager(self.md, lines=self.CREDS.get('market_data_lines', 100), pacer=self.pacer)
+		self.hub = MarketDataHub(self.lines)
+		self.risk = RiskGate(
+			self.client, self.store, self.portfolio, self.lines,
+			max_position=self.CREDS.get('max_position'),
+			max_open_orders=self.CREDS.get('max_open_orders', 50),
+			max_orders_per_sec=self.CREDS.get('max_orders_per_sec', 10),
+			burst=self.CREDS.get('max_order_burst', 20),
+			duplicate_window=self.CREDS.get('duplicate_window', 1.0),
+			price_band=self.CREDS.get('price_band', 0.25),
+			min_band=self.CREDS.get('min_price_band', 0.5),
+		)
+		self.bars = BarCache(self.md, directory=self.CREDS.get('bar_cache'), pacer=self.pacer, timeout=self._timeout())
+		self.candles = BarBuilder(self.CREDS.get('bar_timeframes', ("5s", "1m", "5m")), capacity=self.CREDS.get('bar_capacity', 1024))
+		self.lines.tickerMovedEvent += self.candles.on_moved
+		if self.pool is not None:
+			self.pool.barsMovedEvent += self._on_bars_moved
+		if self.CREDS.get('compute_workers'):
+			self.compute = ComputePool(self.CREDS['compute_workers'], frame_rows=self.CREDS.get('frame_rows', 100_000)).start()
+		if self.CREDS.get('tick_journal'):
+			self.ticks = TickRecorder(self.CREDS['tick_journal']).attach(self.md)
+		if self.CREDS.get('reconnect', True):
+			self.client.disconnectedEvent += self._on_disconnected
 		print("Connected")
+		if self.CREDS.get('metrics'):
+			self.enable_metrics(
+				port=self.CREDS.get('metrics_port'),
+				log_interval=self.CREDS.get('metrics_log_interval'),
+				block_threshold=self.CREDS.get('block_threshold'),
+			)
+		return True
 		
 		# except Exception as e:
 		# 	print(e)
 		# 	return False
 
+	def _on_disconnected(self) -> None:
+		if self._closing or (self._reconnect_task is not None and not self._reconnect_task.done()):
+			return
+		print("Disconnected, reconnecting")
+		self._reconnect_task = asyncio.ensure_future(self.reconnect())
+
+	async def reconnect(self) -> None:
+		"""
+		Reconnects the order connection with exponential backoff\n
+		Then restores market data subscriptions and order tracking on the new session\n
+		"""
+		await connect_with_backoff(
+			self.client, self.CREDS['host'], self.CREDS['port'], self.CREDS['client_id'],
+			timeout=self.CREDS.get('timeout', 60),
+			delay=self.CREDS.get('reconnect_delay', 1),
+			max_delay=self.CREDS.get('reconnect_max_delay', 60),
+		)
+		self._restore()
+		await self._reconcile_orders()
+		print("Reconnected")
+
+	def _restore(self) -> None:
+		# Subscriptions on the pool survive, they were moved when their connection dropped
+		if self.md is self.client:
+			self.lines.restore()
+			for chain in self.chains.values():
+				for contract in list(chain.contracts.values()):
+					chain.bind(self.lines.ticker(contract))
+			for conId, bars in list(self.realtime_bars.items()):
+				self.realtime_bars[conId] = self._request_realtime_bars(bars.contract, bars.whatToShow, bars.useRTH)
+
+		trades = self.orders.restore()
+		self.portfolio.restore()
+		for orderId, manager in list(self.stops.items()):
+			if manager.done.is_set():
+				del self.stops[orderId]
+			elif orderId in trades:
+				manager.rebind(trades[orderId])
+
+	async def _reconcile_orders(self, timeout:float=None) -> None:
+		"""
+		Settles the tracked orders that filled or were cancelled while disconnected\n
+		Orders TWS no longer reports at all are left in the store with status Unknown\n
+		"""
+		completed = await asyncio.wait_for(self.client.reqCompletedOrdersAsync(True), self._timeout(timeout))
+		for trade in self.store.reconcile(self.client.openTrades(), completed):
+			print(f"Order {trade.order.orderId} ({trade.order.action} {trade.order.totalQuantity} {trade.contract.localSymbol or trade.contract.symbol}) is unknown to TWS after reconnecting")
+
+	def _recover(self, unfinished:dict) -> None:
+		"""
+		Matches the orders a previous run journalled as working against the trades TWS sent on connect\n
+		"""
+		for orderId, record in unfinished.items():
+			trade = self.store.by_perm_id(record["permId"]) if record["permId"] else None
+			if trade is None:
+				self.orphaned_orders[orderId] = record
+				print(f"Journalled order {orderId} ({record['action']} {record['totalQuantity']} {record['symbol']}, {record['status']}) is unknown to TWS")
+			elif trade.order.orderId != orderId:
+				print(f"Journalled order {orderId} is now orderId {trade.order.orderId}, {trade.orderStatus.status}")
+
+	def disconnect(self) -> None:
+		"""
+		Disconnects every connection without reconnecting\n
+		"""
+		self._closing = True
+		if self._reconnect_task is not None:
+			self._reconnect_task.cancel()
+		for manager in self.stops.values():
+			manager.stop()
+		if self.candles is not None:
+			self.candles.stop()
+		# Unsubscribes while the connection is still up, then closes the journal
+		self.portfolio.close()
+		self.store.close()
+		if self.pool is not None:
+			self.pool.disconnect()
+		self.client.disconnect()
+		if self.ticks is not None:
+			self.ticks.detach(self.md)
+		if self.compute is not None:
+			self.compute.close()
+
+	async def warm_up(self, symbol:str, expiry:str, exchange:str="SMART", rights:tuple=("C", "P"), timeout:float=None) -> tuple:
+		"""
+		Fetches strikes and the underlying price concurrently, then qualifies the ATM contracts\n
+		and opens their quote lines, so the first order finds everything cached\n
+		Returns (strike index, underlying price, ATM contracts)\n
+		"""
+		index, price = await asyncio.gather(
+			self.fetch_strike_index(symbol, expiry, exchange, timeout=timeout),
+			self.current_price(symbol, timeout=timeout),
+		)
+		if price is None:
+			raise asyncio.TimeoutError(f"No {symbol} price to pick the ATM strike from")
+		atm = index.nearest(price)
+		contracts = await self.qualify(*(Option(symbol, expiry, atm, right, exchange) for right in rights), timeout=timeout)
+		await asyncio.gather(*(self.lines.subscribe(c) for c in contracts))
+		for contract in contracts:
+			self.lines.release(contract)
+		return index, price, contracts
+
+	def enable_metrics(self, port:int=None, log_interval:float=None, block_threshold:float=None) -> Metrics:
+		"""
+		Instruments every coroutine of this api and starts the exporters\n
+		"""
+		if self.metrics is None:
+			self.metrics = Metrics()
+			self.metrics.instrument(self)
+			for ib in [self.client] + (self.pool.connections if self.pool else []):
+				self.metrics.watch(ib)
+			self.metrics.start(port=port, log_interval=log_interval, block_threshold=block_threshold)
+		return self.metrics
+
 	def is_connected(self) -> bool:
 		"""
 		Get the connection status\n
 		"""
 		return self.client.isConnected()
 
+	def _timeout(self, timeout:float=None) -> float:
+		# Per-call timeout, request_timeout (seconds) when not given, None waits forever
+		return self.CREDS.get('request_timeout', 30) if timeout is None else timeout
+
+	async def _paced(self, request, *args, timeout:float=None, messages:int=1):
+		"""
+		Sends a reference data request once the message budget allows it, then awaits it within timeout\n
+		"""
+		await self.pacer.send(messages)
+		return await asyncio.wait_for(request(*args), self._timeout(timeout))
+
+	async def qualify(self, *contracts, timeout:float=None):
+		"""
+		Qualifies contracts through the contract cache\n
+		Contracts that fail to qualify are returned unchanged\n
+		"""
+		qualified = [self.contracts.get(c) for c in contracts]
+		missing = [c for c, q in zip(contracts, qualified) if q is None]
+		if missing:
+			requested = [copy.copy(c) for c in missing]
+			await self._paced(self.md.qualifyContractsAsync, *missing, timeout=timeout, messages=len(missing))
+			for req, c in zip(requested, missing):
+				if c.conId:
+					self.contracts.put(req, c)
+			if self.contracts.path:
+				self.contracts.save()
+			qualified = [q or self.contracts.get(c, count=False) or c for c, q in zip(contracts, qualified)]
+
+		return qualified
+
 	def get_account_info(self):
 		"""
 		Returns connected account info\n
+		Blocks until TWS answers, inside a running event loop use get_account_info_async\n
 		"""
 		account_info = self.client.accountSummary()
 		return account_info
 
+	async def get_account_info_async(self, timeout:float=None) -> list:
+		"""
+		Returns connected account info without blocking the event loop\n
+		"""
+		return await asyncio.wait_for(self.client.accountSummaryAsync(), self._timeout(timeout))
+
 	def get_account_balance(self) -> float:
 		"""
 		Returns account balance\n
+		Read from the portfolio cache, the summary is only scanned before TWS has sent it\n
+		Inside a running event loop use get_account_balance_async\n
 		"""
+		balance = self.portfolio.available_funds()
+		if not math.isnan(balance):
+			return balance
 		for acc in self.get_account_info():
 			if acc.tag == "AvailableFunds":
 				return float(acc.value)
-			
-	async def get_positions(self):
-		return self.client.positions()[0]
+
+	async def get_account_balance_async(self, timeout:float=None) -> float:
+		"""
+		Returns account balance, awaiting the account summary when the portfolio cache is still empty\n
+		"""
+		balance = self.portfolio.available_funds()
+		if not math.isnan(balance):
+			return balance
+		for acc in await self.get_account_info_async(timeout):
+			if acc.tag == "AvailableFunds":
+				return float(acc.value)
+
+	async def get_positions(self) -> list:
+		"""
+		Returns every open position of the account\n
+		"""
+		return [p for (account, conId), p in self.portfolio.positions.items() if account == self.portfolio.default]
+
+	def get_pnl(self, conId:int=None) -> dict:
+		"""
+		Returns daily, unrealized and realized P&L of a position, or of the account when conId is None\n
+		"""
+		portfolio = self.portfolio
+		pnl = portfolio.totals.get(portfolio.default) if conId is None else portfolio.pnl.get((portfolio.default, conId))
+		return {
+			"daily" : pnl.dailyPnL if pnl is not None else math.nan,
+			"unrealized" : pnl.unrealizedPnL if pnl is not None else math.nan,
+			"realized" : pnl.realizedPnL if pnl is not None else math.nan,
+		}
 
 	async def get_open_orders(self):
-		return self.client.reqOpenOrders()
+		return self.store.open()
 
-	async def get_contract_info(self, contract:str, symbol:str, exchange: str) -> dict:
+	async def get_contract_info(self, contract:str, symbol:str, exchange: str, timeout:float=None) -> dict:
 		"""
 		Returns info of the contract\n
 		"""
@@ -86,8 +381,9 @@ class IBTWSAPI:
 		if contract in ["options"]:
 			c.strike = ""
 			c.lastTradeDateOrContractMonth = ""
+			c.right = ""
 
-		contract_info = self.client.reqContractDetails(contract=c)
+		contract_info = await self._paced(self.md.reqContractDetailsAsync, c, timeout=timeout)
 		# print(contract_info)
 		
 		return {
@@ -95,7 +391,7 @@ class IBTWSAPI:
 				"expiry" : contract_info[0].contract.lastTradeDateOrContractMonth
 			}
 
-	async def get_expiries_and_strikes(self, technology: str, ticker: str) -> dict:
+	async def get_expiries_and_strikes(self, technology: str, ticker: str, timeout:float=None) -> dict:
 		"""
 		"""
 		# Creating contract
@@ -106,8 +402,7 @@ class IBTWSAPI:
 		c.symbol = ticker
 		c.strike = ""
 		c.lastTradeDateOrContractMonth = ""
-		print("Over here bro")
-		contract_info = self.client.reqContractDetails(contract=c)
+		contract_info = await self._paced(self.md.reqContractDetailsAsync, c, timeout=timeout)
 		# print(contract_info)
 
 		ens = {}
@@ -117,112 +412,415 @@ class IBTWSAPI:
 			exp = dt.date(int(s_exp[:4]), int(s_exp[4:6]), int(s_exp[-2:]))
 			strike = float(contractDetails.contract.strike)
 
-			if exp not in ens: ens[exp] = []
-			if strike not in ens[exp]: ens[exp].append(strike)
+			ens.setdefault(exp, set()).add(strike)
 		current_datetime = dt.datetime.now(pytz.timezone("UTC"))
 		return {k : sorted(ens[k]) for k in sorted(ens.keys()) if k > current_datetime.date()}
 
-	async def fetch_strikes(self, symbol, exchange):
-		spx = Index(symbol, 'CBOE')
-		self.client.qualifyContracts(spx)
-		self.client.reqMarketDataType(4)
-		chains = self.client.reqSecDefOptParams(spx.symbol, '', spx.secType, spx.conId)
-		chain = next(c for c in chains if c.tradingClass == 'SPX' and c.exchange == 'SMART')
-		strikes = chain.strikes
-
-		return strikes
-
-	async def place_market_order(self, contract, qty, side):
-		buy_order = MarketOrder(side, qty)
-		buy_trade = self.client.placeOrder(contract, buy_order)
-		print("waiting for order to be placed")
-		n = 0
-		while True:  # Wait for up to 10 seconds
-			# Wait for 1 second before checking the order status
-			if buy_trade.isDone():
-				# Order was filled
-				print("Order placed successfully")
-				fill_price = buy_trade.orderStatus.avgFillPrice
-				print("Fill price:", fill_price)
-				return buy_trade, fill_price
-			else:
-				print(f"Waiting... {n + 1} seconds")
-				await asyncio.sleep(1)
-	async def current_price(self, symbol, exchange='CBOE'):
-		spx_contract = Index(symbol, exchange)
-		self.client.qualifyContracts(spx_contract)
-		self.client.reqMarketDataType(4)
-
-		market_data = self.client.reqMktData(spx_contract, '', snapshot=True)
-		while util.isNan(market_data.last):
-			await asyncio.sleep(0.1)
-
-		if market_data.last > 0:
-			return market_data.last
+	async def fetch_strikes(self, symbol, exchange, timeout:float=None):
+		index = await self.fetch_strike_index(symbol, exchange=exchange, timeout=timeout)
+		return index.strikes
+
+	async def fetch_strike_index(self, symbol:str, expiry:str="", exchange:str="SMART", trading_class:str=None, timeout:float=None) -> StrikeIndex:
+		"""
+		Returns the sorted strike index of an underlying/expiry, cached for secdef_ttl seconds\n
+		"""
+		key = (symbol, expiry, exchange, trading_class)
+		entry = self.strike_indexes.get(key)
+		if entry is not None and entry[0] > time.time():
+			return entry[1]
+
+		underlying, = await self.qualify(Index(symbol, 'CBOE'), timeout=timeout)
+		chains = await self._paced(
+			self.md.reqSecDefOptParamsAsync, underlying.symbol, '', underlying.secType, underlying.conId, timeout=timeout,
+		)
+		# SPX and SPXW are separate entries, a 0DTE date may only be listed under one of them
+		chains = [
+			c for c in chains
+			if c.exchange == exchange and (not trading_class or c.tradingClass == trading_class) and (not expiry or expiry in c.expirations)
+		]
+		if not chains:
+			raise ValueError(f"{symbol} has no {expiry or 'option'} expiry on {exchange}")
+
+		if expiry:
+			# Secdef strikes are the union over every expiry, the expiry's own contracts list its strikes
+			details = await self._paced(
+				self.md.reqContractDetailsAsync, Option(symbol, expiry, exchange=exchange, tradingClass=trading_class or ''), timeout=timeout,
+			)
+			strikes = [cd.contract.strike for cd in details]
+		else:
+			strikes = [k for c in chains for k in c.strikes]
+		index = StrikeIndex(symbol, expiry, strikes)
+		self.strike_indexes[key] = (time.time() + self.CREDS.get('secdef_ttl', 3600), index)
+		return index
+
+	async def place_market_order(self, contract, qty, side, timeout:float=None, on_fill=None):
+		"""
+		Places a market order and waits for it to be done\n
+		"""
+		contract, = await self.qualify(contract)
+		buy_trade = self.risk.placeOrder(contract, MarketOrder(side, qty))
+		buy_trade = await self.orders.wait(buy_trade, timeout=timeout, on_fill=on_fill)
+		return buy_trade, buy_trade.orderStatus.avgFillPrice
+
+	async def current_price(self, symbol, exchange='CBOE', timeout:float=None):
+		"""
+		Returns the last price of an index, None when none arrives within timeout\n
+		"""
+		spx_contract, = await self.qualify(Index(symbol, exchange), timeout=timeout)
+		self.md.reqMarketDataType(4)
+
+		last = await self._last_price(spx_contract, timeout)
+		if last > 0:
+			return last
 		else:
 			print("Market data is not subscribed or unavailable for", symbol)
 			return None
 
-	async def get_option_chain(self, symbol:str, exp_list:list) -> dict:
+	async def _last_price(self, contract, timeout:float=None) -> float:
+		# Last price from a line held only while waiting, NaN when none arrives within timeout
+		loop = asyncio.get_event_loop()
+		timeout = self._timeout(timeout)
+		deadline = None if timeout is None else loop.time() + timeout
+		try:
+			ticker = await self.lines.subscribe(contract, timeout=timeout)
+		except asyncio.TimeoutError:
+			return math.nan
+		try:
+			await asyncio.wait_for(self._wait_last(ticker), None if deadline is None else max(deadline - loop.time(), 0))
+		except asyncio.TimeoutError:
+			pass
+		finally:
+			self.lines.release(contract)
+		return ticker.last
+
+	async def stream_option_chain(self, symbol:str, expiry:str, exchange:str="SMART", strikes:list=None, trading_class:str=None, lines:int=None, timeout:float=None) -> OptionChain:
 		"""
+		Subscribes the given strikes of an expiry, or the strikes nearest the money that fit in lines, and keeps their quotes live\n
+		lines defaults to chain_lines (half the line budget), less what is already held\n
+		Only one trading class is streamed, the one listing most contracts unless trading_class is given\n
+		Each contract holds one market data line until the chain is cancelled\n
 		"""
-		exps = {}
-		df = pd.DataFrame(columns=['strike','kind','close','last'])
-		self.client.reqMarketDataType(1)
-		for i in exp_list:
-			cds = self.client.reqContractDetails(Option(symbol, i, exchange='SMART'))
-			# print(cds)
-			options = [cd.contract for cd in cds]
-			# print(options)
-			l = []
-			for x in options:
-				# print(x)
-				contract = Option(symbol, i, x.strike, x.right, "SMART", currency="USD")
-				# print(contract)
-				snapshot = self.client.reqMktData(contract, "", True, False)
-				l.append([x.strike,x.right,snapshot])
-				# print(snapshot)
-
-			while util.isNan(snapshot.bid):
-				self.client.sleep()
-			for ii in l:
-				df = df.append({'strike':ii[0],'kind':ii[1],'close':ii[2].close,'last':ii[2].last,'bid':ii[2].bid,'ask':ii[2].ask,'mid':(ii[2].bid+ii[2].ask)/2,'volume':ii[2].volume},ignore_index=True)
-				exps[i] = df
+		key = (symbol, expiry, exchange)
+		if key in self.chains:
+			return self.chains[key]
+
+		trading_class, contracts = await self._chain_contracts(symbol, expiry, exchange, strikes, trading_class, timeout)
+		if strikes is None:
+			contracts = await self._atm_window(symbol, contracts, self._chain_lines() if lines is None else lines, timeout)
+		chain = OptionChain(symbol, expiry, [c.strike for c in contracts], trading_class=trading_class)
+		for ticker in await self.lines.acquire_many(contracts):
+			chain.bind(ticker)
+
+		self.md.pendingTickersEvent += chain.on_tickers
+		self.chains[key] = chain
+		return chain
+
+	def _chain_lines(self) -> int:
+		# Lines a chain may stream by default, the rest stay free for quotes and orders
+		return min(self.lines.free(), self.CREDS.get('chain_lines', self.lines.lines // 2))
+
+	async def _chain_contracts(self, symbol:str, expiry:str, exchange:str, strikes:list, trading_class:str, timeout:float) -> tuple:
+		# (trading class, contracts) of an expiry, narrowed to strikes when given
+		cds = await self._paced(self.md.reqContractDetailsAsync, Option(symbol, expiry, exchange=exchange), timeout=timeout)
+		if trading_class is None and cds:
+			# Monthly expiries list SPX and SPXW contracts of the same strikes
+			classes = Counter(cd.contract.tradingClass for cd in cds)
+			trading_class = max(sorted(classes), key=classes.get)
+		contracts = [cd.contract for cd in cds if not trading_class or cd.contract.tradingClass == trading_class]
+		if strikes is not None:
+			strikes = set(strikes)
+			contracts = [c for c in contracts if c.strike in strikes]
+		return trading_class or "", contracts
+
+	async def _atm_window(self, symbol:str, contracts:list, lines:int, timeout:float=None) -> list:
+		"""
+		Keeps the contracts of the strikes nearest the money that fit in lines\n
+		Centred on the middle strike when the underlying has no price\n
+		"""
+		if len(contracts) <= lines:
+			return contracts
+		per_strike = Counter(c.strike for c in contracts)
+		count = max(lines, 0) // max(per_strike.values())
+		strikes = sorted(per_strike)
+		underlying, = await self.qualify(Index(symbol, "CBOE"), timeout=timeout)
+		spot = await self._last_price(underlying, timeout) if underlying.conId else math.nan
+		if not spot > 0:
+			spot = strikes[len(strikes) // 2]
+		keep = set(sorted(strikes, key=lambda k: abs(k - spot))[:count])
+		return [c for c in contracts if c.strike in keep]
+
+	async def _snapshot_chain(self, symbol:str, expiry:str, exchange:str="SMART", strikes:list=None, trading_class:str=None, lines:int=None, timeout:float=None) -> OptionChain:
+		"""
+		Quotes a chain of any size in batches that rotate through lines (the free lines by default)\n
+		Each batch waits up to timeout for its quotes, then its lines are released for the next one\n
+		"""
+		trading_class, contracts = await self._chain_contracts(symbol, expiry, exchange, strikes, trading_class, timeout)
+		chain = OptionChain(symbol, expiry, [c.strike for c in contracts], trading_class=trading_class)
+		size = max(self.lines.free() if lines is None else lines, 1)
+		for n in range(0, len(contracts), size):
+			batch = contracts[n:n + size]
+			tickers = await self.lines.acquire_many(batch)
+			try:
+				await asyncio.wait_for(asyncio.gather(*(self._wait_quote(t) for t in tickers)), timeout)
+			except asyncio.TimeoutError:
+				pass
+			finally:
+				for contract in batch:
+					self.lines.release(contract)
+			for ticker in tickers:
+				chain.bind(ticker)
+		return chain
+
+	def cancel_option_chain(self, symbol:str, expiry:str, exchange:str="SMART") -> None:
+		"""
+		Cancels the streaming subscriptions of an expiry\n
+		"""
+		chain = self.chains.pop((symbol, expiry, exchange), None)
+		self.greeks.pop((symbol, expiry, exchange), None)
+		if chain is None:
+			return
+		self.md.pendingTickersEvent -= chain.on_tickers
+		for contract in chain.unbind():
+			self.lines.release(contract)
+
+	async def scenario_grid(self, symbol:str, exchange:str="CBOE", moves=None, vol_shifts=None, decay_days=None, clock=None, timeout:float=None) -> ScenarioGrid:
+		"""
+		Returns the live scenario P&L grid of the account's positions on symbol\n
+		The underlying and every position held keep a market data line until the grid is cancelled\n
+		"""
+		grid = self.scenarios.get(symbol)
+		if grid is not None:
+			return grid
+
+		underlying, = await self.qualify(Index(symbol, exchange), timeout=timeout)
+		grid = ScenarioGrid(moves, vol_shifts, decay_days, rate=self.CREDS.get('rate', 0.0), clock=clock)
+		ticker = await self.lines.subscribe(underlying)
+		grid.set_underlying(underlying, ticker.marketPrice())
+		for position in await self.get_positions():
+			if position.contract.symbol == symbol:
+				self._scenario_position(grid, position)
+
+		if not self.scenarios:
+			self.client.positionEvent += self._on_scenario_position
+		self.md.pendingTickersEvent += grid.on_tickers
+		self.scenarios[symbol] = grid
+		return grid
+
+	def cancel_scenario_grid(self, symbol:str) -> None:
+		"""
+		Stops updating a scenario grid and releases its lines\n
+		"""
+		grid = self.scenarios.pop(symbol, None)
+		if grid is None:
+			return
+		self.md.pendingTickersEvent -= grid.on_tickers
+		if not self.scenarios:
+			self.client.positionEvent -= self._on_scenario_position
+		for contract in grid.contracts:
+			if contract.conId in self.scenario_lines:
+				self.scenario_lines.discard(contract.conId)
+				self.lines.release(contract)
+		self.lines.release(Contract(conId=grid.underlying))
+
+	def _on_scenario_position(self, position) -> None:
+		grid = self.scenarios.get(position.contract.symbol)
+		if grid is not None and position.account == self.portfolio.default:
+			self._scenario_position(grid, position)
+
+	def _scenario_position(self, grid:ScenarioGrid, position) -> None:
+		contract = position.contract
+		if contract.conId in grid.index:
+			if position.position:
+				grid.add(contract, position.position)
+			else:
+				grid.remove(contract.conId)
+				if contract.conId in self.scenario_lines:
+					self.scenario_lines.discard(contract.conId)
+					self.lines.release(contract)
+			return
+		if not position.position:
+			return
+
+		if not contract.exchange:
+			# Position contracts may come without a routing exchange
+			contract = copy.copy(contract)
+			contract.exchange = "SMART"
+		grid.add(contract, position.position)
+		if contract.conId not in self.scenario_lines and contract.conId not in self._scenario_pending:
+			self._scenario_pending.add(contract.conId)
+			asyncio.ensure_future(self._scenario_line(grid, contract))
+
+	async def _scenario_line(self, grid:ScenarioGrid, contract) -> None:
+		# The line request is paced, the position stays unpriced until its quote arrives
+		try:
+			ticker, = await self.lines.acquire_many([contract])
+		except RuntimeError:
+			# Counted as unpriced until a line is free
+			return
+		finally:
+			self._scenario_pending.discard(contract.conId)
+		if self.scenarios.get(contract.symbol) is not grid or contract.conId not in grid.index:
+			# Closed or cancelled while the request waited
+			self.lines.release(contract)
+			return
+		self.scenario_lines.add(contract.conId)
+		grid.set_price(contract.conId, ticker.midpoint())
+
+	async def get_option_chain(self, symbol:str, exp_list:list, timeout:float=10, strikes:list=None, full:bool=False) -> dict:
+		"""
+		Returns {expiry: DataFrame} snapshot of the streaming chains\n
+		Without strikes each expiry streams the strikes nearest the money that fit in its share of chain_lines\n
+		With full, or more strikes than that share, every contract is quoted in batches instead of streamed\n
+		"""
+		self.md.reqMarketDataType(1)
+		share = self._chain_lines() // max(len(exp_list), 1)
+
+		async def chain(expiry):
+			streaming = (symbol, expiry, "SMART") in self.chains
+			if full or (not streaming and strikes is not None and len(strikes) * len(RIGHTS) > share):
+				return await self._snapshot_chain(symbol, expiry, strikes=strikes, lines=share, timeout=timeout)
+			chain = await self.stream_option_chain(symbol, expiry, strikes=strikes, lines=share, timeout=timeout)
+			await chain.wait_ready(timeout)
+			return chain
+
+		streams = await asyncio.gather(*(chain(str(i)) for i in exp_list))
+		chains = dict(zip(exp_list, streams))
+
+		frames = await asyncio.gather(*(self._frame(chain.columns()) for chain in chains.values()))
+		return dict(zip(chains, frames))
+
+	async def _frame(self, columns:dict, index=None, index_name:str=None, unit:str=None) -> pd.DataFrame:
+		# Large frames are built in a worker when a compute pool is configured
+		if self.compute is not None:
+			return await self.compute.frame(columns, index, index_name, unit)
+		return build_frame(columns, index, index_name, unit)
+
+	async def chain_greeks(self, symbol:str, expiry:str, spot:float, exchange:str="SMART", t:float=None) -> ChainGreeks:
+		"""
+		Returns IV and greeks of a streaming chain, recomputed for the quotes changed since the last call\n
+		The fit runs in the compute pool when one is configured\n
+		"""
+		key = (symbol, expiry, exchange)
+		engine = self.greeks.get(key)
+		if engine is None:
+			engine = self.greeks[key] = ChainGreeks(await self.stream_option_chain(symbol, expiry, exchange), rate=self.CREDS.get('rate', 0.0))
+		if self.compute is not None:
+			await self.compute.chain_greeks(engine, spot, t)
+		else:
+			engine.update(spot, t)
+		return engine
 
-		return exps
+	async def refresh_scenarios(self, symbol:str) -> dict:
+		"""
+		Reprices the stale positions of a scenario grid, in the compute pool when one is configured\n
+		Returns the grid summary\n
+		"""
+		grid = self.scenarios[symbol]
+		if self.compute is not None:
+			await self.compute.refresh_scenarios(grid)
+		return grid.summary()
 
-	async def get_candle_data(self, contract:str, symbol:str, timeframe:str, period:str='2d', exchange:str="SMART") -> pd.DataFrame:
+	async def get_candle_data(self, contract:str, symbol:str, timeframe:str, period:str='2d', exchange:str="SMART", what_to_show:str='MIDPOINT', use_rth:bool=True, timeout:float=None) -> pd.DataFrame:
 		"""
 		Returns candle data of a ticker\n
+		Served from the bar cache, only bars newer than the cached ones are requested\n
+		A timeout bounds the whole call, pacing waits included, each TWS request is bounded by request_timeout\n
+		Intraday bars are indexed by naive datetimes in the exchange's timezone, daily bars by dates\n
 		"""
 		_tf = {
 			's':"sec",
 			'm':"min",
-			"h":"hour"
+			"h":"hour",
+			"d":"day",
 		}
 
 		# Creating contract
-		c = self._create_contract(contract=contract, symbol=symbol, exchange=exchange)
+		c, = await self.qualify(self._create_contract(contract=contract, symbol=symbol, exchange=exchange), timeout=timeout)
 
 		# Parsing timeframe
 		timeframe = timeframe[:-1] + ' ' + _tf[timeframe[-1]] + ('s' if timeframe[:-1] != '1' else '')
 		
 		# Parsing period
-		period = ' '.join([i.upper() for i in period])
-
-		data = self.client.reqHistoricalData(c, '', barSizeSetting=timeframe, durationStr=period, whatToShow='MIDPOINT', useRTH=True)
-		df = pd.DataFrame([(
-				{
-					"datetime" : i.date,
-					"open" : i.open,
-					"high" : i.high,
-					"low" : i.low,
-					"close" : i.close,
-				}
-			) for i in data])
-		df.set_index('datetime', inplace=True)
+		period = period[:-1] + ' ' + period[-1].upper()
+
+		async def fetch():
+			tz = await self._exchange_timezone(c)
+			return tz, await self.bars.get(c, timeframe, period, whatToShow=what_to_show, useRTH=use_rth, tz=tz)
+
+		tz, bars = await asyncio.wait_for(fetch(), timeout)
+		df = await self._frame({name: bars[name] for name in ("open", "high", "low", "close")}, bars["time"], 'datetime', unit='s')
+		# The index reqHistoricalData gave with TWS in the exchange's timezone
+		if timeframe.endswith("day"):
+			df.index = pd.Index(df.index.date, name='datetime')
+		else:
+			df.index = df.index.tz_convert(tz).tz_localize(None)
 		return df
 
+	async def _exchange_timezone(self, contract:Contract, timeout:float=None) -> str:
+		"""
+		Returns the timezone a contract's sessions are dated in, from its contract details\n
+		"""
+		tz = self.timezones.get(contract.conId)
+		if tz is None:
+			details = await self._paced(self.md.reqContractDetailsAsync, contract, timeout=timeout)
+			tz = self.timezones[contract.conId] = (details[0].timeZoneId if details else '') or self.CREDS.get('exchange_timezone', 'America/New_York')
+		return tz
+
+	async def stream_bars(self, contract:Contract, timeframes:tuple=None, source:str="ticks", what_to_show:str='MIDPOINT', use_rth:bool=False) -> BarBuilder:
+		"""
+		Builds live bars of a contract at every timeframe, seeded from the bar cache so they start warm\n
+		source is "ticks" (one market data line) or "realtime" (reqRealTimeBars, feeds 5s multiples only)\n
+		Returns the bar builder, subscribe to its barClosedEvent\n
+		"""
+		if not contract.conId:
+			contract, = await self.qualify(contract)
+		known = set(self.candles.rings.get(contract.conId, ()))
+		rings = self.candles.watch(contract, timeframes)
+		fresh = [seconds for seconds in rings if seconds not in known]
+
+		# The tail is always refetched so the seed ends at the first live tick
+		history = await asyncio.gather(*(
+			self.bars.get(
+				contract, bar_size(seconds), tail_duration(rings[seconds].capacity * seconds, bar_size(seconds)),
+				whatToShow=what_to_show, useRTH=use_rth, max_age=0,
+			)
+			for seconds in fresh
+		))
+		for seconds, bars in zip(fresh, history):
+			self.candles.seed(contract, seconds, bars)
+
+		if contract.conId not in self.candles.tickers and contract.conId not in self.realtime_bars:
+			if source == "realtime":
+				self.realtime_bars[contract.conId] = self._request_realtime_bars(contract, what_to_show, use_rth)
+			else:
+				self.candles.attach(await self.lines.subscribe(contract))
+		self.candles.start()
+		return self.candles
+
+	def _request_realtime_bars(self, contract:Contract, what_to_show:str, use_rth:bool) -> RealTimeBarList:
+		bars = self.md.reqRealTimeBars(contract, 5, what_to_show, use_rth)
+		bars.updateEvent += self.candles.on_realtime_bars
+		return bars
+
+	def _on_bars_moved(self, bars:RealTimeBarList, moved:RealTimeBarList) -> None:
+		# A data connection dropped, the pool resubscribed on another one
+		conId = bars.contract.conId
+		if self.realtime_bars.get(conId) is bars:
+			bars.updateEvent -= self.candles.on_realtime_bars
+			moved.updateEvent += self.candles.on_realtime_bars
+			self.realtime_bars[conId] = moved
+
+	def cancel_bars(self, contract:Contract) -> None:
+		"""
+		Stops building bars of a contract and frees its feed\n
+		"""
+		if self.candles.unwatch(contract) is not None:
+			self.lines.release(contract)
+		bars = self.realtime_bars.pop(contract.conId, None)
+		if bars is not None:
+			bars.updateEvent -= self.candles.on_realtime_bars
+			self.md.cancelRealTimeBars(bars)
+
 	async def place_order(
 			self, 
 			contract:str, 
@@ -232,27 +830,89 @@ class IBTWSAPI:
 			order_type:str="MARKET", 
 			price:float=..., 
 			exchange:str="SMART",
+			expiry:str=...,
+			strike:float=...,
+			right:str=...,
 		) -> dict:
 		"""
 		Places order in TWS account\n
+		expiry, strike and right pick the contract of "options"\n
 		"""
 		
 		# Creating contract
-		c = self._create_contract(contract=contract, symbol=symbol, exchange=exchange)
+		c, = await self.qualify(self._create_contract(contract=contract, symbol=symbol, exchange=exchange, expiry=expiry, strike=strike, right=right))
 
 		# Parsing order type
-		if order_type.upper() == "MARKET":
-			order = MarketOrder(action=side.upper(), totalQuantity=quantity)
-		elif order_type.upper() == "LIMIT":
-			order = LimitOrder(action=side.upper(), totalQuantity=quantity, lmtPrice=price)
-		elif order_type.upper() == "STOP":
-			order = StopOrder(action=side.upper(), totalQuantity=quantity, stopPrice=price)
+		order = self._create_order(side, quantity, order_type, price)
 
-		order_info = self.client.placeOrder(contract=c, order=order)
+		order_info = self.risk.placeOrder(contract=c, order=order)
 		return order_info
 
+	async def place_multi_leg(
+			self,
+			legs:list,
+			quantity:int=1,
+			combo:bool=False,
+			order_type:str="MARKET",
+			price:float=...,
+			timeout:float=None,
+			order_ref:str="",
+		) -> dict:
+		"""
+		Places several legs at once, as one BAG combo or as concurrent orders sharing one completion\n
+		legs are (contract, side) or (contract, side, ratio) tuples, qualified in one batch\n
+		order_ref tags the orders with their owner, risk checks duplicates per owner\n
+		On timeout every unfilled leg is cancelled\n
+		"""
+		legs = [(c, side.upper(), rest[0] if rest else 1) for c, side, *rest in legs]
+		contracts = await self.qualify(*(c for c, _, _ in legs))
+		missing = [c for c in contracts if not c.conId]
+		if missing:
+			raise ValueError(f"Failed to qualify {missing}")
+
+		fill_times = {}
+		t0 = time.perf_counter()
+
+		def on_fill(trade, fill):
+			fill_times[fill.contract.conId] = time.perf_counter() - t0
+
+		if combo:
+			bag = Contract(
+				secType="BAG", symbol=contracts[0].symbol, exchange="SMART", currency=contracts[0].currency or "USD",
+				comboLegs=[ComboLeg(conId=c.conId, ratio=ratio, action=side, exchange=c.exchange or "SMART") for c, (_, side, ratio) in zip(contracts, legs)],
+			)
+			order = self._create_order("BUY", quantity, order_type, price)
+			order.orderRef = order_ref
+			trades = [self.risk.placeOrder(bag, order)]
+		else:
+			trades = []
+			try:
+				for c, (_, side, ratio) in zip(contracts, legs):
+					order = self._create_order(side, quantity * ratio, order_type, price)
+					order.orderRef = order_ref
+					trades.append(self.risk.placeOrder(c, order))
+			except OrderRejected:
+				# No half hedges, legs already sent are pulled back
+				for trade in trades:
+					self.client.cancelOrder(trade.order)
+				raise
+
+		await asyncio.wait_for(asyncio.gather(*(self.orders.track(t, on_fill) for t in trades)), timeout)
+
+		times = [fill_times.get(c.conId, math.nan) * 1e3 for c in contracts]
+		return {
+			"trades": trades,
+			"legs": [
+				{"contract": c, "side": side, "ratio": ratio, "fill_ms": ms}
+				for c, (_, side, ratio), ms in zip(contracts, legs, times)
+			],
+			"skew_ms": max(times) - min(times),
+			"elapsed_ms": (time.perf_counter() - t0) * 1e3,
+		}
+
 	async def simple_order(self, c, order):
-		return self.client.placeOrder(c, order)
+		c, = await self.qualify(c)
+		return self.risk.placeOrder(c, order)
 
 	async def place_bracket_order(
 			self, 
@@ -265,13 +925,17 @@ class IBTWSAPI:
 			strike:float=None,
 			right:str=None,
 			trailingpercent:float=False,
+			timeout:float=None,
+			on_fill=None,
+			order_ref:str="",
 		) -> dict:
 		"""
-		Places a bracket order\n
+		Places a bracket order and waits for the entry to be done\n
+		order_ref tags both orders with their owner, risk checks duplicates per owner\n
 		"""
 		get_exit_side = "BUY"
 		# Creating contract
-		c = self._create_contract(contract="options", symbol=symbol, exchange="SMART", expiry=expiry, strike=strike, right=right)
+		c, = await self.qualify(self._create_contract(contract="options", symbol=symbol, exchange="SMART", expiry=expiry, strike=strike, right=right))
 
 		entry_order_info, stoploss_order_info, targetprofit_order_info = None, None, None
 
@@ -281,6 +945,7 @@ class IBTWSAPI:
 		en_order = LimitOrder(action="SELL", totalQuantity=quantity, lmtPrice=price)
 		en_order.orderId = parent_id
 		en_order.transmit = False
+		en_order.orderRef = order_ref
 
 		# Stoploss order
 		if trailingpercent:
@@ -303,33 +968,28 @@ class IBTWSAPI:
 		# 	tp_order.parentId = en_order.orderId
 		# 	tp_order.transmit = True
 
-		entry_order_info = self.client.placeOrder(contract=c, order=en_order)
-		self.client.sleep(1)
-		if stoploss:
-			stoploss_order_info = self.client.placeOrder(contract=c, order=sl_order)
-			print("waiting for order to be placed")
-			n = 0
-			while True:  # Wait for up to 10 seconds
-				# Wait for 1 second before checking the order status
-				if entry_order_info.isDone():
-					# Order was filled
-					print("Order placed successfully")
-					fill_price = entry_order_info.orderStatus.avgFillPrice
-					print(stoploss_order_info)
-					print("Fill price:", fill_price)
-					x = fill_price
-					return {
-						"parent_id": parent_id,
-						"entry": entry_order_info,
-						"stoploss": stoploss_order_info,
-						"targetprofit": targetprofit_order_info,
-						"contract": c,
-						"order": sl_order,
-						"avgFill": x
-					}
-				else:
-					print(f"Waiting... {n + 1} seconds")
-					await asyncio.sleep(1)
+		entry_order_info = self.risk.placeOrder(contract=c, order=en_order)
+		if trailingpercent or stoploss:
+			sl_order.orderRef = order_ref
+			try:
+				stoploss_order_info = self.risk.placeOrder(contract=c, order=sl_order)
+			except OrderRejected:
+				# The entry was not transmitted, it must not wait in TWS without its stop
+				self.client.cancelOrder(en_order)
+				raise
+		else:
+			sl_order = None
+
+		entry_order_info = await self.orders.wait(entry_order_info, timeout=timeout, on_fill=on_fill)
+		return {
+			"parent_id": parent_id,
+			"entry": entry_order_info,
+			"stoploss": stoploss_order_info,
+			"targetprofit": targetprofit_order_info,
+			"contract": c,
+			"order": sl_order,
+			"avgFill": entry_order_info.orderStatus.avgFillPrice
+		}
 		# self.client.sleep(1)
 		# if targetprofit:
 		# 	targetprofit_order_info = self.client.placeOrder(contract=c, order=tp_order)
@@ -337,26 +997,33 @@ class IBTWSAPI:
 	# async def modify_order(self, order_id:int, params = {}) -> None:
 	# 	self.client.
 
-	async def cancel_order(self, order_id:int) -> None:
+	async def cancel_order(self, order_id:int, timeout:float=None):
 		"""
 		Cancel open order\n
+		Waits until TWS confirms it is done and returns the trade, asyncio.TimeoutError after timeout\n
 		"""
-		orders = self.client.reqOpenOrders()
-		for order in orders:
-			if order.orderId == order_id:
-				self.client.cancelOrder(order=order)
-
-	async def query_order(self, order_id:int) -> dict:
+		trade = self.store.get(order_id)
+		if trade is None:
+			return None
+		if not trade.isDone():
+			self.client.cancelOrder(order=trade.order)
+			if order_id in self.store.open_ids:
+				# Orders unknown to TWS since a reconnect get no confirmation
+				await self.orders.wait(trade, timeout=self._timeout(timeout), cancel=False)
+		return trade
+
+	async def query_order(self, order_id:int, timeout:float=None) -> dict:
 		"""
-		Queries order\n
+		Queries order by permId\n
+		Orders of earlier sessions are looked up in TWS's completed orders\n
 		"""
+		trade = self.store.by_perm_id(order_id)
+		if trade is not None:
+			return trade.order
 
-		all_orders = self.client.openOrders() + [i.order for i in self.client.reqCompletedOrders(True)]
-		
-		for order in all_orders:
-			print(order)
-			if order.permId == order_id:
-				return order
+		for trade in await asyncio.wait_for(self.client.reqCompletedOrdersAsync(True), self._timeout(timeout)):
+			if trade.order.permId == order_id:
+				return trade.order
 
 	# async def modify_trailing_stop_percent(self, order_id, new_trailing_percent):
 	# 	# Get the existing order
@@ -394,68 +1061,94 @@ class IBTWSAPI:
 			exchange=exchange,
 		)
 
-		# Qualify the contract
-		self.client.qualifyContracts(option_contract)
+		premium_price, = await self.get_premium_prices([option_contract])
+		return premium_price
 
-		# Request market data
-		market_data = self.client.reqMktData(option_contract, '', snapshot=True)
+	async def get_premium_prices(self, contracts:list, timeout:float=5) -> list:
+		"""
+		Returns bid/ask/last/mid of many contracts, fetched concurrently\n
+		Quotes still missing at the deadline are returned as NaN\n
+		"""
+		loop = asyncio.get_event_loop()
+		deadline = loop.time() + timeout
+		contracts = await self.qualify(*contracts, timeout=timeout)
+		self.md.reqMarketDataType(4)
+
+		async def quote(contract):
+			# Lines stay warm after release, repeated quotes of a contract cost no request
+			try:
+				ticker = await self.lines.subscribe(contract, timeout=max(deadline - loop.time(), 0))
+			except asyncio.TimeoutError:
+				return {"bid": math.nan, "ask": math.nan, "last": math.nan, "mid": None}
+			try:
+				await asyncio.wait_for(self._wait_quote(ticker), max(deadline - loop.time(), 0))
+			except asyncio.TimeoutError:
+				pass
+			finally:
+				self.lines.release(contract)
+
+			return {
+				"bid": ticker.bid,
+				"ask": ticker.ask,
+				"last": ticker.last,
+				"mid": (ticker.bid + ticker.ask) / 2 if ticker.bid and ticker.ask else None
+			}
 
-		self.client.reqMarketDataType(4)
-		while util.isNan(market_data.last):
-			await asyncio.sleep(10)
+		return await asyncio.gather(*(quote(c) for c in contracts))
 
-		# Extract relevant prices
-		premium_price = {
-			"bid": market_data.bid,
-			"ask": market_data.ask,
-			"last": market_data.last,
-			"mid": (market_data.bid + market_data.ask) / 2 if market_data.bid and market_data.ask else None
-		}
-		return premium_price
+	@staticmethod
+	async def _wait_quote(ticker) -> None:
+		while util.isNan(ticker.bid) or util.isNan(ticker.ask):
+			await ticker.updateEvent
+
+	@staticmethod
+	async def _wait_last(ticker) -> None:
+		while util.isNan(ticker.last):
+			await ticker.updateEvent
 
 	async def modify_option_trail_percent(self, trade, new_trailing_percent=0.14):
 		"""
-        Asynchronously modify the trailing percentage for an option order
+        Modify the trailing percentage of a live option order in place
 
         Args:
-            ib: IB instance that is already connected
             trade: Existing trade object
             new_trailing_percent: New trailing percentage value (default 0.14)
 
         Returns:
-            Modified order object
+            The same trade, now carrying the modified order
         """
-		# Create modified order maintaining all original parameters
-		modified_order = Order(
-			orderId=trade.order.orderId,
-			action=trade.order.action,
-			totalQuantity=trade.order.totalQuantity,
-			orderType='TRAIL',
-			tif=trade.order.tif,
-			ocaGroup=trade.order.ocaGroup,
-			ocaType=trade.order.ocaType,
-			parentId=trade.order.parentId,
-			displaySize=trade.order.displaySize,
-			trailStopPrice=trade.order.trailStopPrice,
-			trailingPercent=new_trailing_percent,  # Modified trailing percent
-			openClose=trade.order.openClose,
-			account=trade.order.account,
-			clearingIntent=trade.order.clearingIntent,
-			dontUseAutoPriceForHedge=trade.order.dontUseAutoPriceForHedge
-		)
-
-		# Cancel existing order
-		self.client.cancelOrder(trade.order)
-
-		# Wait a brief moment to ensure cancellation is processed
-		self.client.sleep(0.2)
-
-		# Place new order with modified trailing percent
-		new_trade = self.client.placeOrder(trade.contract, modified_order)
+		# Same orderId is sent again, TWS treats it as a modification
+		previous = trade.order.trailingPercent
+		trade.order.trailingPercent = new_trailing_percent
+		try:
+			return self.risk.placeOrder(trade.contract, trade.order)
+		except OrderRejected:
+			# TWS still holds the previous order
+			trade.order.trailingPercent = previous
+			raise
+
+	async def manage_trailing_stop(self, trade, reference:float, trigger:float=0.05, step:float=0.01, floor:float=0.01, owner:str=None, percent:float=None) -> TrailingStopManager:
+		"""
+		Starts an event-driven manager for a live TRAIL order\n
+		The first step tightens from percent, the order's trailingPercent when None\n
+		With an owner the ticks come through the hub, queued and accounted to that owner\n
+		"""
+		# The stop's line is pinned while the manager runs
+		self.lines.pin(trade.contract)
+		manager = TrailingStopManager(self.risk, trade, reference, trigger=trigger, step=step, floor=floor, data_client=self.lines, percent=percent)
+		if owner is None:
+			manager.start()
+		else:
+			asyncio.ensure_future(manager.follow(await self.hub.stream(trade.contract, owner)))
+		self.stops[trade.order.orderId] = manager
 
-		self.client.sleep(10)
+		async def unpin():
+			await manager.wait()
+			self.stops.pop(trade.order.orderId, None)
+			self.lines.unpin(trade.contract)
 
-		return new_trade
+		asyncio.ensure_future(unpin())
+		return manager
 
 	# Example usage:
 	"""
@@ -530,12 +1223,12 @@ if __name__ == "__main__":
 	# print(is_connected_to_tws)
 
 	# NOTE Get account info
-	# account_info = api.get_account_info()
+	# account_info = await api.get_account_info_async()
 	# print(account_info)
 	# [print(i) for i in account_info]
 
 	# NOTE Get account balance
-	# balance = api.get_account_balance()
+	# balance = await api.get_account_balance_async()
 	# print(balance)
 
 	# NOTE Get contract info
@@ -1,13 +1,11 @@
-from new_broker import IBTWSAPI
+from ib_wrapper import IBTWSAPI
 import credentials
 import asyncio
+import math
 from ib_insync import *
-import nest_asyncio
 import time
 import threading
 
-nest_asyncio.apply()
-
 creds = {
     "host": '127.0.0.1',  # Local host
     "port": 7497,  # Paper trading port
@@ -17,25 +15,45 @@ creds = {
 
 class Strategy:
 
-    def __init__(self):
+    def __init__(self, broker=None, symbol="SPX", expiry=credentials.date, exchange="SMART", index_exchange="CBOE",
+                 atm_sl=0.15, percent=0.15, hedge_offset=10, hedge_combo=False, hedge=False, name=None,
+                 max_scenario_loss=None, hedge_offsets=None):
+        self.symbol = symbol
+        self.expiry = expiry
+        self.exchange = exchange
+        self.index_exchange = index_exchange
+        self.hedge_offset = hedge_offset
+        self.hedge_combo = hedge_combo
+        self.hedge = hedge
+        # Worst scenario loss the hedge has to bring the book within, None always hedges at hedge_offset
+        self.max_scenario_loss = max_scenario_loss
+        self.hedge_offsets = hedge_offsets or (hedge_offset,)
+        self.name = name or f"{symbol}-{expiry}-{atm_sl}"
         self.atm_call_parendID = None
         self.closest_current_price = 5860
         self.otm_closest_call = None
         self.otm_closest_put = None
-        self.broker = IBTWSAPI(creds=creds)
+        self.broker = broker or IBTWSAPI(creds=creds)
         self.strikes = None
-        self.atm_sl = 0.15
-        self.percent = 0.15
+        self.atm_sl = atm_sl
+        self.percent = percent
         self.atm_call_fill = None
+        self.atm_call_sl_trade = None
+        self.trail_manager = None
 
     async def main(self):
         print("\n1. Testing connection...")
         connected = await self.broker.connect()
         print(f"Connection status: {connected}")
-        self.strikes = await self.broker.fetch_strikes("SPX", "SMART")
+        await self.run()
+
+    async def run(self):
+        # Strikes, underlying price and the ATM call are fetched concurrently
+        self.strikes, _, _ = await self.broker.warm_up(self.symbol, self.expiry, self.exchange, rights=("C",))
 
-        # await self.place_hedge_orders()
-        await self.place_atm_call_order(0.15)
+        if self.hedge:
+            await self.place_hedge_orders()
+        await self.place_atm_call_order(self.atm_sl)
         # await asyncio.sleep(10)
         # k = await self.broker.get_open_orders()
         # print(k)
@@ -43,95 +61,109 @@ class Strategy:
         #
         # x = await self.broker.modify_option_trail_percent(k[0], 0.14)
         # print(x)
-        asyncio.run(self.atm_call_trail_sl())
-
-    async def atm_call_trail_sl(self): #isn't able to modify existing trail order tries to place new trail order
-        while True:
-            k = await self.broker.get_latest_premium_price("SPX", credentials.date, self.closest_current_price, "C")
-            check = k['mid']
-            print("check1")
-            if check <= 0.95 * self.closest_current_price:
-                print("check2")
-                if self.percent > 0.01:
-                    print("check3")
-                    self.percent -= 0.01
-                    print(self.atm_call_parendID)
-                    # await self.broker.cancel_order(self.atm_call_parendID)
-                    c = Option(symbol="SPX", lastTradeDateOrContractMonth=credentials.date,
-                               strike=self.closest_current_price, right='C', exchange='SMART', currency="USD")
-                    order = Order(action='BUY', totalQuantity=1, orderType='TRAIL', parentId=self.atm_call_parendID,
-                                  trailingPercent=self.percent)
-                    await self.broker.simple_order(c, order)
-
-                else:
-                    break
+        await self.atm_call_trail_sl()
 
+    async def atm_call_trail_sl(self):
+        # Tighten the live TRAIL by 1% each time the premium drops 5% below the last reference, starting from percent
+        self.trail_manager = await self.broker.manage_trailing_stop(self.atm_call_sl_trade, reference=self.atm_call_fill,
+                                                                    trigger=0.05, step=0.01, floor=0.01, owner=self.name,
+                                                                    percent=self.percent)
+        await self.trail_manager.wait()
+        print(self.trail_manager.stats())
 
     async def place_hedge_orders(self):
-        current_price = await self.broker.current_price("SPX")
-        closest_strike = min(self.strikes, key=lambda x: abs(x - current_price))
-        self.otm_closest_call = closest_strike + 10
-        self.otm_closest_put = closest_strike - 10
-        spx_contract_call = Option(
-            symbol="SPX",
-            lastTradeDateOrContractMonth=credentials.date,
-            strike=self.otm_closest_call,
-            right='C',
-            exchange="SMART"
-        )
-        await self.broker.place_market_order(contract=spx_contract_call, qty=1, side="BUY")
-
-        spx_contract_call = Option(
-            symbol="SPX",
-            lastTradeDateOrContractMonth=credentials.date,
-            strike=self.otm_closest_put,
-            right='P',
-            exchange="SMART"
-        )
-        await self.broker.place_market_order(contract=spx_contract_call, qty=1, side="BUY")
+        current_price = await self.broker.current_price(self.symbol, self.index_exchange)
+        closest_strike = self.strikes.nearest(current_price)
+        offset = self.hedge_offset
+        if self.max_scenario_loss is not None:
+            offset = await self.choose_hedge_offset(closest_strike)
+            if offset is None:
+                print("Scenario loss within limit, no hedge needed")
+                return None
+        self.otm_closest_call = self.strikes.ceil(closest_strike + offset)
+        self.otm_closest_put = self.strikes.floor(closest_strike - offset)
+        # Both legs are qualified together and in flight at once
+        hedge = await self.broker.place_multi_leg([
+            (self.hedge_contract(self.otm_closest_call, 'C'), "BUY"),
+            (self.hedge_contract(self.otm_closest_put, 'P'), "BUY"),
+        ], combo=self.hedge_combo, order_ref=self.name)
+        print(f"Hedge filled in {hedge['elapsed_ms']:.1f}ms, leg skew {hedge['skew_ms']:.1f}ms")
+        return hedge
+
+    async def choose_hedge_offset(self, closest_strike):
+        """
+        Picks the farthest (cheapest) hedge offset whose strangle keeps the worst scenario loss within
+        max_scenario_loss, the one with the smallest worst loss when none does, None when no hedge is needed
+        The book is judged with the ATM call this strategy is about to sell
+        """
+        grid = await self.broker.scenario_grid(self.symbol, self.index_exchange)
+        atm, = await self.broker.qualify(self.hedge_contract(closest_strike, 'C'))
+        atm_quote, = await self.broker.get_premium_prices([atm])
+        # Sold at the bid and valued at the mid, the spread given up is a loss in every scenario
+        planned = [(atm, -1, atm_quote["bid"], atm_quote["mid"] or atm_quote["bid"])] if not math.isnan(atm_quote["bid"]) else []
+        if grid.worst(grid.what_if(planned))["pnl"] >= -self.max_scenario_loss:
+            return None
+
+        best = None
+        for offset in sorted(self.hedge_offsets, reverse=True):
+            legs = await self.broker.qualify(
+                self.hedge_contract(self.strikes.ceil(closest_strike + offset), 'C'),
+                self.hedge_contract(self.strikes.floor(closest_strike - offset), 'P'),
+            )
+            quotes = await self.broker.get_premium_prices(legs)
+            if any(math.isnan(q["ask"]) for q in quotes):
+                continue
+            # Bought at the ask and valued at the mid, the spread paid shows up as loss in every scenario
+            worst = grid.worst(grid.what_if(planned + [(c, 1, q["ask"], q["mid"] or q["ask"]) for c, q in zip(legs, quotes)]))["pnl"]
+            print(f"Hedge offset {offset}: worst scenario {worst:.2f}")
+            if worst >= -self.max_scenario_loss:
+                return offset
+            if best is None or worst > best[1]:
+                best = (offset, worst)
+        return best[0] if best is not None else self.hedge_offset
 
     async def close_open_hedges(self, close_put=False, close_call=False):
+        legs = []
         if close_call:
-            spx_contract_call = Option(
-                symbol="SPX",
-                lastTradeDateOrContractMonth=credentials.date,
-                strike=self.otm_closest_call,
-                right='C',
-                exchange="SMART"
-            )
-            await self.broker.place_market_order(contract=spx_contract_call, qty=1, side="SELL")
+            legs.append((self.hedge_contract(self.otm_closest_call, 'C'), "SELL"))
         if close_put:
-            spx_contract_put = Option(
-                symbol="SPX",
-                lastTradeDateOrContractMonth=credentials.date,
-                strike=self.otm_closest_call,
-                right='P',
-                exchange="SMART"
-            )
-            await self.broker.place_market_order(contract=spx_contract_put, qty=1, side="SELL")
+            legs.append((self.hedge_contract(self.otm_closest_put, 'P'), "SELL"))
+        if legs:
+            return await self.broker.place_multi_leg(legs, combo=self.hedge_combo and len(legs) > 1, order_ref=self.name)
+
+    def hedge_contract(self, strike, right):
+        return Option(
+            symbol=self.symbol,
+            lastTradeDateOrContractMonth=self.expiry,
+            strike=strike,
+            right=right,
+            exchange=self.exchange
+        )
 
     async def place_atm_call_order(self, sl):
-        current_price = await self.broker.current_price("SPX", "CBOE")
-        self.closest_current_price = min(self.strikes, key=lambda x: abs(x - current_price))
-        premium_price = await self.broker.get_latest_premium_price("SPX", credentials.date, self.closest_current_price, "C")
+        current_price = await self.broker.current_price(self.symbol, self.index_exchange)
+        self.closest_current_price = self.strikes.nearest(current_price)
+        premium_price = await self.broker.get_latest_premium_price(self.symbol, self.expiry, self.closest_current_price, "C", exchange=self.exchange)
 
         spx_contract = Option(
-            symbol="SPX",
-            lastTradeDateOrContractMonth=credentials.date,
+            symbol=self.symbol,
+            lastTradeDateOrContractMonth=self.expiry,
             strike=self.closest_current_price,
             right='C',
-            exchange="SMART"
+            exchange=self.exchange
         )
 
         # Qualify the contract
-        qualified_contracts = self.broker.client.qualifyContracts(spx_contract)
-        if not qualified_contracts:
+        spx_contract, = await self.broker.qualify(spx_contract)
+        if not spx_contract.conId:
             raise ValueError("Failed to qualify contract with IBKR.")
 
-        k = await self.broker.place_bracket_order(symbol="SPX", quantity=1, price=premium_price, expiry=credentials.date,
-                                                  strike=self.closest_current_price, right="C", trailingpercent=sl)
+        k = await self.broker.place_bracket_order(symbol=self.symbol, quantity=1, price=premium_price['mid'], expiry=self.expiry,
+                                                  strike=self.closest_current_price, right="C", trailingpercent=sl,
+                                                  order_ref=self.name)
         self.atm_call_parendID = k['parent_id']
         self.atm_call_fill = k['avgFill']
+        self.atm_call_sl_trade = k['stoploss']
         print(k)
 
 
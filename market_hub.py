@@ -0,0 +1,155 @@
+"""
+Market data fan-out for many consumers in one process
+
+	Each contract is subscribed once, through the line budget, and every
+	update is pushed to the bounded queue of each interested consumer. A full
+	queue drops its oldest tick (the ticker itself always holds the latest
+	quote), so a slow consumer loses ticks instead of stalling the others.
+"""
+
+# Importing built-in libraries
+import asyncio
+import time
+from collections import defaultdict, deque
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+
+
+class TickStream:
+	"""
+	Async iterator of tickers for one consumer\n
+	"""
+
+	def __init__(self, hub, contract, owner:str, maxsize:int=64):
+
+		self.hub = hub
+		self.contract = contract
+		self.owner = owner
+		self.queue = deque(maxlen=maxsize)
+		self.closed = False
+		self.ticks = 0
+		self.dropped = 0
+		self.cpu = 0.0
+		self.latencies = deque(maxlen=4096)
+		self._ready = asyncio.Event()
+
+	def push(self, stamp:float, ticker) -> None:
+		if len(self.queue) == self.queue.maxlen:
+			self.dropped += 1
+		self.queue.append((stamp, ticker))
+		self._ready.set()
+
+	def close(self) -> None:
+		if not self.closed:
+			self.closed = True
+			# Queued ticks are not handed out once closed
+			self.queue.clear()
+			self._ready.set()
+			self.hub._remove(self)
+
+	def __aiter__(self):
+		return self
+
+	async def __anext__(self):
+		while not self.queue:
+			if self.closed:
+				raise StopAsyncIteration
+			self._ready.clear()
+			await self._ready.wait()
+		stamp, ticker = self.queue.popleft()
+		self.ticks += 1
+		self.latencies.append(time.perf_counter() - stamp)
+		return ticker
+
+	async def run(self, handler) -> None:
+		"""
+		Calls handler(ticker) for every tick until closed\n
+		Only the handler's own synchronous step counts as consumer CPU, not other tasks run between ticks\n
+		"""
+		async for ticker in self:
+			t0 = time.thread_time()
+			try:
+				handler(ticker)
+			finally:
+				self.cpu += time.thread_time() - t0
+
+	def stats(self) -> dict:
+		out = {"ticks": self.ticks, "dropped": self.dropped, "cpu_ms": self.cpu * 1e3}
+		if self.latencies:
+			lat = np.fromiter(self.latencies, dtype=np.float64) * 1e3
+			out["p50_ms"] = float(np.percentile(lat, 50))
+			out["p99_ms"] = float(np.percentile(lat, 99))
+		return out
+
+
+class MarketDataHub:
+
+	def __init__(self, lines):
+
+		self.lines = lines
+		self.streams = defaultdict(list)	# conId -> [TickStream]
+		self.tickers = {}
+		self.retired = defaultdict(list)	# owner -> stats of closed streams
+		lines.tickerMovedEvent += self.on_moved
+
+	async def stream(self, contract, owner:str, maxsize:int=64) -> TickStream:
+		"""
+		Returns a stream of contract updates for owner, subscribing the contract on first use\n
+		"""
+		conId = contract.conId
+		if conId not in self.tickers:
+			ticker = await self.lines.subscribe(contract)
+			if conId not in self.tickers:
+				self.tickers[conId] = ticker
+				ticker.updateEvent += self.on_update
+			else:
+				self.lines.release(contract)
+		stream = TickStream(self, contract, owner, maxsize)
+		self.streams[conId].append(stream)
+		return stream
+
+	def _remove(self, stream:TickStream) -> None:
+		conId = stream.contract.conId
+		streams = self.streams.get(conId, [])
+		if stream in streams:
+			streams.remove(stream)
+			self.retired[stream.owner].append(stream.stats())
+		if not streams and conId in self.tickers:
+			self.tickers.pop(conId).updateEvent -= self.on_update
+			self.streams.pop(conId, None)
+			self.lines.release(stream.contract)
+
+	def on_update(self, ticker) -> None:
+		stamp = time.perf_counter()
+		for stream in self.streams.get(ticker.contract.conId, ()):
+			stream.push(stamp, ticker)
+
+	def on_moved(self, contract, ticker) -> None:
+		old = self.tickers.get(contract.conId)
+		if old is not None:
+			old.updateEvent -= self.on_update
+			self.tickers[contract.conId] = ticker
+			ticker.updateEvent += self.on_update
+
+	def stats(self) -> dict:
+		"""
+		Returns tick counts, drops, queue latency and CPU per owner\n
+		"""
+		by_owner = defaultdict(list)
+		for owner, stats in self.retired.items():
+			by_owner[owner].extend(stats)
+		for streams in self.streams.values():
+			for stream in streams:
+				by_owner[stream.owner].append(stream.stats())
+
+		out = {}
+		for owner, stats in by_owner.items():
+			out[owner] = {
+				"streams": len(stats),
+				"ticks": sum(s["ticks"] for s in stats),
+				"dropped": sum(s["dropped"] for s in stats),
+				"cpu_ms": sum(s["cpu_ms"] for s in stats),
+				"p99_ms": max((s["p99_ms"] for s in stats if "p99_ms" in s), default=0.0),
+			}
+		return out
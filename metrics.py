@@ -0,0 +1,248 @@
+"""
+Hot-path metrics for IBTWSAPI
+
+	Call counts, latency histograms and in-flight gauges for every wrapper
+	coroutine, TWS error codes, pacing violations and event loop lag.
+	Served as Prometheus text over HTTP and/or logged periodically as JSON.
+	Nothing is wrapped until instrument() is called, so disabled costs nothing.
+"""
+
+# Importing built-in libraries
+import asyncio
+import bisect
+import functools
+import inspect
+import json
+import logging
+import math
+import time
+from collections import defaultdict
+
+logger = logging.getLogger("ibtws.metrics")
+
+BUCKETS = (
+	0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+	0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf,
+)
+
+# TWS error codes that mean a pacing limit was hit
+PACING_CODES = {100, 162, 420}
+
+
+class Histogram:
+
+	__slots__ = ("counts", "sum", "count", "max")
+
+	def __init__(self):
+		self.counts = [0] * len(BUCKETS)
+		self.sum = 0.0
+		self.count = 0
+		self.max = 0.0
+
+	def observe(self, value:float) -> None:
+		self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+		self.sum += value
+		self.count += 1
+		if value > self.max:
+			self.max = value
+
+	def quantile(self, q:float) -> float:
+		"""
+		Returns the upper bound of the bucket holding quantile q\n
+		"""
+		if not self.count:
+			return 0.0
+		rank, seen = q * self.count, 0
+		for bound, n in zip(BUCKETS, self.counts):
+			seen += n
+			if seen >= rank:
+				return min(bound, self.max)
+		return self.max
+
+
+class Metrics:
+
+	def __init__(self, prefix:str="ibtws"):
+
+		self.prefix = prefix
+		self.latency = defaultdict(Histogram)
+		self.calls = defaultdict(int)
+		self.failures = defaultdict(int)
+		self.in_flight = defaultdict(int)
+		self.tws_errors = defaultdict(int)
+		self.pacing_violations = 0
+		self.loop_lag = Histogram()
+		self.loop_blocks = 0
+		self.block_threshold = 0.05		# seconds of lag reported as a blocked loop
+		self.started = time.time()
+		self._tasks = []
+		self._server = None
+
+	# Collection
+
+	def wrap(self, name:str, fn):
+		"""
+		Returns fn (a coroutine function) instrumented under name\n
+		"""
+		hist = self.latency[name]
+
+		@functools.wraps(fn)
+		async def wrapper(*args, **kwargs):
+			self.calls[name] += 1
+			self.in_flight[name] += 1
+			t0 = time.perf_counter()
+			try:
+				return await fn(*args, **kwargs)
+			except BaseException:
+				self.failures[name] += 1
+				raise
+			finally:
+				self.in_flight[name] -= 1
+				hist.observe(time.perf_counter() - t0)
+
+		wrapper.__wrapped_metrics__ = True
+		return wrapper
+
+	def instrument(self, obj) -> None:
+		"""
+		Wraps every public coroutine method of obj on the instance\n
+		"""
+		for name, fn in inspect.getmembers(obj, inspect.iscoroutinefunction):
+			if name.startswith("_") or getattr(fn, "__wrapped_metrics__", False):
+				continue
+			setattr(obj, name, self.wrap(name, fn))
+
+	def watch(self, client) -> None:
+		"""
+		Counts TWS error codes and pacing violations of an IB client\n
+		"""
+		client.errorEvent += self.on_error
+
+	def on_error(self, reqId:int, errorCode:int, errorString:str, contract=None) -> None:
+		self.tws_errors[errorCode] += 1
+		if errorCode in PACING_CODES and (errorCode != 162 or "pacing" in errorString.lower()):
+			self.pacing_violations += 1
+
+	async def monitor_loop(self, interval:float=0.1) -> None:
+		"""
+		Measures how late the event loop wakes a sleeping task\n
+		Lag above block_threshold means a callback held the loop that long and is logged\n
+		"""
+		loop = asyncio.get_event_loop()
+		# In asyncio debug mode the loop also names the slow callback
+		loop.slow_callback_duration = self.block_threshold
+		while True:
+			t0 = loop.time()
+			await asyncio.sleep(interval)
+			lag = max(loop.time() - t0 - interval, 0.0)
+			self.loop_lag.observe(lag)
+			if lag > self.block_threshold:
+				self.loop_blocks += 1
+				logger.warning("Event loop blocked for %.1f ms", lag * 1e3)
+
+	async def log_periodically(self, interval:float=60.0) -> None:
+		while True:
+			await asyncio.sleep(interval)
+			logger.info(json.dumps(self.snapshot()))
+
+	# Export
+
+	def snapshot(self) -> dict:
+		return {
+			"uptime": time.time() - self.started,
+			"calls": {
+				name: {
+					"count": h.count,
+					"failures": self.failures[name],
+					"in_flight": self.in_flight[name],
+					"mean_ms": h.sum / h.count * 1e3 if h.count else 0.0,
+					"p50_ms": h.quantile(0.5) * 1e3,
+					"p99_ms": h.quantile(0.99) * 1e3,
+					"max_ms": h.max * 1e3,
+				}
+				for name, h in self.latency.items()
+			},
+			"tws_errors": dict(self.tws_errors),
+			"pacing_violations": self.pacing_violations,
+			"loop_lag_p99_ms": self.loop_lag.quantile(0.99) * 1e3,
+			"loop_lag_max_ms": self.loop_lag.max * 1e3,
+			"loop_blocks": self.loop_blocks,
+		}
+
+	def prometheus(self) -> str:
+		"""
+		Returns the metrics in Prometheus text exposition format\n
+		"""
+		p = self.prefix
+		lines = [f"# TYPE {p}_call_seconds histogram"]
+		for name, h in self.latency.items():
+			lines += self._histogram_lines(f"{p}_call_seconds", h, f'method="{name}",')
+
+		lines.append(f"# TYPE {p}_call_failures_total counter")
+		lines += [f'{p}_call_failures_total{{method="{name}"}} {n}' for name, n in self.failures.items()]
+		lines.append(f"# TYPE {p}_in_flight gauge")
+		lines += [f'{p}_in_flight{{method="{name}"}} {n}' for name, n in self.in_flight.items()]
+		lines.append(f"# TYPE {p}_tws_errors_total counter")
+		lines += [f'{p}_tws_errors_total{{code="{code}"}} {n}' for code, n in self.tws_errors.items()]
+		lines.append(f"# TYPE {p}_pacing_violations_total counter")
+		lines.append(f"{p}_pacing_violations_total {self.pacing_violations}")
+		lines.append(f"# TYPE {p}_loop_lag_seconds histogram")
+		lines += self._histogram_lines(f"{p}_loop_lag_seconds", self.loop_lag, "")
+		lines.append(f"# TYPE {p}_loop_blocks_total counter")
+		lines.append(f"{p}_loop_blocks_total {self.loop_blocks}")
+		return "\n".join(lines) + "\n"
+
+	@staticmethod
+	def _histogram_lines(metric:str, h:Histogram, labels:str) -> list:
+		lines, seen = [], 0
+		for bound, n in zip(BUCKETS, h.counts):
+			seen += n
+			le = "+Inf" if math.isinf(bound) else repr(bound)
+			lines.append(f'{metric}_bucket{{{labels}le="{le}"}} {seen}')
+		labels = labels.rstrip(",")
+		suffix = f"{{{labels}}}" if labels else ""
+		lines.append(f"{metric}_sum{suffix} {h.sum}")
+		lines.append(f"{metric}_count{suffix} {h.count}")
+		return lines
+
+	async def serve(self, host:str="127.0.0.1", port:int=9108) -> None:
+		"""
+		Serves GET /metrics on a local port\n
+		"""
+		async def handle(reader, writer):
+			try:
+				request = await reader.readline()
+				while (await reader.readline()).strip():
+					pass
+				if request.split(b" ")[1:2] == [b"/metrics"]:
+					status, body = "200 OK", self.prometheus().encode()
+				else:
+					status, body = "404 Not Found", b""
+				writer.write(
+					f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+					f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+				await writer.drain()
+			finally:
+				writer.close()
+
+		self._server = await asyncio.start_server(handle, host, port)
+
+	def start(self, port:int=None, log_interval:float=None, lag_interval:float=0.1, block_threshold:float=None) -> None:
+		"""
+		Starts the loop lag monitor, and the HTTP endpoint / periodic logs when asked\n
+		"""
+		if block_threshold is not None:
+			self.block_threshold = block_threshold
+		self._tasks.append(asyncio.ensure_future(self.monitor_loop(lag_interval)))
+		if log_interval:
+			self._tasks.append(asyncio.ensure_future(self.log_periodically(log_interval)))
+		if port:
+			self._tasks.append(asyncio.ensure_future(self.serve(port=port)))
+
+	def stop(self) -> None:
+		for task in self._tasks:
+			task.cancel()
+		self._tasks.clear()
+		if self._server is not None:
+			self._server.close()
+			self._server = None
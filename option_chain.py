@@ -0,0 +1,150 @@
+"""
+Streaming option chain kept in preallocated NumPy arrays
+
+	Quotes are written in place from ticker events, readers get views
+"""
+
+# Importing built-in libraries
+import asyncio
+import math
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+import pandas as pd			# pip install pandas
+
+
+FIELDS = ("bid", "ask", "last", "close", "volume", "mid")
+RIGHTS = ("C", "P")
+
+
+class OptionChain:
+
+	def __init__(self, symbol:str, expiry:str, strikes, rights:tuple=RIGHTS, trading_class:str=""):
+
+		self.symbol = symbol
+		self.expiry = expiry
+		self.trading_class = trading_class	# one class per chain, SPX and SPXW share strikes and expiries
+		self.strikes = np.unique(np.asarray(list(strikes), dtype=np.float64))
+		self.rights = tuple(rights)
+
+		# quotes[strike, right, field]
+		self.quotes = np.full((len(self.strikes), len(self.rights), len(FIELDS)), np.nan)
+		self.bound = np.zeros((len(self.strikes), len(self.rights)), dtype=bool)
+		self.updated = np.zeros_like(self.bound)
+		for n, field in enumerate(FIELDS):
+			setattr(self, field, self.quotes[:, :, n])
+
+		self.contracts = {}
+		self.tickers = {}
+		self._slots = {}
+		self._pending = 0
+		self._ready = asyncio.Event()
+		# Nothing bound is nothing to wait for
+		self._ready.set()
+
+	def __len__(self) -> int:
+		return len(self._slots)
+
+	def slot(self, strike:float, right:str) -> tuple:
+		"""
+		Returns (strike, right) array indices of a contract\n
+		"""
+		i = int(np.searchsorted(self.strikes, strike))
+		if i == len(self.strikes) or self.strikes[i] != strike:
+			raise KeyError(f"Strike {strike} not in chain {self.symbol} {self.expiry}")
+		return i, self.rights.index(right)
+
+	def bind(self, ticker) -> None:
+		"""
+		Maps a streaming ticker onto its slot in the arrays\n
+		Raises ValueError for a contract of another trading class\n
+		"""
+		contract = ticker.contract
+		if self.trading_class and contract.tradingClass and contract.tradingClass != self.trading_class:
+			raise ValueError(f"{contract.tradingClass} contract bound to the {self.trading_class} chain")
+		i, j = self.slot(contract.strike, contract.right)
+		self._slots[contract.conId] = (i, j)
+		self.contracts[(i, j)] = contract
+		self.tickers[(i, j)] = ticker
+		if not self.bound[i, j]:
+			self.bound[i, j] = True
+			self._pending += 1
+			self._ready.clear()
+		self.on_ticker(ticker)
+
+	def unbind(self):
+		"""
+		Forgets every ticker and returns their contracts\n
+		"""
+		contracts = list(self.contracts.values())
+		self._slots.clear()
+		self.contracts.clear()
+		self.tickers.clear()
+		self.bound[:] = False
+		self.updated[:] = False
+		self._pending = 0
+		self._ready.set()
+		return contracts
+
+	def on_ticker(self, ticker) -> None:
+		"""
+		Writes a ticker's latest quote into the arrays\n
+		"""
+		slot = self._slots.get(ticker.contract.conId)
+		if slot is None:
+			return
+		row = self.quotes[slot]
+		bid, ask = ticker.bid, ticker.ask
+		row[0] = bid
+		row[1] = ask
+		row[2] = ticker.last
+		row[3] = ticker.close
+		row[4] = ticker.volume
+		row[5] = (bid + ask) / 2 if bid > 0 and ask > 0 else math.nan
+
+		if not self.updated[slot] and not math.isnan(bid):
+			self.updated[slot] = True
+			self._pending -= 1
+			if self._pending == 0:
+				self._ready.set()
+
+	def on_tickers(self, tickers) -> None:
+		"""
+		Handler for IB.pendingTickersEvent\n
+		"""
+		for ticker in tickers:
+			self.on_ticker(ticker)
+
+	async def wait_ready(self, timeout:float=None) -> bool:
+		"""
+		Waits until every bound contract has received a bid\n
+		"""
+		try:
+			await asyncio.wait_for(self._ready.wait(), timeout)
+			return True
+		except asyncio.TimeoutError:
+			return False
+
+	def frame(self, right:str="C") -> pd.DataFrame:
+		"""
+		Returns a DataFrame view over one right (no copy)\n
+		"""
+		j = self.rights.index(right)
+		return pd.DataFrame(self.quotes[:, j, :], index=pd.Index(self.strikes, name="strike"), columns=FIELDS, copy=False)
+
+	def columns(self) -> dict:
+		"""
+		Returns the long format columns of to_frame as NumPy arrays\n
+		"""
+		i, j = np.nonzero(self.bound)
+		quotes = self.quotes[i, j, :]
+		columns = {"strike": self.strikes[i], "kind": np.asarray(self.rights)[j]}
+		columns.update((name, quotes[:, k]) for k, name in enumerate(FIELDS))
+		return columns
+
+	def to_frame(self) -> pd.DataFrame:
+		"""
+		Returns a long format copy with one row per contract\n
+		"""
+		return pd.DataFrame(self.columns())
+
@@ -0,0 +1,228 @@
+"""
+In-memory order and trade store fed by IB order events
+
+	Indexed by orderId, permId, parentId and conId so lookups, bracket
+	navigation and per-contract queries never go to TWS. Every event can be
+	appended to a JSON-lines journal, which load() folds back into the last
+	known state of each order after a crash.
+"""
+
+# Importing built-in libraries
+import json
+import os
+import time
+from collections import defaultdict
+
+# Importing third-party libraries
+from ib_insync import OrderStatus	# pip install ib_insync
+
+# Status of an order TWS neither works nor reports as completed after a reconnect
+UNKNOWN = "Unknown"
+
+
+class OrderStore:
+
+	def __init__(self, client, journal:str=None):
+
+		self.client = client
+		self.trades = {}					# orderId -> Trade
+		self.perm_ids = {}					# permId -> orderId
+		self.child_ids = defaultdict(list)	# parentId -> [orderId]
+		self.conids = defaultdict(set)		# conId -> {orderId}
+		self.open_ids = set()				# orderIds not done yet
+		self.working = defaultdict(lambda: [0.0, 0.0])	# conId -> [bought, sold] quantity still working
+		self.remaining = {}					# orderId -> (conId, side, remaining) counted in working
+		self.journal = journal
+		self._file = open(journal, "a", buffering=1) if journal else None
+
+		for trade in client.trades():
+			self.add(trade)
+		client.newOrderEvent += self.on_order
+		client.openOrderEvent += self.on_order
+		client.orderModifyEvent += self.on_order
+		client.orderStatusEvent += self.on_status
+		client.execDetailsEvent += self.on_exec
+
+	def close(self) -> None:
+		self.client.newOrderEvent -= self.on_order
+		self.client.openOrderEvent -= self.on_order
+		self.client.orderModifyEvent -= self.on_order
+		self.client.orderStatusEvent -= self.on_status
+		self.client.execDetailsEvent -= self.on_exec
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+	# Indexing
+
+	def add(self, trade) -> None:
+		"""
+		Indexes a trade, replacing an older Trade object of the same orderId\n
+		"""
+		order = trade.order
+		orderId = order.orderId
+		known = self.trades.get(orderId)
+		self.trades[orderId] = trade
+		self._track_open(trade)
+		if order.permId:
+			self.perm_ids[order.permId] = orderId
+		if known is None:
+			if order.parentId:
+				self.child_ids[order.parentId].append(orderId)
+			self.conids[trade.contract.conId].add(orderId)
+
+	def on_order(self, trade) -> None:
+		self.add(trade)
+		self._write("order", trade)
+
+	def _track_open(self, trade) -> None:
+		orderId = trade.order.orderId
+		counted = self.remaining.pop(orderId, None)
+		if counted is not None:
+			conId, side, remaining = counted
+			self.working[conId][side] -= remaining
+		if trade.isDone() or trade.orderStatus.status == UNKNOWN:
+			self.open_ids.discard(orderId)
+			return
+		self.open_ids.add(orderId)
+		# BAG orders count against no single conId
+		if trade.contract.conId:
+			side = 0 if trade.order.action == "BUY" else 1
+			remaining = trade.remaining()
+			self.working[trade.contract.conId][side] += remaining
+			self.remaining[orderId] = (trade.contract.conId, side, remaining)
+
+	def on_status(self, trade) -> None:
+		if trade.order.orderId not in self.trades:
+			self.add(trade)
+		else:
+			self._track_open(trade)
+		if trade.orderStatus.permId:
+			self.perm_ids[trade.orderStatus.permId] = trade.order.orderId
+		self._write("status", trade)
+
+	def on_exec(self, trade, fill) -> None:
+		self._write("fill", trade, execId=fill.execution.execId, shares=fill.execution.shares, price=fill.execution.price)
+
+	def _write(self, event:str, trade, **extra) -> None:
+		if self._file is None:
+			return
+		order, status = trade.order, trade.orderStatus
+		record = {
+			"time": time.time(),
+			"event": event,
+			"orderId": order.orderId,
+			"permId": order.permId or status.permId,
+			"parentId": order.parentId,
+			"conId": trade.contract.conId,
+			"symbol": trade.contract.localSymbol or trade.contract.symbol,
+			"action": order.action,
+			"orderType": order.orderType,
+			"totalQuantity": order.totalQuantity,
+			"lmtPrice": order.lmtPrice,
+			"auxPrice": order.auxPrice,
+			"trailingPercent": order.trailingPercent,
+			"status": status.status,
+			"filled": status.filled,
+			"remaining": status.remaining,
+			"avgFillPrice": status.avgFillPrice,
+			**extra,
+		}
+		self._file.write(json.dumps(record, default=float) + "\n")
+
+	def reconcile(self, working:list, completed:list) -> list:
+		"""
+		Settles the orders open here that TWS stopped working while disconnected\n
+		working and completed are TWS's open and completed trades after the reconnect\n
+		Orders found in neither get status Unknown and leave the open ones, they are returned\n
+		"""
+		working = {t.order.orderId for t in working}
+		final = {t.order.permId: t for t in completed if t.order.permId}
+		unknown = []
+		for orderId in sorted(self.open_ids - working):
+			trade = self.trades[orderId]
+			status = trade.orderStatus
+			done = final.get(trade.order.permId or status.permId)
+			if done is not None:
+				status.status = done.orderStatus.status
+				status.remaining = 0.0
+				if done.orderStatus.filled:
+					status.filled = done.orderStatus.filled
+					status.avgFillPrice = done.orderStatus.avgFillPrice
+			else:
+				status.status = UNKNOWN
+				unknown.append(trade)
+			self._track_open(trade)
+			self._write("status", trade)
+			# Waiters and stop managers bound to the trade see it settle
+			trade.statusEvent.emit(trade)
+		return unknown
+
+	# Lookups
+
+	def get(self, orderId:int):
+		return self.trades.get(orderId)
+
+	def by_perm_id(self, permId:int):
+		orderId = self.perm_ids.get(permId)
+		return self.trades.get(orderId) if orderId is not None else None
+
+	def children(self, orderId:int) -> list:
+		return [self.trades[i] for i in self.child_ids.get(orderId, ())]
+
+	def parent(self, orderId:int):
+		trade = self.trades.get(orderId)
+		return self.trades.get(trade.order.parentId) if trade is not None and trade.order.parentId else None
+
+	def tree(self, orderId:int) -> list:
+		"""
+		Returns the bracket holding orderId, root first\n
+		"""
+		root = self.trades.get(orderId)
+		while root is not None and root.order.parentId in self.trades:
+			root = self.trades[root.order.parentId]
+		if root is None:
+			return []
+		out, stack = [], [root]
+		while stack:
+			trade = stack.pop()
+			out.append(trade)
+			stack.extend(reversed(self.children(trade.order.orderId)))
+		return out
+
+	def for_contract(self, contract, open_only:bool=True) -> list:
+		ids = self.conids.get(contract.conId, set())
+		return [self.trades[i] for i in (ids & self.open_ids if open_only else ids)]
+
+	def open(self) -> list:
+		return [self.trades[i] for i in sorted(self.open_ids)]
+
+	# Recovery
+
+	@staticmethod
+	def load(journal:str) -> dict:
+		"""
+		Folds a journal into the last recorded state per orderId\n
+		"""
+		state = {}
+		if not os.path.exists(journal):
+			return state
+		with open(journal) as f:
+			for line in f:
+				try:
+					record = json.loads(line)
+				except ValueError:
+					# a torn last line from a crash
+					continue
+				fills = state.get(record["orderId"], {}).get("fills", [])
+				if record["event"] == "fill":
+					fills = fills + [(record["execId"], record["shares"], record["price"])]
+				state[record["orderId"]] = {**record, "fills": fills}
+		return state
+
+	@classmethod
+	def unfinished(cls, journal:str) -> dict:
+		"""
+		Returns the journalled orders whose last known status was not final\n
+		"""
+		return {i: r for i, r in cls.load(journal).items() if r["status"] not in OrderStatus.DoneStates}
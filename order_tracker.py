@@ -0,0 +1,92 @@
+"""
+Awaitable order completion driven by Trade events
+
+	Futures resolve from statusEvent callbacks instead of polling isDone()
+"""
+
+# Importing built-in libraries
+import asyncio
+
+
+class OrderTracker:
+
+	def __init__(self, client):
+
+		self.client = client
+		self.pending = {}
+		self._rebind = {}
+
+	def track(self, trade, on_fill=None) -> asyncio.Future:
+		"""
+		Returns a future resolved with the trade once it is done\n
+		on_fill(trade, fill) is called for every (partial) fill\n
+		Cancelling the future cancels the order\n
+		"""
+		future = asyncio.get_event_loop().create_future()
+		if trade.isDone():
+			future.set_result(trade)
+			return future
+		orderId = trade.order.orderId
+		current = [trade]
+
+		def on_status(trade):
+			if trade.isDone() and not future.done():
+				future.set_result(trade)
+
+		def attach(trade):
+			trade.statusEvent += on_status
+			if on_fill is not None:
+				trade.fillEvent += on_fill
+
+		def detach(trade):
+			trade.statusEvent -= on_status
+			if on_fill is not None:
+				trade.fillEvent -= on_fill
+
+		def rebind(trade):
+			detach(current[0])
+			current[0] = trade
+			attach(trade)
+			on_status(trade)
+
+		def on_done(future):
+			trade = current[0]
+			detach(trade)
+			self.pending.pop(orderId, None)
+			self._rebind.pop(orderId, None)
+			if future.cancelled() and not trade.isDone():
+				self.client.cancelOrder(trade.order)
+
+		attach(trade)
+		future.add_done_callback(on_done)
+		self.pending[orderId] = future
+		self._rebind[orderId] = rebind
+		return future
+
+	async def wait(self, trade, timeout:float=None, on_fill=None, cancel:bool=True):
+		"""
+		Waits for the trade to be done\n
+		On timeout the order is cancelled unless cancel is False, then asyncio.TimeoutError is raised\n
+		"""
+		future = self.track(trade, on_fill)
+		if cancel:
+			return await asyncio.wait_for(future, timeout)
+		return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+	def restore(self) -> dict:
+		"""
+		Moves tracking onto the Trade objects of a new session (after a reconnect)\n
+		Returns the session's trades by orderId\n
+		"""
+		trades = {t.order.orderId: t for t in self.client.trades()}
+		for orderId, rebind in list(self._rebind.items()):
+			if orderId in trades:
+				rebind(trades[orderId])
+		return trades
+
+	def cancel_all(self) -> None:
+		"""
+		Cancels every tracked order that is still working\n
+		"""
+		for future in list(self.pending.values()):
+			future.cancel()
@@ -0,0 +1,124 @@
+"""
+Request pacing for the TWS socket
+
+	Token bucket for IB's message rate (~50 msg/s). Any one second window
+	sees at most burst + messages_per_sec messages. Historical data requests
+	go through their own serial queue that keeps to IB's historical pacing rules
+"""
+
+# Importing built-in libraries
+import asyncio
+import contextlib
+import time
+from collections import defaultdict, deque
+
+
+class TokenBucket:
+
+	def __init__(self, rate:float, capacity:float=None):
+
+		self.rate = rate
+		self.capacity = capacity or rate
+		self.tokens = self.capacity
+		self.stamp = time.monotonic()
+		self._lock = asyncio.Lock()
+
+	def _refill(self) -> None:
+		now = time.monotonic()
+		self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+		self.stamp = now
+
+	def try_acquire(self, n:float=1) -> bool:
+		"""
+		Takes n tokens if available without waiting\n
+		"""
+		self._refill()
+		if self.tokens >= n:
+			self.tokens -= n
+			return True
+		return False
+
+	async def acquire(self, n:float=1) -> None:
+		"""
+		Waits until n tokens are available and takes them\n
+		"""
+		async with self._lock:
+			while not self.try_acquire(n):
+				await asyncio.sleep((n - self.tokens) / self.rate)
+
+
+class HistoricalPacer:
+	"""
+	Serial queue for historical data requests\n
+	IB rejects identical requests within 15s, 6 or more requests for one contract\n
+	and tick type within 2s, and more than 60 requests in any 10 minutes\n
+	"""
+
+	def __init__(self, limit:int=60, window:float=600.0, identical:float=15.0, burst:int=5, burst_window:float=2.0):
+
+		self.limit = limit
+		self.window = window
+		self.identical = identical
+		self.burst = burst
+		self.burst_window = burst_window
+		self.sent = deque()					# stamps of requests inside the window
+		self.last = {}						# request -> stamp
+		self.bursts = defaultdict(deque)	# (conId, exchange, whatToShow) -> stamps
+		self.requests = 0
+		self.waited = 0.0
+		self._lock = asyncio.Lock()
+
+	def delay(self, request:tuple, source:tuple, now:float=None) -> float:
+		"""
+		Returns seconds to wait before request may be sent\n
+		"""
+		now = time.monotonic() if now is None else now
+		while self.sent and now - self.sent[0] >= self.window:
+			self.sent.popleft()
+		recent = self.bursts[source]
+		while recent and now - recent[0] >= self.burst_window:
+			recent.popleft()
+
+		wait = 0.0
+		if len(self.sent) >= self.limit:
+			wait = self.sent[0] + self.window - now
+		if len(recent) >= self.burst:
+			wait = max(wait, recent[0] + self.burst_window - now)
+		if request in self.last:
+			wait = max(wait, self.last[request] + self.identical - now)
+		return wait
+
+	@contextlib.asynccontextmanager
+	async def request(self, request:tuple, source:tuple):
+		"""
+		Holds the queue for one historical request, waiting until it is within the rules\n
+		request identifies the full request, source its (conId, exchange, whatToShow)\n
+		"""
+		async with self._lock:
+			while (wait := self.delay(request, source)) > 0:
+				self.waited += wait
+				await asyncio.sleep(wait)
+			now = time.monotonic()
+			self.sent.append(now)
+			self.bursts[source].append(now)
+			self.last[request] = now
+			self.requests += 1
+			yield
+
+
+class PacingScheduler:
+
+	def __init__(self, messages_per_sec:float=40, burst:float=10):
+
+		self.messages = TokenBucket(messages_per_sec, burst)
+		self.historical = HistoricalPacer()
+
+	async def send(self, n:int=1) -> None:
+		"""
+		Waits for budget to send n messages\n
+		More than the bucket holds are paid for in bucket sized chunks\n
+		"""
+		while n > 0:
+			chunk = min(n, self.messages.capacity)
+			await self.messages.acquire(chunk)
+			n -= chunk
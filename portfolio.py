@@ -0,0 +1,172 @@
+"""
+Account, position and P&L state kept current by TWS push events
+
+	accountValueEvent, positionEvent, pnlEvent and pnlSingleEvent update
+	dictionaries keyed by account and conId, so balance, position and P&L
+	reads are lookups, never a summary scan or a round trip. Each account
+	keeps a fixed size ring of snapshots (funds, net liquidation, P&L).
+
+	api.portfolio.available_funds()
+	api.portfolio.position(contract.conId)
+	api.portfolio.history(60)
+"""
+
+# Importing built-in libraries
+import math
+import time
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+
+SNAPSHOT_DTYPE = np.dtype([
+	("time", "<f8"),
+	("available_funds", "<f8"),
+	("net_liquidation", "<f8"),
+	("daily_pnl", "<f8"),
+	("unrealized_pnl", "<f8"),
+	("realized_pnl", "<f8"),
+])
+
+# Account values that change the snapshot
+_SNAPSHOT_TAGS = {"AvailableFunds": "available_funds", "NetLiquidation": "net_liquidation"}
+
+
+class Portfolio:
+
+	def __init__(self, client, history:int=4096, pnl:bool=True):
+
+		self.client = client
+		self.capacity = history
+		self.subscribe_pnl = pnl
+		self.values = {}		# (account, tag, currency) -> float
+		self.positions = {}		# (account, conId) -> Position
+		self.pnl = {}			# (account, conId) -> PnLSingle
+		self.totals = {}		# account -> PnL
+		self.current = {}		# account -> latest snapshot row
+		self.default = ""		# account used when none is given
+		self._history = {}		# account -> (ring, count)
+
+		client.accountValueEvent += self.on_account_value
+		client.positionEvent += self.on_position
+		client.pnlEvent += self.on_pnl
+		client.pnlSingleEvent += self.on_pnl_single
+		self.restore()
+
+	def restore(self) -> None:
+		"""
+		Loads the client's current state and (re)opens the P&L subscriptions, after connecting\n
+		"""
+		accounts = self.client.managedAccounts()
+		self.default = self.default or (accounts[0] if accounts else "")
+		# Subscriptions die with the session
+		self.pnl.clear()
+		self.totals.clear()
+		self.positions.clear()
+		for value in self.client.accountValues():
+			self.on_account_value(value)
+		for position in self.client.positions():
+			self.on_position(position)
+		if self.subscribe_pnl:
+			for account in accounts:
+				self.totals[account] = self.client.reqPnL(account)
+
+	def close(self) -> None:
+		self.client.accountValueEvent -= self.on_account_value
+		self.client.positionEvent -= self.on_position
+		self.client.pnlEvent -= self.on_pnl
+		self.client.pnlSingleEvent -= self.on_pnl_single
+		if self.client.isConnected():
+			for account, conId in self.pnl:
+				self.client.cancelPnLSingle(account, '', conId)
+			for account in self.totals:
+				self.client.cancelPnL(account)
+
+	# Events
+
+	def on_account_value(self, value) -> None:
+		try:
+			amount = float(value.value)
+		except ValueError:
+			# Non numeric tags (AccountType, ...) are not cached
+			return
+		self.values[value.account, value.tag, value.currency] = amount
+		self.default = self.default or value.account
+		field = _SNAPSHOT_TAGS.get(value.tag)
+		if field is not None and value.currency in ("USD", "BASE", ""):
+			self._snapshot(value.account, **{field: amount})
+
+	def on_position(self, position) -> None:
+		key = (position.account, position.contract.conId)
+		self.default = self.default or position.account
+		if position.position:
+			self.positions[key] = position
+			if self.subscribe_pnl and key not in self.pnl:
+				self.pnl[key] = self.client.reqPnLSingle(position.account, '', position.contract.conId)
+		else:
+			self.positions.pop(key, None)
+			if self.pnl.pop(key, None) is not None:
+				self.client.cancelPnLSingle(position.account, '', position.contract.conId)
+
+	def on_pnl(self, pnl) -> None:
+		self.totals[pnl.account] = pnl
+		self._snapshot(pnl.account, daily_pnl=pnl.dailyPnL, unrealized_pnl=pnl.unrealizedPnL, realized_pnl=pnl.realizedPnL)
+
+	def on_pnl_single(self, pnl) -> None:
+		# Late updates of a cancelled subscription are ignored
+		if (pnl.account, pnl.conId) in self.pnl:
+			self.pnl[pnl.account, pnl.conId] = pnl
+
+	def _snapshot(self, account:str, **fields) -> None:
+		row = self.current.get(account)
+		if row is None:
+			row = self.current[account] = np.full((), math.nan, dtype=SNAPSHOT_DTYPE)
+		for name, value in fields.items():
+			row[name] = value
+		row["time"] = time.time()
+
+		ring, count = self._history.get(account) or (np.zeros(self.capacity, dtype=SNAPSHOT_DTYPE), 0)
+		ring[count % self.capacity] = row
+		self._history[account] = (ring, count + 1)
+
+	# Reads
+
+	def value(self, tag:str, currency:str="USD", account:str=None) -> float:
+		"""
+		Returns a numeric account value, NaN until TWS has sent it\n
+		"""
+		return self.values.get((account or self.default, tag, currency), math.nan)
+
+	def available_funds(self, account:str=None) -> float:
+		return self.value("AvailableFunds", account=account)
+
+	def buying_power(self, account:str=None) -> float:
+		return self.value("BuyingPower", account=account)
+
+	def net_liquidation(self, account:str=None) -> float:
+		return self.value("NetLiquidation", account=account)
+
+	def position(self, conId:int, account:str=None) -> float:
+		position = self.positions.get((account or self.default, conId))
+		return position.position if position is not None else 0.0
+
+	def unrealized_pnl(self, conId:int=None, account:str=None) -> float:
+		"""
+		Returns a position's unrealized P&L, or the account's when conId is None\n
+		"""
+		account = account or self.default
+		pnl = self.totals.get(account) if conId is None else self.pnl.get((account, conId))
+		return pnl.unrealizedPnL if pnl is not None else math.nan
+
+	def daily_pnl(self, conId:int=None, account:str=None) -> float:
+		account = account or self.default
+		pnl = self.totals.get(account) if conId is None else self.pnl.get((account, conId))
+		return pnl.dailyPnL if pnl is not None else math.nan
+
+	def history(self, n:int=None, account:str=None) -> np.ndarray:
+		"""
+		Returns the last n snapshots of an account, oldest first\n
+		"""
+		ring, count = self._history.get(account or self.default, (np.zeros(0, dtype=SNAPSHOT_DTYPE), 0))
+		size = min(count, self.capacity)
+		n = size if n is None else min(n, size)
+		return ring[np.arange(count - n, count) % self.capacity] if n else ring[:0]
@@ -0,0 +1,153 @@
+"""
+Pre-trade risk checks between IBTWSAPI and the socket
+
+	Every order and modification goes through RiskGate.placeOrder, which
+	checks it against local state only: positions from the portfolio cache,
+	working orders from the order store and quotes from the market data
+	lines. A failed check raises OrderRejected and nothing is sent.
+
+	Limits left as None are not checked.
+"""
+
+# Importing built-in libraries
+import math
+import time
+from collections import Counter
+
+# Importing project modules
+from pacing import TokenBucket
+
+
+class OrderRejected(ValueError):
+
+	def __init__(self, reason:str, message:str):
+		super().__init__(message)
+		self.reason = reason
+
+
+class RiskGate:
+
+	def __init__(
+			self,
+			client,
+			store,
+			portfolio=None,
+			quotes=None,
+			max_position:float=None,
+			max_open_orders:int=None,
+			max_orders_per_sec:float=None,
+			burst:float=None,
+			duplicate_window:float=None,
+			price_band:float=None,
+			min_band:float=0.0,
+		):
+
+		self.client = client
+		self.store = store
+		self.portfolio = portfolio
+		self.quotes = quotes
+		self.max_position = max_position
+		self.max_open_orders = max_open_orders
+		self.throttle = TokenBucket(max_orders_per_sec, burst) if max_orders_per_sec else None
+		self.duplicate_window = duplicate_window
+		self.price_band = price_band
+		self.min_band = min_band
+		self.recent = {}			# order signature -> monotonic stamp
+		self._swept = time.monotonic()
+		self.checked = 0
+		self.unpriced = 0
+		self.rejected = Counter()	# reason -> count
+
+	def __getattr__(self, name:str):
+		# Stands in for the client wherever orders are sent
+		return getattr(self.client, name)
+
+	def placeOrder(self, contract, order):
+		self.check(contract, order)
+		return self.client.placeOrder(contract, order)
+
+	def _reject(self, reason:str, message:str) -> None:
+		self.rejected[reason] += 1
+		raise OrderRejected(reason, message)
+
+	def check(self, contract, order) -> None:
+		"""
+		Raises OrderRejected unless the order passes every configured check\n
+		A modification (an orderId already in the store) skips the open order and duplicate checks\n
+		Duplicates are per orderRef, strategies sending the same order each get theirs through\n
+		"""
+		self.checked += 1
+		modify = order.orderId in self.store.trades
+		signature = None
+
+		if not modify:
+			if self.max_open_orders is not None and len(self.store.open_ids) >= self.max_open_orders:
+				self._reject("open_orders", f"{len(self.store.open_ids)} orders already working, limit {self.max_open_orders}")
+			if self.duplicate_window is not None:
+				signature = _signature(contract, order)
+				stamp = self.recent.get(signature)
+				if stamp is not None and time.monotonic() - stamp < self.duplicate_window:
+					self._reject("duplicate", f"Same {order.action} {order.totalQuantity} {order.orderType} sent {time.monotonic() - stamp:.3f}s ago")
+
+		if order.orderType == "LMT" and not math.isfinite(order.lmtPrice):
+			self._reject("price", f"Limit {order.lmtPrice} is not a price")
+		if self.max_position is not None:
+			self._check_position(contract, order)
+		if self.price_band is not None and order.orderType == "LMT" and contract.secType != "BAG":
+			self._check_band(contract, order)
+
+		# Only orders that will be sent spend rate budget
+		if self.throttle is not None and not self.throttle.try_acquire():
+			self._reject("rate", f"More than {self.throttle.rate:g} orders per second")
+		if signature is not None:
+			self._remember(signature)
+
+	def _check_position(self, contract, order) -> None:
+		side = 1 if order.action == "BUY" else -1
+		if contract.secType == "BAG":
+			legs = [(leg.conId, side * leg.ratio * (1 if leg.action == "BUY" else -1)) for leg in contract.comboLegs]
+		else:
+			legs = [(contract.conId, side)]
+
+		for conId, ratio in legs:
+			qty = order.totalQuantity * ratio
+			held = self.portfolio.position(conId) if self.portfolio is not None else 0.0
+			# Worst case: every working order on the same side fills too
+			bought, sold = self.store.working.get(conId, (0.0, 0.0))
+			pending = bought if qty > 0 else -sold
+			counted = self.store.remaining.get(order.orderId)
+			if counted is not None and counted[0] == conId and counted[1] == (0 if qty > 0 else 1):
+				# A modification replaces its own working quantity
+				pending -= counted[2] if counted[1] == 0 else -counted[2]
+			projected = held + pending + qty
+			if abs(projected) > self.max_position and abs(held + qty) > abs(held):
+				self._reject("position", f"conId {conId} would reach {projected:g}, limit {self.max_position:g}")
+
+	def _check_band(self, contract, order) -> None:
+		ticker = self.quotes.ticker(contract) if self.quotes is not None else None
+		mid = ticker.midpoint() if ticker is not None else math.nan
+		if math.isnan(mid) or mid <= 0:
+			self.unpriced += 1
+			return
+		band = max(self.price_band * mid, self.min_band)
+		if abs(order.lmtPrice - mid) > band:
+			self._reject("price_band", f"Limit {order.lmtPrice} is more than {band:.4g} from mid {mid:.4g}")
+
+	def _remember(self, signature:tuple) -> None:
+		now = time.monotonic()
+		# Expired signatures are swept once per window
+		if now - self._swept >= self.duplicate_window:
+			self.recent = {s: t for s, t in self.recent.items() if now - t < self.duplicate_window}
+			self._swept = now
+		self.recent[signature] = now
+
+	def stats(self) -> dict:
+		return {"checked": self.checked, "unpriced": self.unpriced, "rejected": dict(self.rejected)}
+
+
+def _signature(contract, order) -> tuple:
+	legs = tuple((leg.conId, leg.ratio, leg.action) for leg in contract.comboLegs) if contract.secType == "BAG" else ()
+	return (
+		order.orderRef, contract.conId, legs, order.action, order.orderType, order.totalQuantity,
+		order.lmtPrice, order.auxPrice, order.trailingPercent, order.parentId,
+	)
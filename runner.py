@@ -0,0 +1,91 @@
+"""
+Runs many Strategy instances on one event loop and one IBTWSAPI
+
+	Strategies share the broker's connections, contract cache and market data
+	hub, so a contract watched by several of them is subscribed once. Each
+	strategy runs in its own task; a failure is reported without stopping the
+	others. stats() gives wall time, hub queue latency, dropped ticks and CPU
+	per strategy.
+
+	python runner.py
+"""
+
+# Importing built-in libraries
+import asyncio
+import json
+import logging
+import time
+import traceback
+
+# Importing project modules
+import credentials
+from ib_wrapper import IBTWSAPI
+from main import Strategy, creds
+
+logger = logging.getLogger("ibtws.runner")
+
+
+class StrategyRunner:
+
+	def __init__(self, broker:IBTWSAPI, slow_ms:float=5.0):
+
+		self.broker = broker
+		self.slow_ms = slow_ms
+		self.strategies = {}
+		self.results = {}
+		self.elapsed = {}
+
+	def add(self, strategy:Strategy) -> Strategy:
+		"""
+		Registers a strategy, it must share this runner's broker\n
+		"""
+		if strategy.name in self.strategies:
+			raise ValueError(f"Duplicate strategy name {strategy.name}")
+		strategy.broker = self.broker
+		self.strategies[strategy.name] = strategy
+		return strategy
+
+	async def _run_one(self, name:str, strategy:Strategy) -> None:
+		t0 = time.perf_counter()
+		try:
+			self.results[name] = await strategy.run()
+		except Exception as e:
+			self.results[name] = e
+			logger.error(f"{name} failed\n{traceback.format_exc()}")
+		finally:
+			self.elapsed[name] = time.perf_counter() - t0
+
+	async def run(self, connect:bool=True) -> dict:
+		"""
+		Connects once and runs every strategy concurrently\n
+		Returns the per-strategy stats\n
+		"""
+		if connect:
+			await self.broker.connect()
+		await asyncio.gather(*(self._run_one(name, s) for name, s in self.strategies.items()))
+		return self.stats()
+
+	def stats(self) -> dict:
+		hub = self.broker.hub.stats()
+		out = {}
+		for name in self.strategies:
+			out[name] = {
+				"ok": name in self.results and not isinstance(self.results[name], Exception),
+				"elapsed_s": self.elapsed.get(name),
+				**hub.get(name, {}),
+			}
+			ticks = out[name].get("ticks")
+			if ticks and out[name]["cpu_ms"] / ticks > self.slow_ms:
+				logger.warning(f"{name} spends {out[name]['cpu_ms'] / ticks:.2f}ms per tick")
+		return out
+
+
+async def main():
+	runner = StrategyRunner(IBTWSAPI(creds=creds))
+	for atm_sl in (0.10, 0.15, 0.20):
+		runner.add(Strategy(broker=runner.broker, symbol=credentials.instrument, expiry=credentials.date, atm_sl=atm_sl))
+	print(json.dumps(await runner.run(), indent=2, default=str))
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
@@ -0,0 +1,310 @@
+"""
+Scenario and stress P&L grid of open option positions
+
+	Every position is repriced over underlying moves x vol shifts x days of
+	decay in one broadcast Black-Scholes pass, an array shaped
+	(positions, moves, vol_shifts, days). IVs are solved from the current
+	mids, so the cell with no move, shift or decay is zero P&L.
+
+	A tick only marks its own position stale, a spot move or the clock
+	marks them all, and the next read reprices whatever is stale.
+
+	grid = await api.scenario_grid("SPX")
+	grid.worst()
+	grid.what_if([(call, 1, 2.35, 2.30), (put, 1, 1.90)])
+"""
+
+# Importing built-in libraries
+import datetime as dt
+import math
+import pytz
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+
+# Importing project modules
+from greeks import MIN_VOL, bs_price, implied_vol, year_fraction
+
+MOVES = np.round(np.linspace(-0.05, 0.05, 41), 6)		# fraction of spot
+VOL_SHIFTS = np.round(np.linspace(-0.10, 0.20, 13), 6)	# absolute vol
+DECAY_DAYS = np.array([0.0, 1 / 24, 1 / 12, 1 / 6, 1.0])
+
+# One second, the floor year_fraction uses too
+MIN_T = 1.0 / (365.0 * 24 * 3600)
+
+
+class ScenarioGrid:
+
+	def __init__(self, moves=None, vol_shifts=None, decay_days=None, rate:float=0.0, clock=None, time_step:float=60.0):
+
+		self.moves = np.asarray(MOVES if moves is None else moves, dtype=np.float64)
+		self.vol_shifts = np.asarray(VOL_SHIFTS if vol_shifts is None else vol_shifts, dtype=np.float64)
+		self.decay_days = np.asarray(DECAY_DAYS if decay_days is None else decay_days, dtype=np.float64)
+		self.shape = (len(self.moves), len(self.vol_shifts), len(self.decay_days))
+		self.rate = rate
+		self.clock = clock or (lambda: dt.datetime.now(pytz.utc))
+		self.time_step = time_step		# seconds between time to expiry updates
+		self.underlying = None			# conId whose price is spot
+		self.spot = math.nan
+		self.index = {}					# conId -> row
+		self.contracts = []
+		self.expiry = []
+		self.strike = np.zeros(0)
+		self.is_call = np.zeros(0, dtype=bool)
+		self.is_option = np.zeros(0, dtype=bool)
+		self.quantity = np.zeros(0)		# position x multiplier
+		self.mark = np.zeros(0)			# latest mid
+		self.iv = np.zeros(0)
+		self.t = np.zeros(0)
+		self.stale = np.zeros(0, dtype=bool)
+		self.pnl = np.zeros((0,) + self.shape)
+		self.total = np.zeros(self.shape)
+		self.repriced = 0
+		self.removed = 0				# rows shift on removal, results in flight are dropped
+		self._timed = None
+
+	def __len__(self) -> int:
+		return len(self.contracts)
+
+	@property
+	def scenarios(self) -> int:
+		return self.total.size
+
+	# Positions
+
+	def set_underlying(self, contract, price:float=math.nan) -> None:
+		self.underlying = contract.conId
+		self.set_spot(price)
+
+	def set_spot(self, price:float) -> None:
+		if math.isfinite(price) and price > 0 and price != self.spot:
+			self.spot = price
+			# Moves are relative to spot, every row is repriced
+			self.stale[:] = True
+
+	def add(self, contract, quantity:float, price:float=math.nan) -> None:
+		"""
+		Adds a position, or sets the quantity of one already held\n
+		quantity is in contracts, the multiplier is applied here\n
+		"""
+		row = self.index.get(contract.conId)
+		size = quantity * float(contract.multiplier or 1)
+		if row is not None:
+			self.quantity[row] = size
+			self.set_price(contract.conId, price)
+			self.stale[row] = True
+			return
+
+		option = contract.secType in ("OPT", "FOP")
+		self.index[contract.conId] = len(self.contracts)
+		self.contracts.append(contract)
+		self.expiry.append(contract.lastTradeDateOrContractMonth[:8] if option else "")
+		self.strike = np.append(self.strike, contract.strike if option else math.nan)
+		self.is_call = np.append(self.is_call, option and contract.right.startswith("C"))
+		self.is_option = np.append(self.is_option, option)
+		self.quantity = np.append(self.quantity, size)
+		self.mark = np.append(self.mark, price)
+		self.iv = np.append(self.iv, math.nan)
+		self.t = np.append(self.t, year_fraction(self.expiry[-1], self._timed) if option and self._timed else math.nan)
+		self.stale = np.append(self.stale, True)
+		self.pnl = np.concatenate((self.pnl, np.zeros((1,) + self.shape)))
+
+	def remove(self, conId:int) -> None:
+		row = self.index.pop(conId, None)
+		if row is None:
+			return
+		self.total -= self.pnl[row]
+		self.removed += 1
+		del self.contracts[row]
+		del self.expiry[row]
+		for name in ("strike", "is_call", "is_option", "quantity", "mark", "iv", "t", "stale", "pnl"):
+			setattr(self, name, np.delete(getattr(self, name), row, axis=0))
+		self.index = {c.conId: i for i, c in enumerate(self.contracts)}
+
+	def set_price(self, conId:int, price:float) -> None:
+		row = self.index.get(conId)
+		if row is not None and math.isfinite(price) and price != self.mark[row]:
+			self.mark[row] = price
+			self.stale[row] = True
+
+	# Events
+
+	def on_ticker(self, ticker) -> None:
+		conId = ticker.contract.conId
+		if conId == self.underlying:
+			self.set_spot(ticker.marketPrice())
+		if conId in self.index:
+			self.set_price(conId, ticker.midpoint())
+
+	def on_tickers(self, tickers) -> None:
+		"""
+		Handler for IB.pendingTickersEvent\n
+		"""
+		for ticker in tickers:
+			self.on_ticker(ticker)
+
+	# Pricing
+
+	def _tick_clock(self) -> None:
+		now = self.clock()
+		if self._timed is not None and (now - self._timed).total_seconds() < self.time_step:
+			return
+		self._timed = now
+		for row in np.flatnonzero(self.is_option):
+			self.t[row] = year_fraction(self.expiry[row], now)
+		self.stale[:] = True
+
+	def _price(self, spot, strike, t, is_call, is_option, quantity, mark, guess):
+		"""
+		Returns P&L per position and scenario, shape (n,) + self.shape, and the solved IVs\n
+		"""
+		iv = implied_vol(mark, spot, strike, t, self.rate, is_call, guess=guess)
+		# A quote that stops solving keeps its last IV, one that never solved is skipped
+		iv = np.where(np.isfinite(iv), iv, guess)
+		priced = is_option & np.isfinite(iv)
+
+		n = len(strike)
+		pnl = np.zeros((n,) + self.shape)
+		moved = spot * (1.0 + self.moves)
+		if priced.any():
+			k = strike[priced][:, None, None, None]
+			c = is_call[priced][:, None, None, None]
+			sigma = iv[priced]
+			base = bs_price(spot, strike[priced], t[priced], self.rate, sigma, is_call[priced])
+			value = bs_price(
+				moved[None, :, None, None],
+				k,
+				np.maximum(t[priced][:, None, None, None] - self.decay_days / 365.0, MIN_T),
+				self.rate,
+				np.maximum(sigma[:, None, None, None] + self.vol_shifts[None, None, :, None], MIN_VOL),
+				c,
+			)
+			pnl[priced] = (value - base[:, None, None, None]) * quantity[priced][:, None, None, None]
+		linear = ~is_option
+		if linear.any():
+			pnl[linear] = (quantity[linear][:, None] * (moved - spot))[:, :, None, None]
+		return pnl, iv
+
+	def take_stale(self):
+		"""
+		Returns (rows, pricing inputs) of the stale positions and marks them fresh, None when nothing is stale\n
+		Quotes arriving before the result is applied mark their rows stale again\n
+		"""
+		if math.isnan(self.spot):
+			return None
+		self._tick_clock()
+		rows = np.flatnonzero(self.stale)
+		if not len(rows):
+			return None
+		self.stale[rows] = False
+		return rows, (
+			self.spot, self.strike[rows], self.t[rows], self.is_call[rows], self.is_option[rows],
+			self.quantity[rows], self.mark[rows], self.iv[rows],
+		)
+
+	def apply(self, rows:np.ndarray, pnl:np.ndarray, iv:np.ndarray) -> None:
+		self.iv[rows] = iv
+		if len(rows) == len(self.contracts):
+			self.pnl = pnl
+			self.total = pnl.sum(axis=0)
+		else:
+			self.total += (pnl - self.pnl[rows]).sum(axis=0)
+			self.pnl[rows] = pnl
+		self.repriced += len(rows)
+
+	def refresh(self) -> int:
+		"""
+		Reprices stale positions, returns how many\n
+		"""
+		taken = self.take_stale()
+		if taken is None:
+			return 0
+		rows, inputs = taken
+		self.apply(rows, *self._price(*inputs))
+		return len(rows)
+
+	# Reads
+
+	def grid(self) -> np.ndarray:
+		"""
+		Returns the portfolio P&L of every scenario, shape (moves, vol_shifts, days)\n
+		"""
+		self.refresh()
+		return self.total
+
+	def _cell(self, total:np.ndarray, i:int) -> dict:
+		m, v, d = np.unravel_index(i, self.shape)
+		return {
+			"pnl": float(total[m, v, d]),
+			"move": float(self.moves[m]),
+			"vol_shift": float(self.vol_shifts[v]),
+			"days": float(self.decay_days[d]),
+		}
+
+	def worst(self, total:np.ndarray=None) -> dict:
+		"""
+		Returns the scenario with the largest loss\n
+		"""
+		total = self.grid() if total is None else total
+		return self._cell(total, int(np.argmin(total)))
+
+	def best(self, total:np.ndarray=None) -> dict:
+		total = self.grid() if total is None else total
+		return self._cell(total, int(np.argmax(total)))
+
+	def at(self, move:float=0.0, vol_shift:float=0.0, days:float=0.0) -> float:
+		"""
+		Returns the P&L of the grid point nearest to a scenario\n
+		"""
+		total = self.grid()
+		return float(total[
+			np.abs(self.moves - move).argmin(),
+			np.abs(self.vol_shifts - vol_shift).argmin(),
+			np.abs(self.decay_days - days).argmin(),
+		])
+
+	def profile(self, days:float=0.0) -> np.ndarray:
+		"""
+		Returns the worst P&L over vol shifts for each move, after days of decay\n
+		"""
+		return self.grid()[:, :, np.abs(self.decay_days - days).argmin()].min(axis=1)
+
+	def what_if(self, legs:list) -> np.ndarray:
+		"""
+		Returns the grid with extra positions added, without keeping them\n
+		legs are (contract, quantity, price) or (contract, quantity, price, mark), price is paid on entry\n
+		Legs are valued from mark (price when not given), (mark - price) x quantity is added to every scenario\n
+		"""
+		total = self.grid()
+		if not legs or math.isnan(self.spot):
+			return total.copy()
+		contracts = [leg[0] for leg in legs]
+		now = self._timed or self.clock()
+		option = np.array([c.secType in ("OPT", "FOP") for c in contracts])
+		quantity = np.array([leg[1] * float(leg[0].multiplier or 1) for leg in legs])
+		price = np.array([leg[2] for leg in legs], dtype=np.float64)
+		mark = np.array([leg[3] if len(leg) > 3 else leg[2] for leg in legs], dtype=np.float64)
+		pnl, _ = self._price(
+			self.spot,
+			np.array([c.strike if o else math.nan for c, o in zip(contracts, option)]),
+			np.array([year_fraction(c.lastTradeDateOrContractMonth[:8], now) if o else math.nan for c, o in zip(contracts, option)]),
+			np.array([c.right.startswith("C") for c in contracts]),
+			option,
+			quantity,
+			mark,
+			np.full(len(legs), np.nan),
+		)
+		# The spread paid crossing from mark to price
+		return total + pnl.sum(axis=0) + float(np.nansum((mark - price) * quantity))
+
+	def summary(self) -> dict:
+		total = self.grid()
+		return {
+			"positions": len(self),
+			"scenarios": self.scenarios,
+			"spot": self.spot,
+			"worst": self.worst(total),
+			"best": self.best(total),
+			"unpriced": int((self.is_option & np.isnan(self.iv)).sum()),
+			"repriced": self.repriced,
+		}
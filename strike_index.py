@@ -0,0 +1,97 @@
+"""
+Sorted strike index for one underlying/expiry
+
+	ATM and OTM lookups are binary searches over a NumPy array
+"""
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+
+
+class StrikeIndex:
+
+	def __init__(self, symbol:str, expiry:str, strikes):
+
+		self.symbol = symbol
+		self.expiry = expiry
+		self.strikes = np.unique(np.asarray(list(strikes), dtype=np.float64))
+		if not len(self.strikes):
+			raise ValueError(f"No strikes for {symbol} {expiry}")
+
+	def __len__(self) -> int:
+		return len(self.strikes)
+
+	def __iter__(self):
+		return iter(self.strikes.tolist())
+
+	def __contains__(self, strike:float) -> bool:
+		i = np.searchsorted(self.strikes, strike)
+		return i < len(self.strikes) and self.strikes[i] == strike
+
+	def atm_position(self, price:float) -> int:
+		"""
+		Returns the array position of the strike nearest to price\n
+		"""
+		i = int(np.searchsorted(self.strikes, price))
+		if i == 0:
+			return 0
+		if i == len(self.strikes):
+			return i - 1
+		return i if self.strikes[i] - price < price - self.strikes[i - 1] else i - 1
+
+	def nearest(self, price:float) -> float:
+		"""
+		Returns the ATM strike\n
+		"""
+		return float(self.strikes[self.atm_position(price)])
+
+	def otm_call(self, price:float, k:int=1) -> float:
+		"""
+		Returns the k-th listed strike above the ATM strike\n
+		"""
+		i = self.atm_position(price) + k
+		if i >= len(self.strikes):
+			raise IndexError(f"No strike {k} above ATM for {self.symbol} {self.expiry}")
+		return float(self.strikes[i])
+
+	def otm_put(self, price:float, k:int=1) -> float:
+		"""
+		Returns the k-th listed strike below the ATM strike\n
+		"""
+		i = self.atm_position(price) - k
+		if i < 0:
+			raise IndexError(f"No strike {k} below ATM for {self.symbol} {self.expiry}")
+		return float(self.strikes[i])
+
+	def ceil(self, price:float) -> float:
+		"""
+		Returns the lowest listed strike >= price\n
+		"""
+		i = int(np.searchsorted(self.strikes, price, side="left"))
+		if i == len(self.strikes):
+			raise IndexError(f"No strike >= {price} for {self.symbol} {self.expiry}")
+		return float(self.strikes[i])
+
+	def floor(self, price:float) -> float:
+		"""
+		Returns the highest listed strike <= price\n
+		"""
+		i = int(np.searchsorted(self.strikes, price, side="right")) - 1
+		if i < 0:
+			raise IndexError(f"No strike <= {price} for {self.symbol} {self.expiry}")
+		return float(self.strikes[i])
+
+	def between(self, low:float, high:float) -> np.ndarray:
+		"""
+		Returns a view of the strikes in [low, high]\n
+		"""
+		lo = np.searchsorted(self.strikes, low, side="left")
+		hi = np.searchsorted(self.strikes, high, side="right")
+		return self.strikes[lo:hi]
+
+	def around(self, price:float, n:int) -> np.ndarray:
+		"""
+		Returns a view of the ATM strike and its n neighbours on each side\n
+		"""
+		i = self.atm_position(price)
+		return self.strikes[max(i - n, 0):i + n + 1]
@@ -0,0 +1,227 @@
+"""
+Market data line budget
+
+	Reference-counted streaming subscriptions kept within the account's
+	market data lines. Released subscriptions stay open (and their quotes
+	warm) until a new contract needs the line, then the least recently
+	used idle one is cancelled. Pinned contracts are never evicted.
+"""
+
+# Importing built-in libraries
+import asyncio
+from collections import OrderedDict
+
+# Importing third-party libraries
+from eventkit import Event	# installed with ib_insync
+
+
+class Subscription:
+
+	__slots__ = ("contract", "ticker", "generic", "refs", "pinned")
+
+	def __init__(self, contract, ticker, generic:str):
+		self.contract = contract
+		self.ticker = ticker
+		self.generic = generic
+		self.refs = 0
+		self.pinned = False
+
+	@property
+	def idle(self) -> bool:
+		return not self.refs and not self.pinned
+
+
+class SubscriptionManager:
+
+	def __init__(self, client, lines:int=100, pacer=None):
+
+		self.client = client
+		self.lines = lines
+		self.pacer = pacer
+		self.entries = OrderedDict()	# conId -> Subscription, least recently used first
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._waiters = []
+
+		self.tickerMovedEvent = Event("tickerMovedEvent")
+		moved = getattr(client, "tickerMovedEvent", None)
+		if moved is not None:
+			moved += self.on_moved
+
+	# Budget
+
+	def in_use(self) -> int:
+		return len(self.entries)
+
+	def free(self) -> int:
+		"""
+		Returns how many lines are neither held nor pinned, idle ones are evicted on demand\n
+		"""
+		return self.lines - sum(1 for s in self.entries.values() if not s.idle)
+
+	def has_line(self) -> bool:
+		return len(self.entries) < self.lines or any(s.idle for s in self.entries.values())
+
+	def _evict(self) -> bool:
+		"""
+		Cancels the least recently used idle subscription\n
+		"""
+		for conId, sub in self.entries.items():
+			if sub.idle:
+				del self.entries[conId]
+				self.client.cancelMktData(sub.contract)
+				self.evictions += 1
+				return True
+		return False
+
+	def _wake(self) -> None:
+		while self._waiters:
+			waiter = self._waiters.pop(0)
+			if not waiter.done():
+				waiter.set_result(None)
+				return
+
+	# Subscriptions
+
+	def acquire(self, contract, genericTickList:str=''):
+		"""
+		Returns a streaming ticker for contract and takes a reference on it\n
+		Raises RuntimeError when every line is held or pinned\n
+		"""
+		sub = self.entries.get(contract.conId)
+		if sub is not None:
+			self.hits += 1
+			self.entries.move_to_end(contract.conId)
+		else:
+			if len(self.entries) >= self.lines and not self._evict():
+				raise RuntimeError(f"All {self.lines} market data lines are in use")
+			self.misses += 1
+			ticker = self.client.reqMktData(contract, genericTickList, False, False)
+			sub = self.entries[contract.conId] = Subscription(contract, ticker, genericTickList)
+		sub.refs += 1
+		return sub.ticker
+
+	async def subscribe(self, contract, genericTickList:str='', timeout:float=None):
+		"""
+		Same as acquire, waiting for a line to free up instead of raising\n
+		Raises asyncio.TimeoutError when no line frees up within timeout\n
+		"""
+		return await asyncio.wait_for(self._subscribe(contract, genericTickList), timeout)
+
+	async def _subscribe(self, contract, genericTickList:str):
+		if contract.conId not in self.entries and self.pacer is not None:
+			# reqMktData, plus the cancel of an evicted line
+			await self.pacer.send(1 if len(self.entries) < self.lines else 2)
+		while contract.conId not in self.entries and not self.has_line():
+			waiter = asyncio.get_event_loop().create_future()
+			self._waiters.append(waiter)
+			try:
+				await waiter
+			finally:
+				if waiter in self._waiters:
+					self._waiters.remove(waiter)
+		return self.acquire(contract, genericTickList)
+
+	async def acquire_many(self, contracts:list, genericTickList:str='') -> list:
+		"""
+		acquire for many contracts, their requests paced as one batch\n
+		Raises RuntimeError when the lines run out, releasing what it took\n
+		"""
+		new = len({c.conId for c in contracts if c.conId not in self.entries})
+		if new and self.pacer is not None:
+			# reqMktData of each new contract, plus the cancels of evicted lines
+			await self.pacer.send(new + max(len(self.entries) + new - self.lines, 0))
+		tickers = []
+		try:
+			for contract in contracts:
+				tickers.append(self.acquire(contract, genericTickList))
+		except RuntimeError:
+			for contract in contracts[:len(tickers)]:
+				self.release(contract)
+			raise
+		return tickers
+
+	def release(self, contract) -> None:
+		"""
+		Drops a reference, the line stays open until it is needed elsewhere\n
+		"""
+		sub = self.entries.get(contract.conId)
+		if sub is None or not sub.refs:
+			return
+		sub.refs -= 1
+		if sub.idle:
+			self._wake()
+
+	def pin(self, contract) -> None:
+		"""
+		Keeps the contract subscribed regardless of references\n
+		"""
+		if contract.conId not in self.entries:
+			self.acquire(contract)
+			self.release(contract)
+		self.entries[contract.conId].pinned = True
+
+	def unpin(self, contract) -> None:
+		sub = self.entries.get(contract.conId)
+		if sub is not None and sub.pinned:
+			sub.pinned = False
+			if sub.idle:
+				self._wake()
+
+	def cancel(self, contract) -> None:
+		"""
+		Cancels a subscription now, whatever its references\n
+		"""
+		sub = self.entries.pop(contract.conId, None)
+		if sub is not None:
+			self.client.cancelMktData(sub.contract)
+			self._wake()
+
+	def cancel_all(self) -> None:
+		for sub in self.entries.values():
+			self.client.cancelMktData(sub.contract)
+		self.entries.clear()
+
+	def restore(self) -> None:
+		"""
+		Re-requests every subscription after a reconnect, emitting tickerMovedEvent\n
+		"""
+		for sub in self.entries.values():
+			sub.ticker = self.client.reqMktData(sub.contract, sub.generic, False, False)
+			self.tickerMovedEvent.emit(sub.contract, sub.ticker)
+
+	def on_moved(self, contract, ticker) -> None:
+		sub = self.entries.get(contract.conId)
+		if sub is not None:
+			sub.ticker = ticker
+		self.tickerMovedEvent.emit(contract, ticker)
+
+	# IB compatible calls, so consumers written against IB take lines from the budget
+
+	def reqMktData(self, contract, genericTickList:str='', snapshot:bool=False, regulatorySnapshot:bool=False, mktDataOptions=None):
+		return self.acquire(contract, genericTickList)
+
+	def cancelMktData(self, contract) -> None:
+		self.release(contract)
+
+	def ticker(self, contract):
+		sub = self.entries.get(contract.conId)
+		return sub.ticker if sub is not None else None
+
+	def tickers(self) -> list:
+		return [sub.ticker for sub in self.entries.values()]
+
+	def stats(self) -> dict:
+		subs = self.entries.values()
+		return {
+			"lines": self.lines,
+			"in_use": len(self.entries),
+			"held": sum(1 for s in subs if s.refs),
+			"pinned": sum(1 for s in subs if s.pinned),
+			"idle": sum(1 for s in subs if s.idle),
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+			"waiting": len(self._waiters),
+		}
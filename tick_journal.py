@@ -0,0 +1,159 @@
+"""
+Append-only memory-mapped tick journal
+
+	Every ticker update is written as one fixed-width record into a
+	preallocated, memory-mapped file per day (rotated when full). Writing is
+	a handful of stores into column views, nothing is allocated per tick.
+	Readers map the same files and get NumPy structured arrays without
+	copying.
+
+	TickRecorder("ticks").attach(api.md)
+	ticks = read_day("ticks", "20241119")
+"""
+
+# Importing built-in libraries
+import datetime as dt
+import glob
+import mmap
+import os
+import time
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+
+MAGIC = b"IBTICK01"
+
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("itemsize", "<u8"), ("capacity", "<u8"), ("count", "<u8")])
+HEADER_SIZE = 64
+
+TICK_DTYPE = np.dtype([
+	("time", "<f8"),
+	("conId", "<i8"),
+	("bid", "<f8"),
+	("ask", "<f8"),
+	("last", "<f8"),
+	("bidSize", "<f8"),
+	("askSize", "<f8"),
+	("lastSize", "<f8"),
+])
+
+
+class TickRecorder:
+
+	def __init__(self, directory:str, capacity:int=1 << 20, flush_every:int=0):
+
+		self.directory = directory
+		self.capacity = capacity
+		self.flush_every = flush_every
+		self.path = None
+		self.written = 0
+		self._mm = None
+		self._file = None
+		self._day = None
+		self._end = 0
+		os.makedirs(directory, exist_ok=True)
+
+	# Files
+
+	def _open(self, day:str) -> None:
+		self.close()
+		parts = sorted(glob.glob(os.path.join(self.directory, f"ticks-{day}-*.bin")))
+		self.path = os.path.join(self.directory, f"ticks-{day}-{len(parts):03d}.bin")
+		size = HEADER_SIZE + self.capacity * TICK_DTYPE.itemsize
+
+		self._file = open(self.path, "w+b")
+		self._file.truncate(size)
+		self._mm = mmap.mmap(self._file.fileno(), size)
+		header = np.frombuffer(self._mm, dtype=HEADER_DTYPE, count=1)
+		header[0] = (MAGIC, TICK_DTYPE.itemsize, self.capacity, 0)
+		self._count = header["count"]
+
+		records = np.frombuffer(self._mm, dtype=TICK_DTYPE, count=self.capacity, offset=HEADER_SIZE)
+		self._time, self._conId = records["time"], records["conId"]
+		self._bid, self._ask, self._last = records["bid"], records["ask"], records["last"]
+		self._bidSize, self._askSize, self._lastSize = records["bidSize"], records["askSize"], records["lastSize"]
+		self._n = 0
+		self._day = day
+		self._end = _day_end(day)
+
+	def flush(self) -> None:
+		if self._mm is not None:
+			self._mm.flush()
+
+	def close(self) -> None:
+		if self._mm is not None:
+			self.flush()
+			# Column views pin the buffer, drop them before unmapping
+			self._count = self._time = self._conId = self._bid = self._ask = self._last = None
+			self._bidSize = self._askSize = self._lastSize = None
+			self._mm.close()
+			self._file.close()
+			self._mm = self._file = None
+
+	# Recording
+
+	def record(self, ticker, now:float=None) -> None:
+		now = time.time() if now is None else now
+		if now >= self._end or self._n == self.capacity:
+			self._open(dt.datetime.fromtimestamp(now, dt.timezone.utc).strftime("%Y%m%d"))
+
+		i = self._n
+		self._time[i] = now
+		self._conId[i] = ticker.contract.conId
+		self._bid[i] = ticker.bid
+		self._ask[i] = ticker.ask
+		self._last[i] = ticker.last
+		self._bidSize[i] = ticker.bidSize
+		self._askSize[i] = ticker.askSize
+		self._lastSize[i] = ticker.lastSize
+		self._n = i + 1
+		# Readers only trust records below count
+		self._count[0] = self._n
+		self.written += 1
+		if self.flush_every and not self.written % self.flush_every:
+			self._mm.flush()
+
+	def on_tickers(self, tickers) -> None:
+		"""
+		Handler for IB.pendingTickersEvent\n
+		"""
+		now = time.time()
+		for ticker in tickers:
+			self.record(ticker, now)
+
+	def attach(self, client):
+		client.pendingTickersEvent += self.on_tickers
+		return self
+
+	def detach(self, client) -> None:
+		client.pendingTickersEvent -= self.on_tickers
+		self.close()
+
+
+def _day_end(day:str) -> float:
+	start = dt.datetime.strptime(day, "%Y%m%d").replace(tzinfo=dt.timezone.utc)
+	return (start + dt.timedelta(days=1)).timestamp()
+
+
+def read(path:str) -> np.ndarray:
+	"""
+	Returns the records of one journal file as a read-only view of the mapping\n
+	"""
+	with open(path, "rb") as f:
+		mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	header = np.frombuffer(mm, dtype=HEADER_DTYPE, count=1)[0]
+	if header["magic"] != MAGIC or header["itemsize"] != TICK_DTYPE.itemsize:
+		raise ValueError(f"{path} is not a tick journal")
+	return np.frombuffer(mm, dtype=TICK_DTYPE, count=int(header["count"]), offset=HEADER_SIZE)
+
+
+def read_day(directory:str, day:str, conId:int=None) -> np.ndarray:
+	"""
+	Returns a day's records, a zero-copy view when they sit in one file\n
+	Filtering by conId or joining rotated files makes a copy\n
+	"""
+	parts = [read(p) for p in sorted(glob.glob(os.path.join(directory, f"ticks-{day}-*.bin")))]
+	if not parts:
+		return np.empty(0, dtype=TICK_DTYPE)
+	ticks = parts[0] if len(parts) == 1 else np.concatenate(parts)
+	return ticks if conId is None else ticks[ticks["conId"] == conId]
@@ -0,0 +1,176 @@
+"""
+Event-driven trailing stop management
+
+	Subscribes once to the option ticker and modifies the live TRAIL order
+	in place (same orderId) when the premium moves
+"""
+
+# Importing built-in libraries
+import asyncio
+import math
+import time
+from collections import deque
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+
+# Importing project modules
+from risk import OrderRejected
+
+
+class TrailingStopManager:
+
+	def __init__(
+			self,
+			client,
+			trade,
+			reference:float,
+			trigger:float=0.05,
+			step:float=0.01,
+			floor:float=0.01,
+			data_client=None,
+			percent:float=None,
+		):
+
+		self.client = client
+		self.data_client = data_client or client
+		self.trade = trade
+		self.reference = reference
+		self.trigger = trigger
+		self.step = step
+		self.floor = floor
+		self.start = percent		# trail the first step tightens from, the order's trailingPercent when None
+		self.ticker = None
+		self.stream = None
+		self.modifications = 0
+		self.rejected = 0
+		self.latencies = deque(maxlen=4096)
+		self.done = asyncio.Event()
+
+	@property
+	def percent(self) -> float:
+		return self.trade.order.trailingPercent
+
+	def start(self):
+		"""
+		Subscribes to the option ticker\n
+		"""
+		self.ticker = self.data_client.reqMktData(self.trade.contract, "", False, False)
+		self.ticker.updateEvent += self.on_tick
+		self.trade.statusEvent += self.on_status
+		moved = getattr(self.data_client, "tickerMovedEvent", None)
+		if moved is not None:
+			moved += self.on_moved
+		self.on_status(self.trade)
+		return self
+
+	def stop(self) -> None:
+		"""
+		Unsubscribes and releases waiters\n
+		"""
+		if self.ticker is not None:
+			self.ticker.updateEvent -= self.on_tick
+			self.trade.statusEvent -= self.on_status
+			moved = getattr(self.data_client, "tickerMovedEvent", None)
+			if moved is not None:
+				moved -= self.on_moved
+			self.data_client.cancelMktData(self.trade.contract)
+			self.ticker = None
+		if self.stream is not None:
+			self.trade.statusEvent -= self.on_status
+			self.stream.close()
+			self.stream = None
+		self.done.set()
+
+	async def wait(self) -> None:
+		await self.done.wait()
+
+	async def follow(self, stream) -> None:
+		"""
+		Drives the manager from an async stream of tickers instead of updateEvent\n
+		The stream is closed once the order is done or the floor is reached\n
+		"""
+		self.stream = stream
+		self.trade.statusEvent += self.on_status
+		# Done before the first tick, e.g. filled while the stream was set up
+		self.on_status(self.trade)
+		try:
+			await stream.run(self.on_tick)
+		finally:
+			self.stop()
+
+	def on_moved(self, contract, ticker) -> None:
+		"""
+		Follows the subscription when a connection pool moves it\n
+		"""
+		if self.ticker is not None and contract.conId == self.trade.contract.conId:
+			self.ticker.updateEvent -= self.on_tick
+			self.ticker = ticker
+			self.ticker.updateEvent += self.on_tick
+
+	def rebind(self, trade) -> None:
+		"""
+		Follows the order onto its Trade object of a new session (after a reconnect)\n
+		"""
+		if not self.done.is_set():
+			self.trade.statusEvent -= self.on_status
+			trade.statusEvent += self.on_status
+		self.trade = trade
+		self.on_status(trade)
+
+	def on_status(self, trade) -> None:
+		if trade.isDone():
+			self.stop()
+
+	def on_tick(self, ticker) -> None:
+		"""
+		Tightens the trail each time the premium drops by trigger\n
+		"""
+		if self.done.is_set():
+			return
+		received = time.perf_counter()
+		mid = ticker.midpoint()
+		if math.isnan(mid) or mid > (1 - self.trigger) * self.reference:
+			return
+
+		try:
+			current = self.percent if self.modifications or self.start is None else self.start
+			self.modify(max(self.floor, round(current - self.step, 6)))
+		except OrderRejected:
+			# Retried on the next tick past the trigger
+			return
+		self.reference = mid
+		self.latencies.append(time.perf_counter() - received)
+
+		if self.percent <= self.floor:
+			self.stop()
+
+	def modify(self, trailing_percent:float):
+		"""
+		Re-places the same orderId with a new trailingPercent\n
+		"""
+		previous = self.trade.order.trailingPercent
+		self.trade.order.trailingPercent = trailing_percent
+		try:
+			trade = self.client.placeOrder(self.trade.contract, self.trade.order)
+		except OrderRejected:
+			self.trade.order.trailingPercent = previous
+			self.rejected += 1
+			raise
+		self.modifications += 1
+		return trade
+
+	def stats(self) -> dict:
+		"""
+		Returns tick-to-modify latency percentiles in milliseconds\n
+		"""
+		if not self.latencies:
+			return {"modifications": self.modifications, "rejected": self.rejected}
+		lat = np.fromiter(self.latencies, dtype=np.float64) * 1e3
+		return {
+			"modifications": self.modifications,
+			"rejected": self.rejected,
+			"p50_ms": float(np.percentile(lat, 50)),
+			"p99_ms": float(np.percentile(lat, 99)),
+			"max_ms": float(lat.max()),
+		}
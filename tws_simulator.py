@@ -0,0 +1,783 @@
+"""
+In-process stand-in for TWS / IB Gateway
+
+	SimulatedIB implements the subset of ib_insync.IB that IBTWSAPI uses:
+	contract details, secdef params, streaming tickers and order placement
+	with a matching engine for MKT, LMT, STP and TRAIL orders, including
+	parent/child brackets, and MKT/LMT orders on BAG combos (all legs fill
+	together at their touch). Option quotes come from Black-Scholes around the
+	underlying price held by SimulatedMarket.
+
+	api = IBTWSAPI(creds, ib_factory=lambda: SimulatedIB(SimulatedMarket({"SPX": 5860.0})))
+"""
+
+# Importing built-in libraries
+import asyncio
+import copy
+import datetime as dt
+import itertools
+import math
+from collections import defaultdict
+
+# Importing third-party libraries
+import numpy as np			# pip install numpy
+from eventkit import Event	# installed with ib_insync
+from ib_insync import *		# pip install ib_insync
+from ib_insync import OptionChain as SecDefOptParams
+from ib_insync.util import UNSET_DOUBLE
+
+# Importing project modules
+from bar_cache import bar_seconds, duration_seconds
+from greeks import bs_price, year_fraction
+
+# Eastern standard time, close enough to place the simulated sessions
+_NY_OFFSET = 5 * 3600
+
+
+class SimulatedMarket:
+
+	def __init__(
+			self,
+			underlyings:dict=None,
+			expirations:list=None,
+			strike_step:float=5.0,
+			strike_range:float=0.1,
+			vol:float=0.15,
+			rate:float=0.0,
+			spread:float=0.01,
+			tick:float=0.05,
+			clock=None,
+		):
+
+		self.underlyings = dict(underlyings or {"SPX": 5860.0})
+		self.expirations = sorted(expirations or [dt.date.today().strftime("%Y%m%d")])
+		self.vol = vol
+		self.rate = rate
+		self.spread = spread
+		self.tick = tick
+		self.clock = clock or (lambda: dt.datetime.now(dt.timezone.utc))
+		self.overrides = {}
+		self._year_fractions = (None, {})
+
+		# Contract ids are shared by every SimulatedIB on this market, like clientIds on one gateway
+		self.conids = {}
+		self.contracts = {}
+		self.next_conid = itertools.count(100000)
+
+		self.strikes = {}
+		for symbol, spot in self.underlyings.items():
+			lo = math.floor(spot * (1 - strike_range) / strike_step) * strike_step
+			hi = math.ceil(spot * (1 + strike_range) / strike_step) * strike_step
+			self.strikes[symbol] = np.arange(lo, hi + strike_step, strike_step)
+
+	def set_price(self, symbol:str, price:float) -> None:
+		self.underlyings[symbol] = price
+
+	def set_quote(self, contract:Contract, bid:float, ask:float, last:float=None) -> None:
+		"""
+		Pins a contract's quote instead of the model price\n
+		"""
+		self.overrides[contract.conId] = (bid, ask, (bid + ask) / 2 if last is None else last)
+
+	def clear_quote(self, contract:Contract) -> None:
+		self.overrides.pop(contract.conId, None)
+
+	def quotes(self, contracts:list) -> np.ndarray:
+		"""
+		Returns a (n, 3) array of bid/ask/last, options priced in one pass\n
+		"""
+		out = np.empty((len(contracts), 3))
+		options = []
+		for n, c in enumerate(contracts):
+			if c.conId in self.overrides:
+				out[n] = self.overrides[c.conId]
+			elif c.secType in ("OPT", "FOP"):
+				options.append(n)
+			else:
+				spot = self.underlyings[c.symbol]
+				out[n] = (spot, spot, spot)
+
+		if options:
+			now = self.clock()
+			opts = [contracts[n] for n in options]
+			spot = np.array([self.underlyings[c.symbol] for c in opts])
+			strike = np.array([c.strike for c in opts])
+			t = np.array([self._year_fraction(c.lastTradeDateOrContractMonth, now) for c in opts])
+			is_call = np.array([c.right.startswith("C") for c in opts])
+			price = bs_price(spot, strike, t, self.rate, self.vol, is_call)
+			half = np.maximum(self.tick, np.round(price * self.spread / self.tick) * self.tick) / 2
+			out[options, 0] = np.maximum(np.round((price - half) / self.tick) * self.tick, 0.0)
+			out[options, 1] = np.maximum(np.round((price + half) / self.tick) * self.tick, self.tick)
+			out[options, 2] = price
+		return out
+
+	def _year_fraction(self, expiry:str, now:dt.datetime) -> float:
+		# Reused while the clock stands still, a replay prices many contracts per virtual instant
+		stamp, cache = self._year_fractions
+		if stamp != now:
+			cache = {}
+			self._year_fractions = (now, cache)
+		if expiry not in cache:
+			cache[expiry] = year_fraction(expiry, now)
+		return cache[expiry]
+
+
+class _SimClient:
+	"""
+	Stands in for IB.client (the low level socket client)\n
+	"""
+
+	def __init__(self):
+		self._ids = itertools.count(1)
+
+	def getReqId(self) -> int:
+		return next(self._ids)
+
+
+class SimulatedIB:
+
+	events = IB.events
+
+	def __init__(
+			self,
+			market:SimulatedMarket=None,
+			latency:float=0.0,
+			fill_latency:float=None,
+			max_fill_qty:float=None,
+			slippage:float=0.0,
+			fill:bool=True,
+			account:str="DU0000000",
+			cash:float=1_000_000.0,
+			commission:float=0.65,
+		):
+
+		for name in self.events:
+			setattr(self, name, Event(name))
+
+		self.market = market or SimulatedMarket()
+		self.latency = latency
+		self.fill_latency = latency if fill_latency is None else fill_latency
+		self.max_fill_qty = max_fill_qty
+		self.slippage = slippage
+		self.fill = fill
+		self.account = account
+		self.cash = cash
+		self.commission = commission
+
+		self.client = _SimClient()
+		self.clientId = 0
+		self.connected = False
+		self.available = True
+		self.market_data_type = 1
+		self.historical_requests = 0
+
+		self._conids = self.market.conids
+		self._contracts = self.market.contracts
+		self._next_conid = self.market.next_conid
+		self._tickers = {}
+		self._trades = {}
+		self._held = {}
+		self._child_ids = defaultdict(list)
+		self._working = defaultdict(dict)
+		self._combos = {}
+		self._realized = {}
+		self._pnl = None
+		self._pnl_single = {}
+		self._trail = {}
+		self._positions = {}
+		self._perm_ids = itertools.count(1000000)
+		self._exec_ids = itertools.count(1)
+
+	# Connection
+
+	def connect(self, host:str='127.0.0.1', port:int=7497, clientId:int=1, timeout:float=4, readonly:bool=False, account:str=''):
+		if not self.available:
+			raise ConnectionRefusedError(f"Gateway {host}:{port} is not accepting connections")
+		self.clientId = clientId
+		self.connected = True
+		# TWS sends the open orders of the clientId on every connect
+		for trade in self.openTrades():
+			self.openOrderEvent.emit(trade)
+		self.connectedEvent.emit()
+		return self
+
+	async def connectAsync(self, host:str='127.0.0.1', port:int=7497, clientId:int=1, timeout:float=4, readonly:bool=False, account:str=''):
+		return self.connect(host, port, clientId, timeout, readonly, account)
+
+	def disconnect(self) -> None:
+		if self.connected:
+			self.connected = False
+			self._reset_session()
+			self.disconnectedEvent.emit()
+
+	def _reset_session(self) -> None:
+		# Like IB.disconnect, client side state is dropped while the gateway keeps working the orders
+		self._tickers.clear()
+		for orderId, trade in self._trades.items():
+			if trade.isDone():
+				continue
+			fresh = Trade(trade.contract, copy.copy(trade.order), copy.copy(trade.orderStatus), list(trade.fills), list(trade.log))
+			self._trades[orderId] = fresh
+			if orderId in self._held:
+				self._held[orderId] = fresh
+			working = self._working.get(trade.contract.conId, {})
+			if orderId in working:
+				working[orderId] = fresh
+			if orderId in self._combos:
+				self._combos[orderId] = fresh
+
+	def isConnected(self) -> bool:
+		return self.connected
+
+	def sleep(self, secs:float=0.02) -> bool:
+		return util.sleep(secs)
+
+	# Contracts
+
+	def _key(self, c:Contract) -> tuple:
+		return (c.secType, c.symbol, c.lastTradeDateOrContractMonth, float(c.strike or 0.0), (c.right or "")[:1])
+
+	def _listed(self, c:Contract) -> bool:
+		if c.symbol not in self.market.underlyings:
+			return False
+		if c.secType in ("IND", "STK", "CONTFUT", "FUT"):
+			return True
+		if c.secType == "OPT":
+			return (
+				c.lastTradeDateOrContractMonth in self.market.expirations
+				and (c.right or "")[:1] in ("C", "P")
+				and float(c.strike or 0.0) in self.market.strikes[c.symbol]
+			)
+		return False
+
+	def _resolve(self, c:Contract):
+		"""
+		Returns the listed contract matching c, or None\n
+		"""
+		if c.conId in self._contracts:
+			return self._contracts[c.conId]
+		if not self._listed(c):
+			return None
+
+		key = self._key(c)
+		conId = self._conids.get(key)
+		if conId is None:
+			conId = self._conids[key] = next(self._next_conid)
+			listed = Contract.create(
+				secType=c.secType, conId=conId, symbol=c.symbol,
+				lastTradeDateOrContractMonth=c.lastTradeDateOrContractMonth,
+				strike=float(c.strike or 0.0), right=(c.right or "")[:1],
+				multiplier="100" if c.secType == "OPT" else "",
+				exchange=c.exchange or "SMART", currency="USD",
+				localSymbol=c.symbol, tradingClass=c.symbol if c.secType == "OPT" else "",
+			)
+			self._contracts[conId] = listed
+		return self._contracts[conId]
+
+	def qualifyContracts(self, *contracts) -> list:
+		qualified = []
+		for c in contracts:
+			listed = self._resolve(c)
+			if listed is None:
+				self.errorEvent.emit(0, 200, "No security definition has been found for the request", c)
+				continue
+			c.conId = listed.conId
+			c.strike = listed.strike if c.secType == "OPT" else c.strike
+			c.right = listed.right if c.secType == "OPT" else c.right
+			c.multiplier = listed.multiplier
+			c.currency = listed.currency
+			c.localSymbol = listed.localSymbol
+			c.tradingClass = listed.tradingClass
+			qualified.append(c)
+		return qualified
+
+	async def qualifyContractsAsync(self, *contracts) -> list:
+		return self.qualifyContracts(*contracts)
+
+	def reqContractDetails(self, contract:Contract) -> list:
+		if contract.secType != "OPT" or (contract.strike and contract.right and contract.lastTradeDateOrContractMonth):
+			listed = self._resolve(contract)
+			return [ContractDetails(contract=copy.copy(listed), minTick=self.market.tick)] if listed else []
+
+		if contract.symbol not in self.market.underlyings:
+			return []
+		expirations = [contract.lastTradeDateOrContractMonth] if contract.lastTradeDateOrContractMonth else self.market.expirations
+		rights = [contract.right[:1]] if contract.right else ["C", "P"]
+		details = []
+		for expiry in expirations:
+			for strike in self.market.strikes[contract.symbol]:
+				for right in rights:
+					listed = self._resolve(Option(contract.symbol, expiry, float(strike), right, contract.exchange or "SMART"))
+					if listed is not None:
+						details.append(ContractDetails(contract=copy.copy(listed), minTick=self.market.tick))
+		return details
+
+	async def reqContractDetailsAsync(self, contract:Contract) -> list:
+		return self.reqContractDetails(contract)
+
+	def reqSecDefOptParams(self, underlyingSymbol:str, futFopExchange:str, underlyingSecType:str, underlyingConId:int) -> list:
+		if underlyingSymbol not in self.market.underlyings:
+			return []
+		strikes = [float(k) for k in self.market.strikes[underlyingSymbol]]
+		return [
+			SecDefOptParams(exchange, underlyingConId, underlyingSymbol, "100", list(self.market.expirations), strikes)
+			for exchange in ("SMART", "CBOE")
+		]
+
+	async def reqSecDefOptParamsAsync(self, underlyingSymbol:str, futFopExchange:str, underlyingSecType:str, underlyingConId:int) -> list:
+		return self.reqSecDefOptParams(underlyingSymbol, futFopExchange, underlyingSecType, underlyingConId)
+
+	# Market data
+
+	def reqMarketDataType(self, marketDataType:int) -> None:
+		self.market_data_type = marketDataType
+
+	def reqMktData(self, contract:Contract, genericTickList:str='', snapshot:bool=False, regulatorySnapshot:bool=False, mktDataOptions=None) -> Ticker:
+		listed = self._resolve(contract)
+		if listed is None:
+			self.errorEvent.emit(0, 200, "No security definition has been found for the request", contract)
+			return Ticker(contract=contract)
+
+		ticker = self._tickers.get(listed.conId)
+		if ticker is None:
+			ticker = self._tickers[listed.conId] = Ticker(contract=contract)
+			ticker.volume = 0.0
+		self._defer(self._publish, [ticker])
+		return ticker
+
+	def cancelMktData(self, contract:Contract) -> None:
+		self._tickers.pop(contract.conId, None)
+
+	def ticker(self, contract:Contract):
+		return self._tickers.get(contract.conId)
+
+	def tickers(self) -> list:
+		return list(self._tickers.values())
+
+	def set_price(self, symbol:str, price:float) -> None:
+		"""
+		Moves an underlying, repricing its tickers and working orders\n
+		"""
+		self.market.set_price(symbol, price)
+		self._publish([t for t in self._tickers.values() if t.contract.symbol == symbol])
+		self._match([conId for conId in self._working if self._contracts[conId].symbol == symbol])
+		self._match_combos(symbol)
+		self._mark([conId for conId in self._pnl_single if self._contracts[conId].symbol == symbol])
+
+	def set_quote(self, contract:Contract, bid:float, ask:float, last:float=None) -> None:
+		"""
+		Pins one contract's quote and publishes it\n
+		"""
+		listed = self._resolve(contract)
+		self.market.set_quote(listed, bid, ask, last)
+		ticker = self._tickers.get(listed.conId)
+		if ticker is not None:
+			self._publish([ticker])
+		self._match([listed.conId])
+		self._mark([listed.conId])
+
+	def _publish(self, tickers:list) -> None:
+		tickers = [t for t in tickers if t.contract.conId in self._tickers]
+		if not tickers:
+			return
+		quotes = self.market.quotes([t.contract for t in tickers])
+		now = self.market.clock()
+		for ticker, (bid, ask, last) in zip(tickers, quotes):
+			ticker.time = now
+			ticker.bid, ticker.ask, ticker.last = float(bid), float(ask), float(last)
+			ticker.bidSize = ticker.askSize = ticker.lastSize = 1.0
+			ticker.updateEvent.emit(ticker)
+		self.pendingTickersEvent.emit(set(tickers))
+
+	# Historical data
+
+	def reqHistoricalData(
+			self, contract:Contract, endDateTime, durationStr:str, barSizeSetting:str, whatToShow:str,
+			useRTH:bool, formatDate:int=1, keepUpToDate:bool=False, chartOptions=None, timeout:float=60,
+		) -> BarDataList:
+		# A smooth deterministic path around the current quote, so refetched bars match cached ones
+		self.historical_requests += 1
+		size = bar_seconds(barSizeSetting)
+		end = self._now().timestamp()
+		start = end - duration_seconds(durationStr)
+		times = np.arange(start // size * size, end, size)
+		if useRTH and size < 86400:
+			minutes = (times - _NY_OFFSET) % 86400 / 60
+			weekday = ((times - _NY_OFFSET) // 86400 + 3) % 7
+			times = times[(minutes >= 570) & (minutes < 960) & (weekday < 5)]
+
+		bid, ask, last = self.market.quotes([self._resolve(contract) or contract])[0]
+		base = (bid + ask) / 2 if whatToShow in ("MIDPOINT", "BID_ASK") else last
+		path = lambda t: base * (1 + 0.002 * np.sin(t / 1800) + 0.0005 * np.sin(t / 97))
+		opens, closes = path(times), path(times + size)
+		highs = np.maximum(opens, closes) * 1.0002
+		lows = np.minimum(opens, closes) * 0.9998
+
+		bars = BarDataList()
+		for t, o, h, l, c in zip(times.tolist(), opens.tolist(), highs.tolist(), lows.tolist(), closes.tolist()):
+			date = dt.datetime.fromtimestamp(t, dt.timezone.utc)
+			bars.append(BarData(date.date() if size >= 86400 else date, o, h, l, c, 0, (o + c) / 2, 0))
+		return bars
+
+	async def reqHistoricalDataAsync(self, *args, **kwargs) -> BarDataList:
+		if self.latency:
+			await asyncio.sleep(self.latency)
+		return self.reqHistoricalData(*args, **kwargs)
+
+	# Orders
+
+	def _defer(self, fn, *args, delay:float=None) -> None:
+		delay = self.latency if delay is None else delay
+		loop = asyncio.get_event_loop()
+		if delay > 0:
+			loop.call_later(delay, fn, *args)
+		else:
+			loop.call_soon(fn, *args)
+
+	def _now(self) -> dt.datetime:
+		return self.market.clock()
+
+	def _set_status(self, trade:Trade, status:str, message:str='') -> None:
+		trade.orderStatus.status = status
+		trade.log.append(TradeLogEntry(self._now(), status, message))
+		trade.statusEvent.emit(trade)
+		self.orderStatusEvent.emit(trade)
+		if status == OrderStatus.Cancelled:
+			trade.cancelledEvent.emit(trade)
+
+	def placeOrder(self, contract:Contract, order:Order) -> Trade:
+		orderId = order.orderId or self.client.getReqId()
+		trade = self._trades.get(orderId)
+		if trade is not None:
+			# this is a modification of an existing order
+			assert trade.orderStatus.status not in OrderStatus.DoneStates
+			trade.order = order
+			trade.log.append(TradeLogEntry(self._now(), trade.orderStatus.status, 'Modify'))
+			trade.modifyEvent.emit(trade)
+			self.orderModifyEvent.emit(trade)
+			self._defer(self._match, [trade.contract.conId])
+			return trade
+
+		listed = self._resolve_combo(contract) if contract.secType == "BAG" else self._resolve(contract)
+		order.orderId = orderId
+		order.clientId = self.clientId
+		order.permId = next(self._perm_ids)
+		status = OrderStatus(orderId=orderId, status=OrderStatus.PendingSubmit, remaining=order.totalQuantity, permId=order.permId, parentId=order.parentId, clientId=self.clientId)
+		trade = Trade(contract, order, status, [], [TradeLogEntry(self._now(), OrderStatus.PendingSubmit)])
+		self._trades[orderId] = trade
+		if order.parentId:
+			self._child_ids[order.parentId].append(orderId)
+		self.newOrderEvent.emit(trade)
+
+		if listed is None:
+			self.errorEvent.emit(orderId, 200, "No security definition has been found for the request", contract)
+			self._defer(self._set_status, trade, OrderStatus.Cancelled, "No security definition")
+			return trade
+		if contract.secType != "BAG":
+			contract.conId = listed.conId
+
+		if not order.transmit:
+			self._held[orderId] = trade
+			return trade
+
+		parent = self._held.pop(order.parentId, None)
+		if parent is not None:
+			self._defer(self._submit, parent)
+		self._defer(self._submit, trade)
+		return trade
+
+	def _submit(self, trade:Trade) -> None:
+		if trade.isDone():
+			return
+		parent = self._trades.get(trade.order.parentId)
+		if parent is not None and parent.orderStatus.status != OrderStatus.Filled:
+			self._set_status(trade, OrderStatus.PreSubmitted)
+			self.openOrderEvent.emit(trade)
+			return
+
+		if trade.contract.secType == "BAG":
+			self._combos[trade.order.orderId] = trade
+			self._set_status(trade, OrderStatus.Submitted)
+			self.openOrderEvent.emit(trade)
+			self._defer(self._match_combos, trade.contract.symbol, delay=self.fill_latency)
+			return
+
+		self._working[trade.contract.conId][trade.order.orderId] = trade
+		self._set_status(trade, OrderStatus.Submitted)
+		self.openOrderEvent.emit(trade)
+		self._defer(self._match, [trade.contract.conId], delay=self.fill_latency)
+
+	def _match(self, conIds:list) -> None:
+		"""
+		Fills every working order whose condition is met at the current quote\n
+		"""
+		conIds = [conId for conId in conIds if self._working.get(conId)]
+		if not conIds or not self.fill:
+			return
+		quotes = self.market.quotes([self._contracts[conId] for conId in conIds])
+		for conId, (bid, ask, last) in zip(conIds, quotes):
+			for trade in list(self._working[conId].values()):
+				price = self._fill_price(trade, bid, ask)
+				if price is not None:
+					self._fill(trade, price)
+
+	def _fill_price(self, trade:Trade, bid:float, ask:float):
+		order = trade.order
+		buy = order.action.upper() == "BUY"
+		touch = ask + self.slippage if buy else bid - self.slippage
+		kind = order.orderType.upper()
+
+		if kind == "MKT":
+			return touch
+		if kind == "LMT":
+			if buy and ask <= order.lmtPrice or not buy and bid >= order.lmtPrice:
+				return min(order.lmtPrice, touch) if buy else max(order.lmtPrice, touch)
+			return None
+		if kind == "STP":
+			triggered = ask >= order.auxPrice if buy else bid <= order.auxPrice
+			return touch if triggered else None
+		if kind == "TRAIL":
+			mid = (bid + ask) / 2
+			mark = self._trail.get(order.orderId, mid)
+			mark = min(mark, mid) if buy else max(mark, mid)
+			self._trail[order.orderId] = mark
+			if order.trailingPercent != UNSET_DOUBLE:
+				offset = mark * order.trailingPercent / 100
+			else:
+				offset = order.auxPrice
+			order.trailStopPrice = mark + offset if buy else mark - offset
+			triggered = mid >= order.trailStopPrice if buy else mid <= order.trailStopPrice
+			return touch if triggered else None
+		return None
+
+	def _fill(self, trade:Trade, price:float) -> None:
+		order, status = trade.order, trade.orderStatus
+		qty = status.remaining if not self.max_fill_qty else min(status.remaining, self.max_fill_qty)
+		buy = order.action.upper() == "BUY"
+
+		cum = status.filled + qty
+		avg = (status.avgFillPrice * status.filled + price * qty) / cum
+		status.filled, status.remaining = cum, status.remaining - qty
+		status.avgFillPrice, status.lastFillPrice = avg, price
+		self._execute(trade, trade.contract, buy, qty, price, cum, avg)
+
+		if status.remaining > 0:
+			self._set_status(trade, OrderStatus.Submitted)
+			self._defer(self._match, [trade.contract.conId], delay=self.fill_latency)
+			return
+
+		self._working[trade.contract.conId].pop(order.orderId, None)
+		self._trail.pop(order.orderId, None)
+		self._set_status(trade, OrderStatus.Filled)
+		trade.filledEvent.emit(trade)
+		for child in self._children(order.orderId):
+			if child.orderStatus.status == OrderStatus.PreSubmitted:
+				self._submit(child)
+
+	def _execute(self, trade:Trade, contract:Contract, buy:bool, qty:float, price:float, cum:float, avg:float) -> None:
+		now = self._now()
+		order = trade.order
+		execution = Execution(
+			execId=f"{next(self._exec_ids):08d}.01", time=now, acctNumber=self.account,
+			exchange=contract.exchange or "SMART", side="BOT" if buy else "SLD", shares=qty, price=price,
+			permId=order.permId, clientId=order.clientId, orderId=order.orderId, cumQty=cum, avgPrice=avg,
+		)
+		report = CommissionReport(execId=execution.execId, commission=self.commission * qty, currency="USD")
+		fill = Fill(contract, execution, report, now)
+		trade.fills.append(fill)
+		self._update_position(contract, qty if buy else -qty, price)
+
+		trade.fillEvent.emit(trade, fill)
+		self.execDetailsEvent.emit(trade, fill)
+		trade.commissionReportEvent.emit(trade, fill, report)
+		self.commissionReportEvent.emit(trade, fill, report)
+
+	# Combos
+
+	def _resolve_combo(self, bag:Contract):
+		"""
+		Returns the bag when every leg is a listed contract, or None\n
+		"""
+		if not bag.comboLegs or any(leg.conId not in self._contracts for leg in bag.comboLegs):
+			return None
+		return bag
+
+	def _match_combos(self, symbol:str=None) -> None:
+		"""
+		Fills working combos whose net price at the legs' touch meets the order\n
+		"""
+		if not self.fill:
+			return
+		for trade in list(self._combos.values()):
+			if symbol is not None and trade.contract.symbol != symbol:
+				continue
+			order, legs = trade.order, trade.contract.comboLegs
+			buy = order.action.upper() == "BUY"
+			quotes = self.market.quotes([self._contracts[leg.conId] for leg in legs])
+			sides = [(leg.action.upper() == "BUY") == buy for leg in legs]
+			prices = [ask + self.slippage if side else bid - self.slippage for side, (bid, ask, last) in zip(sides, quotes)]
+			net = sum(p * leg.ratio * (1 if leg.action.upper() == "BUY" else -1) for p, leg in zip(prices, legs))
+
+			kind = order.orderType.upper()
+			if kind == "LMT" and (net > order.lmtPrice if buy else net < order.lmtPrice):
+				continue
+			if kind not in ("MKT", "LMT"):
+				continue
+			self._fill_combo(trade, sides, prices, net)
+
+	def _fill_combo(self, trade:Trade, sides:list, prices:list, net:float) -> None:
+		order, status = trade.order, trade.orderStatus
+		qty = status.remaining
+		for leg, side, price in zip(trade.contract.comboLegs, sides, prices):
+			shares = qty * leg.ratio
+			self._execute(trade, self._contracts[leg.conId], side, shares, price, shares, price)
+
+		status.filled, status.remaining = status.filled + qty, 0
+		status.avgFillPrice = status.lastFillPrice = net
+		self._combos.pop(order.orderId, None)
+		self._set_status(trade, OrderStatus.Filled)
+		trade.filledEvent.emit(trade)
+
+	def _children(self, orderId:int) -> list:
+		children = (self._trades[i] for i in self._child_ids.get(orderId, ()))
+		return [t for t in children if not t.isDone()]
+
+	def _update_position(self, contract:Contract, qty:float, price:float) -> None:
+		multiplier = float(contract.multiplier or 1)
+		pos = self._positions.get(contract.conId)
+		held, cost = (pos.position, pos.avgCost) if pos else (0.0, 0.0)
+		new = held + qty
+		if new == 0:
+			cost = 0.0
+		elif held == 0 or (new > 0) != (held > 0):
+			cost = price * multiplier
+		elif (qty > 0) == (held > 0):
+			cost = (cost * held + price * multiplier * qty) / new
+		if held and (qty > 0) != (held > 0):
+			closed = min(abs(qty), abs(held)) * (1 if held > 0 else -1)
+			self._realized[contract.conId] = self._realized.get(contract.conId, 0.0) + closed * (price * multiplier - pos.avgCost)
+		position = Position(self.account, contract, new, cost)
+		self._positions[contract.conId] = position
+		self.cash -= qty * price * multiplier
+
+		self.positionEvent.emit(position)
+		self.accountValueEvent.emit(AccountValue(self.account, "AvailableFunds", str(self.cash), "USD", ""))
+		self._mark([contract.conId])
+
+	def cancelOrder(self, order:Order):
+		trade = self._trades.get(order.orderId)
+		if trade is None or trade.isDone():
+			return trade
+		trade.cancelEvent.emit(trade)
+		self.cancelOrderEvent.emit(trade)
+		self._defer(self._cancel, trade)
+		return trade
+
+	def _cancel(self, trade:Trade) -> None:
+		if trade.isDone():
+			return
+		self._held.pop(trade.order.orderId, None)
+		self._combos.pop(trade.order.orderId, None)
+		self._working.get(trade.contract.conId, {}).pop(trade.order.orderId, None)
+		self._trail.pop(trade.order.orderId, None)
+		self._set_status(trade, OrderStatus.Cancelled)
+		for child in self._children(trade.order.orderId):
+			self._cancel(child)
+
+	# Queries
+
+	def trades(self) -> list:
+		return list(self._trades.values())
+
+	def openTrades(self) -> list:
+		return [t for t in self._trades.values() if not t.isDone()]
+
+	def orders(self) -> list:
+		return [t.order for t in self._trades.values()]
+
+	def openOrders(self) -> list:
+		return [t.order for t in self.openTrades()]
+
+	def reqOpenOrders(self) -> list:
+		return self.openOrders()
+
+	def reqAllOpenOrders(self) -> list:
+		return self.openOrders()
+
+	def reqCompletedOrders(self, apiOnly:bool) -> list:
+		return [t for t in self._trades.values() if t.isDone()]
+
+	async def reqCompletedOrdersAsync(self, apiOnly:bool) -> list:
+		return self.reqCompletedOrders(apiOnly)
+
+	def fills(self) -> list:
+		return [f for t in self._trades.values() for f in t.fills]
+
+	def executions(self) -> list:
+		return [f.execution for f in self.fills()]
+
+	def positions(self, account:str='') -> list:
+		return [p for p in self._positions.values() if p.position]
+
+	def accountValues(self, account:str='') -> list:
+		return [
+			AccountValue(self.account, "AvailableFunds", str(self.cash), "USD", ""),
+			AccountValue(self.account, "NetLiquidation", str(self.cash), "USD", ""),
+		]
+
+	def accountSummary(self, account:str='') -> list:
+		return self.accountValues(account)
+
+	async def accountSummaryAsync(self, account:str='') -> list:
+		return self.accountSummary(account)
+
+	def managedAccounts(self) -> list:
+		return [self.account]
+
+	# P&L
+
+	def reqPnL(self, account:str, modelCode:str='') -> PnL:
+		self._pnl = PnL(account, modelCode)
+		self._mark_account()
+		return self._pnl
+
+	def cancelPnL(self, account:str, modelCode:str='') -> None:
+		self._pnl = None
+
+	def reqPnLSingle(self, account:str, modelCode:str, conId:int) -> PnLSingle:
+		pnl = self._pnl_single[conId] = PnLSingle(account, modelCode, conId)
+		self._mark([conId])
+		return pnl
+
+	def cancelPnLSingle(self, account:str, modelCode:str, conId:int) -> None:
+		self._pnl_single.pop(conId, None)
+
+	def _mark(self, conIds:list) -> None:
+		# Positions marked at mid, like TWS's P&L stream but on every price change
+		conIds = [conId for conId in conIds if conId in self._pnl_single]
+		if not conIds:
+			return
+		positions = [self._positions.get(conId) for conId in conIds]
+		held = [p for p in positions if p is not None and p.position]
+		marks = dict(zip((p.contract.conId for p in held), self.market.quotes([p.contract for p in held]))) if held else {}
+		for conId, position in zip(conIds, positions):
+			pnl = self._pnl_single[conId]
+			pnl.realizedPnL = float(self._realized.get(conId, 0.0))
+			pnl.position = position.position if position is not None else 0
+			if conId in marks:
+				bid, ask, last = marks[conId]
+				pnl.value = float(position.position * (bid + ask) / 2 * float(position.contract.multiplier or 1))
+				pnl.unrealizedPnL = float(pnl.value - position.position * position.avgCost)
+			else:
+				pnl.value = pnl.unrealizedPnL = 0.0
+			pnl.dailyPnL = pnl.unrealizedPnL + pnl.realizedPnL
+			self.pnlSingleEvent.emit(pnl)
+		self._mark_account()
+
+	def _mark_account(self) -> None:
+		if self._pnl is not None:
+			singles = self._pnl_single.values()
+			self._pnl.unrealizedPnL = sum((p.unrealizedPnL for p in singles if p.unrealizedPnL == p.unrealizedPnL), 0.0)
+			self._pnl.realizedPnL = float(sum(self._realized.values(), 0.0))
+			self._pnl.dailyPnL = self._pnl.unrealizedPnL + self._pnl.realizedPnL
+			self.pnlEvent.emit(self._pnl)